@@ -0,0 +1,649 @@
+# Bottom-up evaluation of function-free Logikus programs, which
+# materializes every derived relation with semi-naive iteration.
+from engine import *
+
+class Relation:
+    """A Relation holds the ground facts of one predicate as tuples of
+    terms, without duplicates and in the order they were added. It
+    builds a hash index on a set of argument positions the first time
+    a lookup binds those positions, and keeps the index up to date as
+    facts arrive.
+    """
+    def __init__(self):
+        """Create an empty relation.
+        """
+        self.rows = {}
+        self.indexes = {}
+
+    def add(self, terms, keys):
+        """Adds a fact to this relation, unless it already holds it.
+
+        Args:
+            terms (tuple): the terms of the fact
+            keys (tuple): the keys of the terms
+
+        Returns:
+            boolean: True if the fact is new
+        """
+        if keys in self.rows:
+            return False
+        self.rows[keys] = terms
+        for positions, index in self.indexes.items():
+            index.setdefault(tuple(keys[i] for i in positions), []).append(terms)
+        return True
+
+    def lookup(self, positions, keys):
+        """Returns the facts whose terms at the given positions have
+        the given keys.
+
+        Args:
+            positions (tuple): the bound argument positions
+            keys (tuple): the keys of the bound arguments
+
+        Returns:
+            tuple[]: the terms of the matching facts
+        """
+        if len(positions) == 0:
+            return list(self.rows.values())
+        index = self.indexes.get(positions)
+        if index == None:
+            index = self.indexes[positions] = {}
+            for k, terms in self.rows.items():
+                index.setdefault(tuple(k[i] for i in positions), []).append(terms)
+        return index.get(keys, ())
+
+    def __len__(self):
+        """Returns the number of facts in this relation.
+
+        Returns:
+            int: the number of facts
+        """
+        return len(self.rows)
+
+class Datalog:
+    """A Datalog evaluator materializes every relation of a program
+    bottom-up. The ground facts of the program seed the relations,
+    and the rules then run stratum by stratum, in an order in which
+    every negated predicate is complete before it is used. Within a
+    stratum, the rules that do not depend on the stratum run once,
+    and the others run in rounds. Each round matches one body
+    structure at a time against only the facts that the previous
+    round derived, so a fact is never derived twice from the same
+    premises.
+
+    The evaluator is an axiom source: a Query or a Solver against it
+    answers each structure from the materialized relations by index
+    lookup.
+
+    Given the goals of a query, the evaluator first rewrites the
+    program with MagicSets, so that it derives only the facts the goals
+    demand. The relations of the goals' predicates then hold only the
+    answers to those goals.
+
+    The program must be function free: rules may hold structures,
+    comparisons, evaluations and negations, whose terms are variables
+    or ground, and every variable in a rule's head, a comparison or a
+    negation must also occur in a structure of its body.
+    """
+    def __init__(self, program, goals=None, magic=True):
+        """Create an evaluator for the given program and materialize
+        its relations.
+
+        Args:
+            program (Program): the program to evaluate
+            goals (Rule, Structure or Structure[], optional): the
+                goals to derive facts for. Defaults to None, for all
+                facts.
+            magic (boolean, optional): whether to rewrite the program
+                for the goals. Defaults to True.
+        """
+        if goals != None and magic:
+            program = MagicSets.rewrite(program, goals)
+        self.program = program
+        self.relations = {}
+        self.rounds = 0
+        self.derivations = 0
+        self.trail = Trail()
+        self.evaluate()
+
+    def evaluate(self):
+        """Materializes the relations of the program.
+        """
+        rules = []
+        for p in self.program.predicates():
+            key = (p.functor, p.arity)
+            relation = self.relations.setdefault(key, Relation())
+            for a in p.clauses:
+                if Predicate.isGroundFact(a):
+                    terms = tuple(a.head().terms)
+                    relation.add(terms, tuple(HashJoin.key(t) for t in terms))
+                else:
+                    rules.append(a)
+        strata = self.strata(rules)
+        for stratum in sorted(set(strata.values())):
+            stratumRules = [r for r in rules if strata[Datalog.predicateKey(r.head())] == stratum]
+            self.evaluateStratum(stratumRules,
+                set(Datalog.predicateKey(r.head()) for r in stratumRules))
+
+    @classmethod
+    def predicateKey(cls, s):
+        """Returns the functor and arity of a structure.
+
+        Args:
+            s (Structure): the structure
+
+        Returns:
+            tuple: the functor and arity
+        """
+        return (s.functor, s.arity())
+
+    def strata(self, rules):
+        """Numbers the predicates of the program so that a rule's head
+        has at least the number of each structure in its body, and a
+        greater number than each structure that it negates.
+
+        Args:
+            rules (Rule[]): the rules of the program
+
+        Returns:
+            dict: the stratum of each predicate, by functor and arity
+        """
+        strata = {k: 0 for k in self.relations}
+        limit = len(strata)
+        changed = True
+        while changed:
+            changed = False
+            for r in rules:
+                h = Datalog.predicateKey(r.head())
+                for s in r.structures[1:]:
+                    k = Datalog.predicateKey(s)
+                    if isinstance(s, Not):
+                        least = strata.get(k, 0) + 1
+                    elif isinstance(s, (Gateway, ArithmeticOperator)):
+                        continue
+                    else:
+                        least = strata.get(k, 0)
+                    if strata[h] < least:
+                        if least > limit:
+                            raise Exception(f"Negation through recursion in {r}")
+                        strata[h] = least
+                        changed = True
+        return strata
+
+    def evaluateStratum(self, rules, predicates):
+        """Runs the rules of one stratum to a fixpoint.
+
+        Args:
+            rules (Rule[]): the rules whose heads are in the stratum
+            predicates (set): the predicates those rules derive
+        """
+        delta = {}
+        for k in predicates:
+            delta[k] = Relation()
+            for keys, terms in self.relations[k].rows.items():
+                delta[k].add(terms, keys)
+        recursive = []
+        for r in rules:
+            positions = [i for i in range(1, len(r.structures))
+                if Datalog.predicateKey(r.structures[i]) in predicates
+                and not isinstance(r.structures[i], (Gateway, Not))]
+            if len(positions) == 0:
+                self.evaluateRule(r, None, None, delta)
+            else:
+                recursive.append((r, positions))
+        while any(len(d) > 0 for d in delta.values()):
+            self.rounds += 1
+            derived = {k: Relation() for k in predicates}
+            for r, positions in recursive:
+                for i in positions:
+                    self.evaluateRule(r, i, delta, derived)
+            delta = derived
+
+    def evaluateRule(self, rule, deltaPosition, delta, derived):
+        """Derives the heads of a rule for every way its body matches
+        the relations, adding each new fact to its relation and to
+        the derived facts.
+
+        Args:
+            rule (Rule): the rule
+            deltaPosition (int): the position of the body structure
+                to match against delta, or None
+            delta (dict): the facts the last round derived, by
+                predicate
+            derived (dict): where to add the new facts, by predicate
+        """
+        dr = rule.dynamicAxiom(self, self.trail)
+        structures = dr.structures
+        order = self.order(structures, deltaPosition)
+        head = structures[0]
+        relation = self.relations[Datalog.predicateKey(head)]
+        out = derived[Datalog.predicateKey(head)]
+        for _ in self.solutions(structures, order, 0, deltaPosition, delta):
+            terms = []
+            for t in head.terms:
+                while isinstance(t, Variable) and t.instantiation != None:
+                    t = t.instantiation
+                if not HashJoin.isGround(t):
+                    raise Exception(f"Rule is not range restricted: {rule}")
+                terms.append(t)
+            self.derivations += 1
+            terms = tuple(terms)
+            keys = tuple(HashJoin.key(t) for t in terms)
+            if relation.add(terms, keys):
+                out.add(terms, keys)
+
+    def order(self, structures, deltaPosition):
+        """Orders the body of a renamed rule for evaluation: the delta
+        structure first, then each gateway or negation as soon as its
+        variables are bound, and the other structures as written.
+
+        Args:
+            structures (Structure[]): the renamed rule
+            deltaPosition (int): the position of the delta structure,
+                or None
+
+        Returns:
+            int[]: the positions of the body structures, in order
+        """
+        remaining = list(range(1, len(structures)))
+        order = []
+        bound = set()
+        if deltaPosition != None:
+            remaining.remove(deltaPosition)
+            order.append(deltaPosition)
+            bound |= Datalog.variableIds(structures[deltaPosition])
+        while len(remaining) > 0:
+            ready = None
+            for i in remaining:
+                s = structures[i]
+                if isinstance(s, Evaluation):
+                    needed = Datalog.variableIds(s.term1)
+                elif isinstance(s, (Gateway, Not)):
+                    needed = Datalog.variableIds(s)
+                else:
+                    continue
+                if needed <= bound:
+                    ready = i
+                    break
+            if ready == None:
+                ready = next((i for i in remaining if not isinstance(structures[i], (Gateway, Not))), None)
+            if ready == None:
+                raise Exception(f"Unbound variables in {structures[remaining[0]]}")
+            s = structures[ready]
+            if isinstance(s, (Cut, ConsultingOnce, Write)):
+                raise Exception(f"Bottom-up evaluation does not support {s}")
+            remaining.remove(ready)
+            order.append(ready)
+            bound |= Datalog.variableIds(s)
+        return order
+
+    @classmethod
+    def variableIds(cls, t):
+        """Returns the ids of the unbound variables in a term.
+
+        Args:
+            t (Term): the term
+
+        Returns:
+            set: the ids of the variables
+        """
+        ids = set()
+        terms = [t]
+        while len(terms) > 0:
+            t = terms.pop()
+            while isinstance(t, Variable) and t.instantiation != None:
+                t = t.instantiation
+            if isinstance(t, Anonymous):
+                continue
+            if isinstance(t, Variable):
+                ids.add(t.id)
+            else:
+                terms.extend(t.terms)
+        return ids
+
+    def solutions(self, structures, order, k, deltaPosition, delta):
+        """Yields once for each way the body structures, from the k-th
+        in the given order on, match the relations, with the rule's
+        variables bound accordingly.
+
+        Args:
+            structures (Structure[]): the renamed rule
+            order (int[]): the order of the body structures
+            k (int): how many structures of the order are matched
+            deltaPosition (int): the position of the delta structure,
+                or None
+            delta (dict): the facts the last round derived
+
+        Yields:
+            None: once per match
+        """
+        if k == len(order):
+            yield None
+            return
+        i = order[k]
+        s = structures[i]
+        mark = self.trail.mark()
+        if isinstance(s, ConsultingNot):
+            if not self.matches(s.consultingStructure, self.relations):
+                yield from self.solutions(structures, order, k + 1, deltaPosition, delta)
+        elif isinstance(s, Gateway):
+            if s.canProveOnce():
+                yield from self.solutions(structures, order, k + 1, deltaPosition, delta)
+            self.trail.undo(mark)
+        else:
+            relations = delta if i == deltaPosition else self.relations
+            for terms in self.matches(s, relations):
+                ok = True
+                for t, value in zip(s.terms, terms):
+                    if t.unify(value, self.trail) == None:
+                        ok = False
+                        break
+                if ok:
+                    yield from self.solutions(structures, order, k + 1, deltaPosition, delta)
+                self.trail.undo(mark)
+
+    def matches(self, s, relations):
+        """Returns the facts of a relation that agree with the ground
+        terms of a structure.
+
+        Args:
+            s (Structure): the structure
+            relations (dict): the relations, by predicate
+
+        Returns:
+            tuple[]: the terms of the matching facts
+        """
+        relation = relations.get(Datalog.predicateKey(s))
+        if relation == None:
+            return ()
+        positions = []
+        keys = []
+        for i, t in enumerate(s.terms):
+            while isinstance(t, Variable) and t.instantiation != None:
+                t = t.instantiation
+            if isinstance(t, Variable):
+                continue
+            if not HashJoin.isGround(t):
+                raise Exception(f"Bottom-up evaluation needs variables or ground terms: {s}")
+            positions.append(i)
+            keys.append(HashJoin.key(t))
+        return relation.lookup(tuple(positions), tuple(keys))
+
+    @classmethod
+    def fact(cls, functor, terms):
+        """Returns a fact with the given ground terms.
+
+        Args:
+            functor (Object): the functor of the fact
+            terms (Term[]): the ground terms
+
+        Returns:
+            Fact: the fact
+        """
+        facts = []
+        for t in terms:
+            if isinstance(t, Fact):
+                facts.append(t)
+            else:
+                facts.append(cls.fact(t.functor, t.terms))
+        if len(facts) == 0:
+            return Fact(functor)
+        return Fact(functor, facts)
+
+    def axioms(self, *args):
+        """Returns the materialized facts, or the facts that agree
+        with the ground terms of a structure.
+
+        Args:
+            args = (): all the facts
+            args = structure: the facts that may unify with the
+                structure
+
+        Returns:
+            Axiom[]: an enumeration of facts
+        """
+        if len(args) == 0 or args[0] == None:
+            return (Datalog.fact(k[0], terms) for k, r in self.relations.items()
+                for terms in r.rows.values())
+        s = args[0]
+        return (Datalog.fact(s.functor, terms) for terms in self.matches(s, self.relations))
+
+    @classmethod
+    def compare(cls, program, goals):
+        """Returns the work that proving the given goals takes top
+        down, and bottom up with and without rewriting the program for
+        them. Top down, the goals' predicates must be tabled or must
+        not recurse on the left, or the proof never ends.
+
+        Args:
+            program (Program): the program
+            goals (Rule, Structure or Structure[]): the goals
+
+        Returns:
+            dict: the inferences of a Solver, keyed by "top-down", and
+                the derivations of an evaluator, keyed by "bottom-up"
+                and "magic"
+        """
+        work = {
+            "bottom-up": cls(program).derivations,
+            "magic": cls(program, goals).derivations,
+        }
+        solver = Solver(program, goals)
+        while solver.canFindNextProof():
+            pass
+        work["top-down"] = solver.inferences
+        return work
+
+    def statistics(self):
+        """Returns the number of rounds and derivations the evaluation
+        took, and the number of facts in the relations.
+
+        Returns:
+            dict: the statistics, keyed by "rounds", "derivations"
+                and "facts"
+        """
+        return {
+            "rounds": self.rounds,
+            "derivations": self.derivations,
+            "facts": sum(len(r) for r in self.relations.values()),
+        }
+
+class MagicSets:
+    """MagicSets rewrites a program for the goals of one query, so
+    that bottom-up evaluation derives only facts that the goals
+    demand.
+
+    Each derived predicate that a goal reaches gets a copy for every
+    adornment it is called with. An adornment marks each argument
+    bound (b) or free (f), and the copy of path/2 called with a bound
+    first argument is path@bf/2. A magic predicate, magic@path@bf/1,
+    holds the bound arguments of the calls. Each clause of the copy
+    starts with its magic structure, and each derived structure in
+    its body gets a magic rule that passes down the bindings of the
+    head and of the structures before it. The constants of the goals
+    seed the magic predicates, and a rule per goal maps the copy back
+    to the goal's predicate, which then holds only the answers to the
+    goals.
+
+    A predicate that a rule negates, and whatever it calls, keeps its
+    clauses as they are, as negation needs the complete relation.
+    """
+    @classmethod
+    def rewrite(cls, program, goals):
+        """Returns a program that derives the answers to the given
+        goals from the clauses of the given program.
+
+        Args:
+            program (Program): the program to rewrite
+            goals (Rule, Structure or Structure[]): the goals
+
+        Returns:
+            Program: the rewritten program
+        """
+        if isinstance(goals, Rule):
+            goals = goals.structures
+        elif isinstance(goals, Structure):
+            goals = [goals]
+        rewritten = Program()
+        for p in program.predicates():
+            if not cls.isDerived(p):
+                for a in p.clauses:
+                    rewritten.addAxiom(a)
+        pending = []
+        seen = set()
+        full = []
+        for g in goals:
+            if isinstance(g, (Gateway, Once)):
+                continue
+            if isinstance(g, Not):
+                full.append((g.functor, g.arity()))
+                continue
+            if not cls.isDerived(program.predicate(g.functor, g.arity())):
+                continue
+            adornment = "".join("b" if HashJoin.isGround(t) else "f" for t in g.terms)
+            rewritten.addAxiom(Rule([Structure(
+                cls.magicFunctor(g.functor, adornment), cls.boundTerms(g.terms, adornment))]))
+            terms = [Variable(f"X{i}") for i in range(g.arity())]
+            rewritten.addAxiom(Rule([Structure(g.functor, terms),
+                Structure(cls.adornedFunctor(g.functor, adornment), terms)]))
+            if (g.functor, g.arity(), adornment) not in seen:
+                seen.add((g.functor, g.arity(), adornment))
+                pending.append((g.functor, g.arity(), adornment))
+        while len(pending) > 0:
+            functor, arity, adornment = pending.pop()
+            for a in program.predicate(functor, arity).clauses:
+                for r in cls.rewriteClause(program, a, adornment, pending, seen, full):
+                    rewritten.addAxiom(r)
+        kept = set()
+        while len(full) > 0:
+            key = full.pop()
+            p = program.predicate(*key)
+            if key in kept or not cls.isDerived(p):
+                continue
+            kept.add(key)
+            for a in p.clauses:
+                rewritten.addAxiom(a)
+                if isinstance(a, Rule):
+                    full.extend((s.functor, s.arity()) for s in a.structures[1:]
+                        if not isinstance(s, Gateway))
+        return rewritten
+
+    @classmethod
+    def rewriteClause(cls, program, a, adornment, pending, seen, full):
+        """Returns the adorned copy of a clause, and the magic rules
+        of the derived structures in its body.
+
+        Args:
+            program (Program): the program being rewritten
+            a (Axiom): the clause
+            adornment (str): the adornment of the clause's head
+            pending (list): the adorned predicates left to rewrite
+            seen (set): the adorned predicates reached so far
+            full (list): the predicates to keep as they are
+
+        Returns:
+            Rule[]: the rewritten rules
+        """
+        structures = a.structures if isinstance(a, Rule) else [a]
+        head = structures[0]
+        bound = set()
+        for t in cls.boundTerms(head.terms, adornment):
+            bound |= cls.variableNames(t)
+        body = [Structure(cls.magicFunctor(head.functor, adornment),
+            cls.boundTerms(head.terms, adornment))]
+        rules = []
+        for s in structures[1:]:
+            if isinstance(s, Not):
+                full.append((s.functor, s.arity()))
+            elif not isinstance(s, (Gateway, Once)) and cls.isDerived(
+                    program.predicate(s.functor, s.arity())):
+                sAdornment = "".join("b" if not isinstance(t, Anonymous)
+                    and cls.variableNames(t) <= bound else "f" for t in s.terms)
+                magic = Structure(cls.magicFunctor(s.functor, sAdornment),
+                    cls.boundTerms(s.terms, sAdornment))
+                if len(body) > 1 or str(magic) != str(body[0]):
+                    rules.append(Rule([magic] + body))
+                key = (s.functor, s.arity(), sAdornment)
+                if key not in seen:
+                    seen.add(key)
+                    pending.append(key)
+                s = Structure(cls.adornedFunctor(s.functor, sAdornment), s.terms)
+            body.append(s)
+            bound |= cls.variableNames(s)
+        rules.append(Rule([Structure(cls.adornedFunctor(head.functor, adornment), head.terms)] + body))
+        return rules
+
+    @classmethod
+    def isDerived(cls, p):
+        """Returns true if a predicate has clauses other than ground
+        facts.
+
+        Args:
+            p (Predicate): the predicate, or None
+
+        Returns:
+            boolean: True if rules derive the predicate
+        """
+        return p != None and any(not Predicate.isGroundFact(a) for a in p.clauses)
+
+    @classmethod
+    def adornedFunctor(cls, functor, adornment):
+        """Returns the functor of a predicate's copy for an adornment.
+
+        Args:
+            functor (str): the functor of the predicate
+            adornment (str): the adornment
+
+        Returns:
+            str: the functor of the copy
+        """
+        return f"{functor}@{adornment}"
+
+    @classmethod
+    def magicFunctor(cls, functor, adornment):
+        """Returns the functor of the magic predicate of a predicate's
+        copy for an adornment.
+
+        Args:
+            functor (str): the functor of the predicate
+            adornment (str): the adornment
+
+        Returns:
+            str: the functor of the magic predicate
+        """
+        return f"magic@{functor}@{adornment}"
+
+    @classmethod
+    def boundTerms(cls, terms, adornment):
+        """Returns the terms an adornment marks as bound.
+
+        Args:
+            terms (Term[]): the terms
+            adornment (str): the adornment
+
+        Returns:
+            Term[]: the bound terms
+        """
+        return [t for t, b in zip(terms, adornment) if b == "b"]
+
+    @classmethod
+    def variableNames(cls, t):
+        """Returns the names of the variables in a term.
+
+        Args:
+            t (Term): the term
+
+        Returns:
+            set: the names of the variables
+        """
+        names = set()
+        terms = [t]
+        while len(terms) > 0:
+            t = terms.pop()
+            if isinstance(t, Anonymous):
+                continue
+            if isinstance(t, Variable):
+                names.add(t.name)
+            else:
+                terms.extend(t.terms)
+        return names
@@ -8,29 +8,28 @@
 # Steve Metsker makes no representations or warranties about
 # the fitness of this software for any particular purpose, 
 # including the implied warranty of merchantability.
+from array import array
 import copy
 from collections import defaultdict
-import time
+import csv
+import hashlib
+import heapq
+import itertools
+import json
+import mmap
+import os
+import pickle
+import re
+import struct
+import sys
+import threading
 
 class Unification():
-    """Structures and variables use unifications to keep track of the 
-    variable assignments that make a proof work. The unification 
-    class itself provides behavior for adding and accessing 
-    variables. 
+    """A unification is a collection of variables, such as the 
+    variables of a structure or of a query. The unification class 
+    itself provides behavior for adding and accessing variables. 
+    Proofs record the variable assignments they make on a Trail.
     """
-    empty = None
-    def __new__(cls, *args, **kargs):
-        """define class instance variable emtpy.
-
-        Returns:
-            Unification: this class
-        """        
-
-        if cls.empty == None:
-            cls.empty = super(Unification, cls).__new__(cls)
-            cls.empty._variables = []
-        return super(Unification, cls).__new__(cls)
-
     def __init__(self, v = None):
         """Creates an empty unification.
 
@@ -92,6 +91,85 @@ class Unification():
                 buf += ", "
             buf += self._variables[i].definitionString()
         return buf
+
+class Trail:
+    """A trail records the variables that a proof binds, in the order
+    it binds them. A query keeps a single trail for all of its 
+    structures. Before it tries an alternative, a structure takes a 
+    mark of the trail, and it undoes the bindings made since that 
+    mark when it backtracks.
+
+    A Solver sets the boundary of its trail to the id of the first
+    variable created after its newest choicepoint. Variables created
+    since then cannot outlive a backtrack to that choicepoint, so the
+    trail does not record their bindings. Without a boundary, the 
+    trail records every binding.
+    """
+    def __init__(self):
+        """Creates an empty trail.
+        """
+        self._bound = []
+        self.boundary = None
+
+    def bind(self, v, term):
+        """Instantiates a variable and records the binding.
+
+        Args:
+            v (Variable): the variable to bind
+            term (Term): the instantiation of the variable
+        """
+        v.instantiation = term
+        if self.boundary == None or v.id < self.boundary:
+            self._bound.append(v)
+
+    def mark(self):
+        """Returns a mark of the current end of this trail.
+
+        Returns:
+            int: a mark to undo back to
+        """
+        return len(self._bound)
+
+    def undo(self, mark):
+        """Unbinds the variables bound since the given mark.
+
+        Args:
+            mark (int): a mark taken from this trail
+        """
+        bound = self._bound
+        while len(bound) > mark:
+            bound.pop().instantiation = None
+
+    def tidy(self, mark):
+        """Drops the bindings recorded since the given mark of 
+        variables that are no older than the boundary. A solver tidies
+        its trail after a cut removes the choicepoints that needed 
+        them.
+
+        Args:
+            mark (int): a mark taken from this trail
+        """
+        if self.boundary == None:
+            return
+        bound = self._bound
+        kept = [v for v in bound[mark:] if v.id < self.boundary]
+        del bound[mark:]
+        bound.extend(kept)
+
+    def variables(self, mark=0):
+        """Returns the variables bound since the given mark.
+
+        Args:
+            mark (int, optional): a mark taken from this trail. 
+                Defaults to 0.
+
+        Returns:
+            Unification: the variables bound since the mark
+        """
+        u = Unification()
+        for v in self._bound[mark:]:
+            u.addVariable(v)
+        return u
     
 class Variable:
     """A variable is a named term that can unify with  other terms.
@@ -102,6 +180,8 @@ class Variable:
             variable, or a structure. 
         id: unique id of variable.
     """    
+    _ids = itertools.count()
+
     def __init__(self, name):
         """Create a variable with the given name.
 
@@ -110,9 +190,19 @@ class Variable:
         """        
         self.name = name
         self.instantiation = None
-        self.id = f"{name}_{str(time.time())}"
+        self.id = next(Variable._ids)
+
+    def __setstate__(self, state):
+        """Restores an unpickled variable with a new id, since ids
+        order the variables of one process only.
 
-    def unify(self, s):
+        Args:
+            state (dict): the pickled attributes of the variable
+        """
+        self.__dict__.update(state)
+        self.id = next(Variable._ids)
+
+    def unify(self, s, trail=None):
         """Unifies argument s.
         s: Structure
             Instantiates this variable with the supplied structure, or
@@ -127,42 +217,35 @@ class Variable:
 
         Args:
             s (Structure|Variable|Term): structure or variable or term to unify with.
+            trail (Trail, optional): the trail to record bindings on.
+                Defaults to a new trail.
 
         Returns:
-            s: Structure
-                a unification. If this variable is already
-                instantiated, the unification is the result of
-                unifying with the input structure. Otherwise, the
-                result is a new unification containing just this
-                variable, instantiated to the input structure.
-            s: Variable
-                the sum of the variables that bind to values to make
-                the unification work; Returns null if the 
-                unification fails.
-            s: Term
-                he sum of the variables that bind to values to make
-                the unification work; Returns null if the 
-                unification fails.
+            Trail: the trail that records the bindings that make the
+                unification work; Returns None if the unification 
+                fails.
         """        
         structureCls = globals()['Structure']
+        if trail == None:
+            trail = Trail()
         if isinstance(s, Variable):
             v = s
             if self is v:
-                return Unification()
+                return trail
             elif self.instantiation != None:
-                return self.instantiation.unify(v)
+                return self.instantiation.unify(v, trail)
             elif v.instantiation != None:
-                return v.instantiation.unify(self)
-            self.instantiation = v
-            return Unification(self)
+                return v.instantiation.unify(self, trail)
+            trail.bind(self, v)
+            return trail
         elif isinstance(s, structureCls):
             if self.instantiation != None:
-                return self.instantiation.unify(s)
-            self.instantiation = s
-            return Unification(self)
+                return self.instantiation.unify(s, trail)
+            trail.bind(self, s)
+            return trail
         else: # Term
             t = s
-            return t.unify(self)
+            return t.unify(self, trail)
         
     def __eq__(self, o):
         """Returns true if the supplied object is an equivalent 
@@ -189,7 +272,7 @@ class Variable:
         """Retern a hash id.
 
         Returns:
-            str: unique hash id.
+            int: unique hash id.
         """        
         return hash(self.id)
     
@@ -226,6 +309,17 @@ class Variable:
             return self.instantiation.isList()
         return True
 
+    def indexKey(self):
+        """Returns the index key of this variable's instantiation.
+
+        Returns:
+            Object: the index key of the instantiation, or None if
+                this variable is uninstantiated
+        """        
+        if self.instantiation != None:
+            return self.instantiation.indexKey()
+        return None
+
     def listTailString(self):
         """Returns a string representation of this variable as the 
         tail of a list.
@@ -268,6 +362,16 @@ class Variable:
                 supplied axiom source and scope
         """        
         return scope.lookup(self.name)
+
+    def compileForProof(self, template, goal=False):
+        """Compiles this variable into a clause template, as a 
+        numbered slot.
+
+        Args:
+            template (ClauseTemplate): the template to compile into
+            goal (boolean, optional): ignored
+        """
+        template.emitVariable(self.name)
     
     def definitionString(self):
         """Returns string representation of this variable, showing 
@@ -312,14 +416,9 @@ class Structure:
         """        
         if len(terms) == 0:
             raise Exception("Cannot create a list with no head")
-        headAndTail = []
-        headAndTail.append(terms[0]) 
-        if len(terms) == 1:
-            headAndTail.append(tail) 
-        else:
-            rest = copy.copy(terms[1:])
-            headAndTail.append(cls.list(rest, tail)) 
-        return headAndTail
+        for i in range(len(terms) - 1, 0, -1):
+            tail = Structure(".", [terms[i], tail])
+        return [terms[0], tail]
 
     @classmethod
     def list(cls, *args):
@@ -363,8 +462,32 @@ class Structure:
         Returns:
             boolean: true   if this structure is a list
         """        
-        return len(self.terms) == 2 and self.functor == "." and self.terms[1].isList()
+        t = self
+        while True:
+            if isinstance(t, Variable):
+                if t.instantiation == None:
+                    return True
+                t = t.instantiation
+            elif type(t).isList is Structure.isList:
+                if not (len(t.terms) == 2 and t.functor == "."):
+                    return False
+                t = t.terms[1]
+            else:
+                return t.isList()
     
+    def indexKey(self):
+        """Returns the key under which a program indexes clauses
+        whose argument is this structure. An atom or a number is
+        keyed by its functor, and any other structure, including a 
+        list, by its functor and arity.
+
+        Returns:
+            Object: the index key of this structure
+        """        
+        if len(self.terms) == 0:
+            return self.functor
+        return (self.functor, len(self.terms))
+
     def listTailString(self):
         """Returns a representation of this list as the inner part of 
         some other list.
@@ -383,8 +506,15 @@ class Structure:
             str: a textual represenation of this list's terms
         """        
         s = self.terms[0].__str__()
-        if len(self.terms) > 1:
-            s += self.terms[1].listTailString()
+        t = self
+        while len(t.terms) > 1:
+            t = t.terms[1]
+            while isinstance(t, Variable) and t.instantiation != None:
+                t = t.instantiation
+            if (type(t).listTailString is not Structure.listTailString
+                    or len(t.terms) == 0):
+                return s + t.listTailString()
+            s += ", " + t.terms[0].__str__()
         return s
     
     # コンストラクター
@@ -434,7 +564,35 @@ class Structure:
             newTerms.append(t.copyForProof(_as, scope))
         # ConsultingStructureを直接使えないので、クラス名からインスタンスを生成
         cls = globals()['ConsultingStructure']
-        return cls(_as, self.functor, newTerms)
+        return cls(_as, self.functor, newTerms, scope.trail)
+
+    def compileForProof(self, template, goal=False):
+        """Compiles this structure into a clause template. A goal 
+        compiles to a ConsultingStructure; any other structure to a
+        plain structure, or to itself if it contains no variables.
+
+        Args:
+            template (ClauseTemplate): the template to compile into
+            goal (boolean, optional): True if this structure is a 
+                goal in the body of the rule. Defaults to False.
+        """
+        cls = globals()['ConsultingStructure'] if goal else Structure
+        template.compileStructure(self, cls, goal)
+
+    @classmethod
+    def fromTemplate(cls, functor, terms, _as, trail):
+        """Creates a structure for a renamed clause.
+
+        Args:
+            functor (Object): the functor of the structure
+            terms (Term[]): the renamed terms of the structure
+            _as (AxiomSource): where to find axioms to prove against
+            trail (Trail): the trail of the proof
+
+        Returns:
+            Structure: the new structure
+        """
+        return cls(functor, terms)
     
     def __eq__(self, o):
         """Returns true if the supplied object is an equivalent 
@@ -469,27 +627,39 @@ class Structure:
             boolean: True if this structure's functor and 
                 number of terms match the supplied structure
         """        
-        return self.arity() == s.arity() and self.functor.__eq__(s.functor)
+        return self.arity() == s.arity() and self.functor == s.functor
     
-    def unify(self, s):
+    def unify(self, s, trail=None):
+        """Unifies this structure with a term, recording the bindings
+        on the given trail. If the unification fails part way, the 
+        bindings it made are undone.
+
+        Args:
+            s (Term): the term to unify with
+            trail (Trail, optional): the trail to record bindings on.
+                Defaults to a new trail.
+
+        Returns:
+            Trail: the trail, or None if the unification fails
+        """
         if isinstance(s, Structure):
             if not self.functorAndArityEquals(s):
                 return None
-            u = Unification()
+            if trail == None:
+                trail = Trail()
+            mark = trail.mark()
             others = s.terms
             for i in range(len(self.terms)):
-                subUnification = self.terms[i].unify(others[i])            
-                if subUnification == None:
-                    u.unbind()
+                if self.terms[i].unify(others[i], trail) == None:
+                    trail.undo(mark)
                     return None
-                u.append(subUnification)
-            return u
+            return trail
         elif isinstance(s, Variable):
             v = s
-            return v.unify(self)
+            return v.unify(self, trail)
         else: # Term
             t = s
-            return t.unify(self)
+            return t.unify(self, trail)
     
     def eval(self):
         """Return this structure, if it is nonatomic, or just the
@@ -536,16 +706,20 @@ class Structure:
 class Scope:
     """A scope is a repository for variables. A dynamic rule has
     a scope, which means that variables with the same name
-    are the same variable.
+    are the same variable. The scope also carries the trail that
+    the proof binds its variables on.
     """    
-    def __init__(self, terms=[]):
+    def __init__(self, terms=[], trail=None):
         """Create a scope that uses the variables in the supplied
         terms.
 
         Args:
             terms (list, optional): the terms to seed this scope with. Defaults to [].
+            trail (Trail, optional): the trail of the proof. Defaults 
+                to a new trail.
         """        
         self.dictionary = {}
+        self.trail = trail if trail != None else Trail()
         for t in terms:
             u = t.variables()
             for v in u.elements():
@@ -573,6 +747,158 @@ class Scope:
             self.dictionary[name] = v
         return v
 
+class ClauseTemplate:
+    """A ClauseTemplate is a rule compiled into numbered variable 
+    slots and a flat list of instructions that rebuild the rule's
+    structures. Renaming the rule for a proof is then a single pass
+    over the instructions with a fixed-size frame of new variables,
+    instead of a walk through copyForProof with a scope lookup for
+    every variable occurrence.
+
+    An instruction is a tuple (VARIABLE, slot), (CONSTANT, term) or
+    (BUILD, class, functor, number of terms). Terms that contain no
+    variables compile to constants that every renaming shares.
+    """
+    VARIABLE = 0
+    CONSTANT = 1
+    BUILD = 2
+
+    @classmethod
+    def compile(cls, rule):
+        """Compiles a rule into a template.
+
+        Args:
+            rule (Rule): the rule to compile
+
+        Returns:
+            ClauseTemplate: the template, or None if the rule contains
+                a term that only knows how to copy itself for a proof
+        """
+        template = cls()
+        for i in range(len(rule.structures)):
+            template.compileTerm(rule.structures[i], i > 0)
+        if not template.compilable:
+            return None
+        template._slots = None
+        return template
+
+    def __init__(self):
+        """Creates an empty template.
+        """
+        self.names = []
+        self.code = []
+        self.compilable = True
+        self._slots = {}
+
+    def compileTerm(self, t, goal=False):
+        """Compiles a term into this template, or marks this template
+        as not compilable if the term cannot be compiled.
+
+        Args:
+            t (Term): the term to compile
+            goal (boolean, optional): True if the term is a goal in 
+                the body of the rule. Defaults to False.
+        """
+        if not ClauseTemplate.canCompile(t):
+            self.compilable = False
+            self.emitConstant(t)
+            return
+        t.compileForProof(self, goal)
+
+    @classmethod
+    def canCompile(cls, t):
+        """Returns True if a term's compileForProof agrees with its
+        copyForProof, which is not the case for a subclass that 
+        overrides only copyForProof.
+
+        Args:
+            t (Term): the term to check
+
+        Returns:
+            boolean: True if the term can be compiled
+        """
+        copier = compiler = None
+        for c in type(t).__mro__:
+            if copier == None and 'copyForProof' in c.__dict__:
+                copier = c
+            if compiler == None and 'compileForProof' in c.__dict__:
+                compiler = c
+        return copier == compiler
+
+    def emitVariable(self, name):
+        """Emits an instruction that pushes the variable with the 
+        given name from the frame.
+
+        Args:
+            name (str): the name of the variable
+        """
+        slot = self._slots.get(name)
+        if slot == None:
+            slot = self._slots[name] = len(self.names)
+            self.names.append(name)
+        self.code.append((ClauseTemplate.VARIABLE, slot))
+
+    def emitConstant(self, t):
+        """Emits an instruction that pushes a shared term.
+
+        Args:
+            t (Term): the term
+        """
+        self.code.append((ClauseTemplate.CONSTANT, t))
+
+    def compileStructure(self, s, cls, goal=False):
+        """Compiles the terms of a structure, followed by an 
+        instruction that builds an instance of the given class from
+        them. A structure that is not a goal and whose terms are all
+        constants becomes a constant itself.
+
+        Args:
+            s (Structure): the structure to compile
+            cls (type): the class to build at renaming time
+            goal (boolean, optional): True if the structure is a goal
+        """
+        for t in s.terms:
+            self.compileTerm(t)
+        n = len(s.terms)
+        if not goal:
+            tail = self.code[len(self.code) - n:] if n > 0 else []
+            if all(i[0] == ClauseTemplate.CONSTANT for i in tail):
+                del self.code[len(self.code) - n:]
+                self.emitConstant(s)
+                return
+        self.code.append((ClauseTemplate.BUILD, cls, s.functor, n))
+
+    def dynamicRule(self, _as, trail=None):
+        """Renames the rule for a proof.
+
+        Args:
+            _as (AxiomSource): the source to consult for proving the 
+                structures of the rule
+            trail (Trail, optional): the trail of the proof
+
+        Returns:
+            DynamicRule: a provable version of the rule
+        """
+        if trail == None:
+            trail = Trail()
+        frame = [Variable(name) for name in self.names]
+        stack = []
+        for i in self.code:
+            op = i[0]
+            if op == ClauseTemplate.VARIABLE:
+                stack.append(frame[i[1]])
+            elif op == ClauseTemplate.CONSTANT:
+                stack.append(i[1])
+            else:
+                n = i[3]
+                if n > 0:
+                    terms = stack[-n:]
+                    del stack[-n:]
+                else:
+                    terms = []
+                stack.append(i[1].fromTemplate(i[2], terms, _as, trail))
+        return DynamicRule(_as, None, stack)
+
 class Rule:
     """A Rule represents a logic statement that a structure is true 
     if a following series of other structures are true. 
@@ -584,17 +910,31 @@ class Rule:
             structures (list, optional): the structures that make up this rule. Defaults to [].
         """        
         self.structures = structures
+        self._template = None
+        self._compiled = False
+
+    def compile(self):
+        """Compiles this rule into a clause template, so that 
+        dynamicAxiom can rename it without copying it term by term.
+        """
+        self._template = ClauseTemplate.compile(self)
+        self._compiled = True
 
-    def dynamicAxiom(self, axiomSource):
+    def dynamicAxiom(self, axiomSource, trail=None):
         """Return a provable version of this rule.
 
         Args:
             axiomSource (AxiomSource): the axiom source
+            trail (Trail, optional): the trail of the proof
 
         Returns:
             DynamicAxiom: a provable version of this rule
         """        
-        return DynamicRule(axiomSource, Scope(), self)
+        if not self._compiled:
+            self.compile()
+        if self._template != None:
+            return self._template.dynamicRule(axiomSource, trail)
+        return DynamicRule(axiomSource, Scope(trail=trail), self)
     
     def head(self):
         """Return the first structure in this rule.
@@ -644,7 +984,7 @@ class ConsultingStructure(Structure):
     """A ConsultingStructure is structure that can prove itself 
     against an axiom source supplied with the constructor.
     """    
-    def __init__(self, source, functor, terms=[]):
+    def __init__(self, source, functor, terms=[], trail=None):
         """Constructs a consulting structure with the specified functor 
         and terms, to consult against the supplied axiom source.
         This constructor is for use by Structure. 
@@ -653,12 +993,30 @@ class ConsultingStructure(Structure):
             source (AxiomSource): axiom source
             functor (Object): functor
             terms (list, optional): structure terms. Defaults to [].
+            trail (Trail, optional): the trail of the proof. Defaults
+                to a new trail.
         """        
         super().__init__(functor, terms)
         self.source = source
+        self.trail = trail if trail != None else Trail()
         self._axioms = None
-        self.currentUnification = None
+        self.mark = None
         self.resolvent = None
+
+    @classmethod
+    def fromTemplate(cls, functor, terms, _as, trail):
+        """Creates a consulting structure for a renamed clause.
+
+        Args:
+            functor (Object): the functor of the structure
+            terms (Term[]): the renamed terms
+            _as (AxiomSource): where to find axioms to prove against
+            trail (Trail): the trail of the proof
+
+        Returns:
+            Structure: the new consulting structure
+        """
+        return cls(_as, functor, terms, trail)
     
     def axioms(self):
         """Returns the axioms that a consulting structure can
@@ -720,31 +1078,52 @@ class ConsultingStructure(Structure):
             h = a.head()
             if not self.functorAndArityEquals(h):
                 continue
-            aCopy = a.dynamicAxiom(self.source)
+            aCopy = a.dynamicAxiom(self.source, self.trail)
             if Program.debug:
                 print(f"\t{h}", end="")
-            self.currentUnification = aCopy.head().unify(self)
+            self.mark = self.trail.mark()
             self.resolvent = None
-            if self.currentUnification != None:
+            if aCopy.head().unify(self, self.trail) != None:
                 self.resolvent = aCopy.resolvent()
+                for s in self.resolvent.structures:
+                    if isinstance(s, Cut):
+                        s.parent = self
                 # デバッグトレース
                 if Program.debug:
                     if not self.resolvent.isEmpty():
-                        print(f"\tTrue\t{self.currentUnification} => {self.resolvent}")
+                        print(f"\tTrue\t{self.trail.variables(self.mark)} => {self.resolvent}")
                     else:
-                        print(f"\tTrue\t{self.currentUnification}")
+                        print(f"\tTrue\t{self.trail.variables(self.mark)}")
                 return True
-            elif Program.debug:
+            self.mark = None
+            if Program.debug:
                 print(f"\tFalse")
         return False
     
+    def commit(self, cut):
+        """Discards the axioms this structure has yet to try, and the
+        proof states of the structures before the given cut in its 
+        resolvent, none of which a later proof will retry.
+
+        Args:
+            cut (Cut): the cut in this structure's resolvent
+        """
+        self._axioms = iter(())
+        for s in self.resolvent.structures:
+            if s is cut:
+                break
+            if isinstance(s, ConsultingStructure):
+                s._axioms = iter(())
+                s.resolvent = None
+
     def unbind(self):
         """Release the variable bindings that the last unification 
-        produced.
+        produced, by undoing the trail back to the mark taken before 
+        it.
         """
-        if self.currentUnification != None:
-            self.currentUnification.unbind()
-        self.currentUnification = None
+        if self.mark != None:
+            self.trail.undo(self.mark)
+        self.mark = None
         self.resolvent = None
 
 
@@ -774,6 +1153,7 @@ class DynamicRule(Rule):
         self.scope = scope
         self._tail = None
         self.headInvolved = False
+        self.committed = False
 
     def canEstablish(self):
         """"Can establish" means that either a rule can prove itself, or
@@ -808,17 +1188,27 @@ class DynamicRule(Rule):
         if self.headInvolved:
             if self.tail().canFindNextProof():
                 return True
+            if self._tail.committed:
+                self.committed = True
+                return False
         # Prove our structures or give up. If the head is provable,
         # it means the head has unified with another rule in the 
         # program. Our task then is to establish that either the 
         # tail is empty, or that it is provable. "Can establish" 
-        # means is empty or provable.
+        # means is empty or provable. Failing back into a cut
+        # commits the rule, and it fails without retrying the
+        # structures before the cut.
         while True:
             self.headInvolved = self.head().canFindNextProof()
             if not self.headInvolved:
+                if isinstance(self.head(), Cut):
+                    self.committed = True
                 return False
             if self.tail().canEstablish():
                 return True
+            if self._tail.committed:
+                self.committed = True
+                return False
 
     def isEmpty(self):
         """Return true if this rule contains no 
@@ -846,7 +1236,7 @@ class DynamicRule(Rule):
         provables = []
         for s in structures:
             if isinstance(s, Fact):
-                provables.append(ConsultingStructure(_as, s.functor, s.terms))
+                provables.append(ConsultingStructure(_as, s.functor, s.terms, scope.trail))
             else:
                 provables.append(s.copyForProof(_as, scope))
         return provables
@@ -879,15 +1269,13 @@ class DynamicRule(Rule):
                 rule
         """        
         if len(self.structures) == 0:
-            return Unification.empty
+            return Unification()
         return self.head().variables().append(self.tail().variables())
     
 
 class Fact(Structure):
     """A Fact is a Structure that contains only other Facts.    
     """    
-    _resolvent = DynamicRule(None, None, [])
-
     @classmethod
     def facts(cls, objects):
         """Create an array of (atomic) facts from an array of
@@ -941,24 +1329,27 @@ class Fact(Structure):
             else:
                 super().__init__(functor, [Atom(o1), Atom(o2)])
     
-    def unify(self, f):
+    def unify(self, f, trail=None):
         # 注意: fがFactでない場合、superのunifyを呼ぶ
         if not isinstance(f, Fact):
-            return super().unify(f)
+            return super().unify(f, trail)
         if not self.functorAndArityEquals(f):
             return None
+        if trail == None:
+            trail = Trail()
         for i in range(len(self.terms)):
             f1 = self.terms[i]
             f2 = f.terms[i]
-            if f1.unify(f2) == None:
+            if f1.unify(f2, trail) == None:
                 return None
-        return Unification.empty
+        return trail
     
-    def dynamicAxiom(self, ignored):
+    def dynamicAxiom(self, ignored, ignored2=None):
         """Returns this fact.
 
         Args:
             ignored (AxiomSource): ignored
+            ignored2 (Trail): ignored
 
         Returns:
             Fact: this fact
@@ -971,7 +1362,7 @@ class Fact(Structure):
         Returns:
             DynamicRule: a dynamic rule with nothing in it
         """        
-        return Fact._resolvent
+        return DynamicRule(None, None, [])
     
     def head(self):
         """Returns this fact.
@@ -992,6 +1383,20 @@ class Fact(Structure):
             Term: this fact
         """        
         return self
+
+    def compileForProof(self, template, goal=False):
+        """Compiles this fact into a clause template, as a shared 
+        constant, or as a consulting structure if it is a goal.
+
+        Args:
+            template (ClauseTemplate): the template to compile into
+            goal (boolean, optional): True if this fact is a goal in 
+                the body of the rule. Defaults to False.
+        """
+        if goal:
+            template.compileStructure(self, ConsultingStructure, True)
+        else:
+            template.emitConstant(self)
     
 class Atom(Fact):
     """An Atom is a Structure that no terms.
@@ -1057,129 +1462,1970 @@ class EmptyList(Fact):
         """    
         return "[]"
     
-class Program:
-    """A Program is a collection of rules and facts that together
-    form a logical model.
-    """    
-    debug = False
-    def __init__(self, axioms=[]):
-        """Create a new program with the given axioms.
+class ArgumentIndex:
+    """An ArgumentIndex maps the index key of one argument of a
+    predicate's clause heads to the clauses that have that key.
+    Clauses whose argument is a variable can unify with any key,
+    so the index keeps them apart and merges them back in
+    program order.
+    """
+    def __init__(self, position, clauses=[]):
+        """Create an index on the given argument position.
 
         Args:
-            axioms (list, optional): the given axioms. Defaults to [].
-        """        
-        self._axioms = None
-        self._elements = []
-        for axiom in axioms:
-            self.addAxiom(axiom)
-    
-    def addAxiom(self, a):
-        """Adds an axiom to this program.
+            position (int): the argument position to index
+            clauses (list, optional): the clauses to index, in
+                program order. Defaults to [].
+        """
+        self.position = position
+        self.buckets = {}
+        self.unindexed = []
+        self.uses = 0
+        self.size = 0
+        for i in range(len(clauses)):
+            self.add(i, clauses[i].head())
+
+    def add(self, ordinal, head):
+        """Adds the clause with the given ordinal to this index.
 
         Args:
-            a (Axiom): the axiom to add.
-        """        
-        self._elements.append(a)
+            ordinal (int): the position of the clause in its predicate
+            head (Structure): the head of the clause
+        """
+        key = head.terms[self.position].indexKey()
+        if key == None:
+            self.unindexed.append(ordinal)
+        else:
+            bucket = self.buckets.get(key)
+            if bucket == None:
+                bucket = self.buckets[key] = []
+            bucket.append(ordinal)
+            self.size += 1
 
-    def append(self, _as):
-        """Appends all the axioms of another source to this one.
+    def count(self, key):
+        """Returns the number of clauses that may unify with an 
+        argument with the given key.
 
         Args:
-            _as (AxiomSource): the source of the new axioms
-        """        
-        e = _as.axioms()
-        for a in e:
-            self.addAxiom(a)
-            
-    def axioms(self, *args):
-        """Returns an enumeration of the axioms in this program.
+            key (Object): the index key of the argument
 
         Returns:
-            Axiom[]: an enumeration of the axioms in this program.
-        """        
-        return iter(self._elements)
-    
-    def __str__(self):
-        """Returns a string representation of this program. 
+            int: the number of candidate clauses
+        """
+        return len(self.buckets.get(key, ())) + len(self.unindexed)
+
+    def average(self):
+        """Returns the number of clauses that may unify with an
+        argument whose key is not known yet, on average over the keys.
 
         Returns:
-            str: a string representation of this program.
-        """        
-        buf = str()
-        haveShownALine = False
-        for e in self.axioms():
-            if haveShownALine:
-                buf += "\n"
-            buf += e.__str__()
-            buf += ";"
-            haveShownALine = True
-        return buf
+            float: the average number of candidate clauses
+        """
+        return self.size / max(1, len(self.buckets)) + len(self.unindexed)
 
-class Query(DynamicRule):
-    """A Query is a dynamic rule that stands outside of a program 
-    and proves itself by referring to a program.
-    """    
-    def __init__(self, _as, *args):
-        """Create a query from the given structures, to prove itself
-        against the given axiom source.
+    def ordinals(self, key):
+        """Returns the ordinals of the clauses that may unify with
+        an argument with the given key, in program order.
 
         Args:
-            _as (AxiomSource): _description_
-            args = structures: the structures to prove
-            args = Rule: he rule that contains structures to prove            
-        """        
-        self._tail = None
-        if len(args) == 1:
-            if isinstance(args[0], Rule):
-                rule = args[0]
-                scope = Scope(rule.structures)
-                structures = rule.structures
-            else:
-                if isinstance(args[0], Structure):
-                    structures = [args[0]]
-                else:
-                    structures = args[0]
-                scope = Scope(structures)
-        elif len(args) == 2:
-            scope = args[0]
-            structures = args[1]
-        super().__init__(_as, scope, super().provableStructures(_as, scope, structures))
-    
+            key (Object): the index key of the argument
+
+        Returns:
+            int[]: an iteration of clause ordinals
+        """
+        bucket = self.buckets.get(key, [])
+        if len(self.unindexed) == 0:
+            return iter(bucket)
+        if len(bucket) == 0:
+            return iter(self.unindexed)
+        return heapq.merge(bucket, self.unindexed)
+
     def __str__(self):
-        """Returns a string representation of this query. 
+        """Returns a string representation of this index.
 
         Returns:
-            str: a string representation of this query.
-        """        
-        buf = str("")
-        for i in range(len(self.structures)):
-            if i > 0:
-                buf += ", "
-            buf += self.structures[i].__str__()
-        return buf
-    
-class Gateway(Structure):
-    """A Gateway is a structure that can prove its truth at most 
-    once before failing. 
-    """    
-    def __init__(self, functor, terms=[]):
-        """Allows subclasses to use this form of constructor. This typically
-        happens when the subclass object is creating an executable copy
-        of itself.
+            str: a string representation of this index
+        """
+        return f"arg {self.position + 1}: {len(self.buckets)} keys, {self.uses} uses"
+
+class Predicate:
+    """A Predicate holds the clauses of a program that have the same
+    functor and arity, in program order. It always indexes the
+    clauses on their first argument. It also counts how often each
+    argument is bound when the predicate is called, and once the
+    predicate is hot it builds an index on every argument that
+    calls bind often enough. A call then consults the clauses from 
+    the most selective index among its bound arguments.
+
+    A columnar predicate keeps its clauses in its own storage, and 
+    the program does not list them among its elements. Its axioms()
+    also takes comparisons of the arguments with values, as tuples
+    (position, operator, value), and returns only the clauses that
+    pass them.
+    """
+    jitThreshold = 16
+    jitMinimumClauses = 8
+    columnar = False
 
-        Args:
-            functor (Object): the functor for this gateway
-            terms (list, optional): the program the gateway will prove itself 
-                against. Defaults to [].
-        """        
-        super().__init__(functor, terms)
-        self.open = False
-    
-    def canFindNextProof(self):
-        """Returns true if the gate is closed and this gateway can find a new 
-        proof.
+    def __init__(self, functor, arity):
+        """Create an empty predicate.
 
-        A gateway is a structure that can prove itself in at most one 
+        Args:
+            functor (Object): the functor of the predicate
+            arity (int): the number of terms of the predicate
+        """
+        self.functor = functor
+        self.arity = arity
+        self.clauses = []
+        self.indexes = {0: ArgumentIndex(0)} if arity > 0 else {}
+        self.calls = 0
+        self.boundCalls = [0] * arity
+        self.tabled = False
+        self.facts = True
+        self.joinTables = {}
+
+    @classmethod
+    def isGroundFact(cls, a):
+        """Returns true if a clause is a fact with no variables.
+
+        Args:
+            a (Axiom): the clause
+
+        Returns:
+            boolean: True if the clause is a ground fact
+        """
+        if isinstance(a, Fact):
+            return True
+        if not isinstance(a, Rule) or len(a.structures) != 1:
+            return False
+        terms = [a.head()]
+        while len(terms) > 0:
+            t = terms.pop()
+            if isinstance(t, Variable):
+                return False
+            terms.extend(t.terms)
+        return True
+
+    def addClause(self, a):
+        """Adds a clause to the end of this predicate, and refreshes
+        the indexes with it.
+
+        Args:
+            a (Axiom): the clause to add
+        """
+        self.clauses.append(a)
+        self.facts = self.facts and Predicate.isGroundFact(a)
+        self.joinTables = {}
+        for index in self.indexes.values():
+            index.add(len(self.clauses) - 1, a.head())
+
+    def addClauses(self, clauses):
+        """Adds clauses to the end of this predicate, and refreshes 
+        each index with all of them at once.
+
+        Args:
+            clauses (Axiom[]): the clauses to add
+        """
+        start = len(self.clauses)
+        self.clauses.extend(clauses)
+        self.facts = self.facts and all(Predicate.isGroundFact(a) for a in clauses)
+        self.joinTables = {}
+        for index in self.indexes.values():
+            for i in range(start, len(self.clauses)):
+                index.add(i, self.clauses[i].head())
+
+    def axioms(self, s):
+        """Returns the clauses of this predicate that may unify with
+        the given structure, in program order.
+
+        Args:
+            s (Structure): the structure to prove
+
+        Returns:
+            Axiom[]: an enumeration of candidate clauses
+        """
+        best, key = self.selectIndex(s)
+        if best == None:
+            return iter(self.clauses)
+        clauses = self.clauses
+        return (clauses[i] for i in best.ordinals(key))
+
+    def ordinals(self, s):
+        """Returns the positions of the clauses that axioms() would
+        return for the given structure, in the same order. The 
+        position of a clause is an ordinal that clause() turns back
+        into the clause, in this or another copy of the predicate.
+
+        Args:
+            s (Structure): the structure to prove
+
+        Returns:
+            int[]: an enumeration of clause positions
+        """
+        best, key = self.selectIndex(s)
+        if best == None:
+            return range(len(self.clauses))
+        return best.ordinals(key)
+
+    def clause(self, ordinal):
+        """Returns the clause at a position that ordinals() gave.
+
+        Args:
+            ordinal (int): the position of the clause
+
+        Returns:
+            Axiom: the clause
+        """
+        return self.clauses[ordinal]
+
+    def selectIndex(self, s):
+        """Counts a call with the given structure, and chooses the
+        most selective index among its bound arguments.
+
+        Args:
+            s (Structure): the structure to prove
+
+        Returns:
+            tuple: the index and the key to look up in it, or 
+                (None, None) if no index applies
+        """
+        self.calls += 1
+        best = None
+        bestKey = None
+        for i in range(self.arity):
+            key = s.terms[i].indexKey()
+            if key == None:
+                continue
+            self.boundCalls[i] += 1
+            index = self.indexes.get(i)
+            if index == None:
+                index = self.demandIndex(i)
+                if index == None:
+                    continue
+            if best == None or index.count(key) < best.count(bestKey):
+                best = index
+                bestKey = key
+        if best != None:
+            best.uses += 1
+        return best, bestKey
+
+    def estimate(self, s, bound=()):
+        """Returns the number of clauses that a call with the given
+        structure would try, from the indexes it could use, without
+        counting the call.
+
+        Args:
+            s (Structure): the structure to prove
+            bound (set, optional): the positions of arguments that 
+                will be bound to values not known yet. Defaults to ().
+
+        Returns:
+            float: the estimated number of candidate clauses
+        """
+        best = len(self.clauses)
+        for i, index in self.indexes.items():
+            if i in bound:
+                best = min(best, index.average())
+                continue
+            key = s.terms[i].indexKey()
+            if key != None:
+                best = min(best, index.count(key))
+        return best
+
+    def demandIndex(self, position):
+        """Builds an index on the given argument, if calls bind it 
+        often enough and this predicate has enough clauses to make 
+        the index worthwhile. The new index goes into a copy of the
+        table of indexes, so that a call in another thread sees 
+        either the old table or the new one, never a partial index.
+
+        Args:
+            position (int): the argument position
+
+        Returns:
+            ArgumentIndex: the new index, or None if the argument is
+                not worth indexing yet
+        """
+        if (self.boundCalls[position] < Predicate.jitThreshold or 
+            len(self.clauses) < Predicate.jitMinimumClauses):
+            return None
+        index = ArgumentIndex(position, self.clauses)
+        indexes = dict(self.indexes)
+        indexes[position] = index
+        self.indexes = indexes
+        return index
+
+    def dropIndexes(self):
+        """Discards the demand-built indexes and the call counts that
+        led to them, keeping the first argument index, and the hash 
+        join tables.
+        """
+        self.indexes = {0: self.indexes[0]} if self.arity > 0 else {}
+        self.calls = 0
+        self.boundCalls = [0] * self.arity
+        self.joinTables = {}
+
+    def __str__(self):
+        """Returns a string representation of this predicate and its
+        indexes.
+
+        Returns:
+            str: a string representation of this predicate
+        """
+        buf = f"{self.functor}/{self.arity}: {len(self.clauses)} clauses, {self.calls} calls"
+        if self.tabled:
+            buf += ", tabled"
+        for i in sorted(self.indexes):
+            buf += f"\n\t{self.indexes[i]}"
+        return buf
+
+class AnswerTable:
+    """An AnswerTable holds the answers that a program has found for 
+    one call variant of a tabled predicate. Two calls are variants if
+    they are equal up to the naming of their unbound variables. Once
+    the table is complete, every later variant call consumes its 
+    answers instead of resolving against the predicate's clauses.
+    While its program evaluates the table, the table also holds the
+    state of the current pass over the predicate's clauses.
+    """
+    def __init__(self, call):
+        """Create an empty table for the given call.
+
+        Args:
+            call (Structure): a copy of the call, with its own variables
+        """
+        self.call = call
+        self.answers = []
+        self.complete = False
+        self.depth = None
+        self.leader = None
+        self.sccStart = None
+        self.predicate = None
+        self.clauses = None
+        self.solver = None
+        self.before = None
+        self.bytes = 0
+        self._keys = set()
+
+    @classmethod
+    def variant(cls, s):
+        """Returns a key that is the same for structures that are 
+        variants of each other, and a copy of the structure with new
+        variables in place of its unbound ones.
+
+        Args:
+            s (Structure): the structure, with its current bindings
+
+        Returns:
+            tuple: the key and the copy
+        """
+        key = []
+        leaves = []
+        slots = {}
+        variables = []
+        terms = [s]
+        while len(terms) > 0:
+            t = terms.pop()
+            while isinstance(t, Variable) and t.instantiation != None:
+                t = t.instantiation
+            if isinstance(t, Variable):
+                slot = slots.get(id(t))
+                if slot == None or isinstance(t, Anonymous):
+                    slot = slots[id(t)] = len(variables)
+                    variables.append(Anonymous() if isinstance(t, Anonymous) else Variable(t.name))
+                key.append(slot)
+                leaves.append(None)
+            else:
+                key.append((t.functor, len(t.terms)))
+                leaves.append(t)
+                terms.extend(reversed(t.terms))
+        built = []
+        for i in range(len(key) - 1, -1, -1):
+            k = key[i]
+            if isinstance(k, int):
+                built.append(variables[k])
+            elif k[1] == 0:
+                built.append(leaves[i])
+            else:
+                built.append(Structure(k[0], [built.pop() for j in range(k[1])]))
+        return tuple(key), built.pop()
+
+    def add(self, s):
+        """Adds the given structure, as currently bound, to the answers
+        of this table unless the table already has a variant of it.
+
+        Args:
+            s (Structure): the answer
+
+        Returns:
+            boolean: True if the answer is new
+        """
+        key, answer = AnswerTable.variant(s)
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        rule = Rule([answer])
+        rule.compile()
+        self.answers.append(rule)
+        self.bytes += sys.getsizeof(key) + sys.getsizeof(rule.structures)
+        terms = [answer]
+        while len(terms) > 0:
+            t = terms.pop()
+            if isinstance(t, Structure) and len(t.terms) > 0:
+                self.bytes += sys.getsizeof(t) + sys.getsizeof(t.__dict__) + sys.getsizeof(t.terms)
+                terms.extend(t.terms)
+        return True
+
+    def __str__(self):
+        """Returns a string representation of this table.
+
+        Returns:
+            str: the call, the number of answers and whether the table
+                is complete
+        """
+        state = "complete" if self.complete else "incomplete"
+        return f"{self.call}: {len(self.answers)} answers, {self.bytes} bytes, {state}"
+
+class FactFile:
+    """A FactFile reads the rows of a CSV, TSV or JSON Lines file as
+    lists of values for facts, one row at a time.
+
+    The columns to read are names from the header line of a CSV or
+    TSV file, or keys of the objects on the lines of a JSON Lines 
+    file, or else positions in the rows. Without columns, a file 
+    gives every column in order. Text values become ints or floats 
+    when they read as such, unless the file has a type for their 
+    column. Numbers are written as the Logikus tokenizer reads them,
+    with an optional minus sign and no exponent.
+    """
+    formats = {".csv": "csv", ".tsv": "tsv", ".tab": "tsv", 
+        ".jsonl": "jsonl", ".ndjson": "jsonl"}
+    integer = re.compile(r"-?[0-9]+")
+    decimal = re.compile(r"-?([0-9]+\.[0-9]*|\.[0-9]+)")
+
+    def __init__(self, path, columns=None, types=None, format=None, header=True):
+        """Create a reader of the given file.
+
+        Args:
+            path (str): the path of the file
+            columns (list, optional): the names or positions of the
+                columns to read. Defaults to None, for all columns.
+            types (list, optional): a function per column, like int,
+                float or str, that makes its values. Defaults to None,
+                for numbers where the text reads as one.
+            format (str, optional): "csv", "tsv" or "jsonl". Defaults
+                to None, for the format the file's extension names.
+            header (boolean, optional): whether the first line of a 
+                CSV or TSV file names the columns. Defaults to True.
+        """
+        if format == None:
+            format = FactFile.formats.get(os.path.splitext(path)[1].lower())
+            if format == None:
+                raise Exception(f"Unknown fact file format: {path}")
+        self.path = path
+        self.columns = columns
+        self.types = types
+        self.format = format
+        self.header = header
+
+    @classmethod
+    def value(cls, text):
+        """Returns the int or float that a text reads as, or else the
+        text.
+
+        Args:
+            text (str): the text
+
+        Returns:
+            Object: the value of the text
+        """
+        if FactFile.integer.fullmatch(text):
+            return int(text)
+        if FactFile.decimal.fullmatch(text):
+            return float(text)
+        return text
+
+    def rows(self):
+        """Yields the rows of this file.
+
+        Yields:
+            list: the values of a row
+        """
+        with open(self.path, newline="", encoding="utf-8") as f:
+            if self.format == "jsonl":
+                records = (json.loads(line) for line in f if line.strip() != "")
+            else:
+                records = csv.reader(f, delimiter="," if self.format == "csv" else "\t")
+            positions = self.columns
+            for n, record in enumerate(records, 1):
+                if self.format != "jsonl" and self.header and n == 1:
+                    if positions != None:
+                        for c in positions:
+                            if isinstance(c, str) and c not in record:
+                                raise Exception(f"{self.path}, row {n}: missing column {c}")
+                        positions = [record.index(c) if isinstance(c, str) else c for c in positions]
+                    continue
+                if positions == None:
+                    positions = list(record.keys()) if isinstance(record, dict) else range(len(record))
+                try:
+                    values = [record[c] for c in positions]
+                except (IndexError, KeyError):
+                    raise Exception(f"{self.path}, row {n}: missing column")
+                if self.types != None:
+                    values = [t(v) for t, v in zip(self.types, values)]
+                elif self.format != "jsonl":
+                    values = [FactFile.value(v) for v in values]
+                yield values
+
+class SnapshotPickler(pickle.Pickler):
+    """A SnapshotPickler pickles a program for a snapshot, and keeps
+    the typed arrays it meets, such as the columns of fact tables, 
+    out of the pickle. The snapshot stores the arrays raw after the
+    pickle, each at a multiple of 8 bytes from the start of the 
+    arrays, and the pickle refers to them by position.
+    """
+    def __init__(self, f):
+        """Create a pickler that writes to a file.
+
+        Args:
+            f (file): the file
+        """
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays = []
+        self.size = 0
+
+    def persistent_id(self, obj):
+        """Returns the reference to a typed array in the snapshot's 
+        arrays, or None for an object to pickle.
+
+        Args:
+            obj (Object): the object to pickle
+
+        Returns:
+            tuple: the type code, offset and length of the array, or
+                None
+        """
+        if type(obj) is not array or obj.typecode not in SnapshotUnpickler.typecodes:
+            return None
+        reference = ("array", obj.typecode, self.size, len(obj))
+        self.arrays.append(obj)
+        self.size += len(obj) * obj.itemsize
+        self.size += -self.size % 8
+        return reference
+
+    def writeArrays(self, f):
+        """Writes the arrays of the pickle to a file, each padded to a
+        multiple of 8 bytes.
+
+        Args:
+            f (file): the file
+        """
+        for a in self.arrays:
+            data = a.tobytes()
+            f.write(data)
+            f.write(bytes(-len(data) % 8))
+
+class SnapshotUnpickler(pickle.Unpickler):
+    """A SnapshotUnpickler reads a program from a snapshot. It makes
+    only the classes of the engine's own modules and a few built-in
+    types, so a snapshot cannot name an arbitrary function for the
+    pickle to call. The arrays of the snapshot come back as read-only
+    views of the mapped file rather than as copies.
+    """
+    modules = ("engine", "facttable", "external")
+    builtins = {
+        ("builtins", n) for n in ("bool", "bytearray", "bytes", "complex", "dict", "float", 
+            "frozenset", "int", "list", "range", "set", "slice", "str", "tuple")
+    } | {("array", "array"), ("array", "_array_reconstructor"), 
+        ("collections", "defaultdict"), ("collections", "OrderedDict")}
+    methods = {("facttable", "FactStore", "mappedTable")}
+    typecodes = "bBhHiIlLqQfd"
+
+    def __init__(self, f, arrays):
+        """Create an unpickler that reads from a file.
+
+        Args:
+            f (file): the file
+            arrays (memoryview): the mapped arrays of the snapshot
+        """
+        super().__init__(f)
+        self.arrays = arrays
+
+    def find_class(self, module, name):
+        """Returns a class that the snapshot names, if it is a class
+        of the engine's modules or an allowed built-in.
+
+        Args:
+            module (str): the name of the module
+            name (str): the name of the class
+
+        Returns:
+            Object: the class
+        """
+        if (module, name) in SnapshotUnpickler.builtins:
+            return super().find_class(module, name)
+        if module == "builtins" and name == "getattr":
+            return self.method
+        if module in SnapshotUnpickler.modules and "." not in name:
+            c = super().find_class(module, name)
+            if isinstance(c, type) and c.__module__ == module:
+                return c
+        raise pickle.UnpicklingError(f"A program snapshot may not use {module}.{name}")
+
+    def method(self, c, name):
+        """Returns one of the few class methods that a snapshot may
+        call to make an object.
+
+        Args:
+            c (type): the class
+            name (str): the name of the method
+
+        Returns:
+            function: the method
+        """
+        if (c.__module__, c.__name__, name) not in SnapshotUnpickler.methods:
+            raise pickle.UnpicklingError(f"A program snapshot may not call {c.__name__}.{name}")
+        return getattr(c, name)
+
+    def persistent_load(self, reference):
+        """Returns a view of one of the snapshot's arrays.
+
+        Args:
+            reference (tuple): the type code, offset and length of 
+                the array
+
+        Returns:
+            memoryview: the view of the array
+        """
+        kind, typecode, offset, length = reference
+        if kind != "array" or typecode not in SnapshotUnpickler.typecodes:
+            raise pickle.UnpicklingError(f"A program snapshot has no array {reference}")
+        end = offset + length * array(typecode).itemsize
+        if offset < 0 or length < 0 or end > len(self.arrays):
+            raise pickle.UnpicklingError(f"A program snapshot has no array {reference}")
+        return self.arrays[offset:end].cast(typecode)
+
+class Program:
+    """A Program is a collection of rules and facts that together
+    form a logical model.
+
+    A predicate that the program tables answers each call variant 
+    from an answer table. The first call of a variant evaluates the
+    predicate's clauses, and a variant call made during that 
+    evaluation consumes the answers found so far instead of recursing.
+    The evaluation repeats until a pass finds no new answers, then 
+    the table and the tables it depends on are complete. Calls that
+    depend on each other complete together, with the oldest of them.
+    The tables under evaluation form an explicit stack, so a chain 
+    of calls of new variants, however long, does not nest on Python's
+    stack.
+
+    Once loaded, a program is shared by the queries that consult it:
+    each query binds only its own variables and the renamed copies
+    of clauses it makes, and records the bindings on its own trail.
+    Several threads may therefore query one program at once. Only 
+    the evaluation of a table that is not complete takes a lock.
+    """    
+    debug = False
+    def __init__(self, axioms=[]):
+        """Create a new program with the given axioms.
+
+        Args:
+            axioms (list, optional): the given axioms. Defaults to [].
+        """        
+        self._axioms = None
+        self._elements = []
+        self._predicates = {}
+        self._tables = {}
+        self._tableStack = []
+        self._tableScc = []
+        self._tableAnswers = 0
+        self._tableLock = threading.RLock()
+        for axiom in axioms:
+            self.addAxiom(axiom)
+    
+    def addAxiom(self, a):
+        """Adds an axiom to this program.
+
+        Args:
+            a (Axiom): the axiom to add.
+        """        
+        h = a.head()
+        key = (h.functor, h.arity())
+        p = self._predicates.get(key)
+        if p == None:
+            p = self._predicates[key] = Predicate(h.functor, h.arity())
+        if not p.columnar:
+            self._elements.append(a)
+            if isinstance(a, Rule):
+                a.compile()
+        p.addClause(a)
+        if len(self._tables) > 0:
+            self.clearTables()
+
+    loadBatch = 10000
+    snapshotHeader = struct.Struct("<4sI32sQ")
+    snapshotMagic = b"LGKS"
+    snapshotVersion = 2
+
+    @classmethod
+    def sourceHash(cls, source):
+        """Returns the hash of a program's source text that a snapshot
+        of the program records.
+
+        Args:
+            source (str): the source text, or None
+
+        Returns:
+            bytes: the SHA-256 digest of the text, or zeros
+        """
+        if source == None:
+            return bytes(32)
+        return hashlib.sha256(source.encode("utf-8")).digest()
+
+    def saveSnapshot(self, path, source=None):
+        """Writes this program, with its compiled clauses, indexes, 
+        fact tables and complete answer tables, to a snapshot file. 
+        The file starts with a header of a magic number, the format
+        version, the hash of the program's source text and where the
+        arrays start. The program follows as a pickle, and then the
+        typed arrays that the pickle refers to, such as the columns 
+        of fact tables, raw. The snapshot goes to a new file that 
+        then replaces any old one, which a loaded program may still
+        map.
+
+        Args:
+            path (str): the path of the file
+            source (str, optional): the source text of the program.
+                Defaults to None.
+        """
+        temporary = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "wb") as f:
+                f.write(bytes(Program.snapshotHeader.size))
+                pickler = SnapshotPickler(f)
+                pickler.dump(self)
+                f.write(bytes(-f.tell() % 8))
+                start = f.tell()
+                pickler.writeArrays(f)
+                f.seek(0)
+                f.write(Program.snapshotHeader.pack(
+                    Program.snapshotMagic, Program.snapshotVersion, Program.sourceHash(source), start))
+            os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    @classmethod
+    def loadSnapshot(cls, path, source=None):
+        """Reads a program from a snapshot file. The file is mapped
+        into memory, and the arrays of its fact tables stay in the
+        mapped file as read-only views, which a fact table copies 
+        only when a row is added to it.
+
+        A snapshot must come from a trusted source. The unpickler 
+        makes only the classes of the engine's modules and a few
+        built-in types, but a crafted snapshot can still make those
+        objects with any state.
+
+        Args:
+            path (str): the path of the file
+            source (str, optional): the source text the snapshot must
+                have been made from. Defaults to None, to not check.
+
+        Returns:
+            Program: the program
+        """
+        with open(path, "rb") as f:
+            header = f.read(Program.snapshotHeader.size)
+            if len(header) < Program.snapshotHeader.size:
+                raise Exception(f"{path} is not a program snapshot")
+            magic, version, digest, start = Program.snapshotHeader.unpack(header)
+            if magic != Program.snapshotMagic:
+                raise Exception(f"{path} is not a program snapshot")
+            if version != Program.snapshotVersion:
+                raise Exception(f"{path} has snapshot version {version}, not {Program.snapshotVersion}")
+            if source != None and digest != Program.sourceHash(source):
+                raise Exception(f"{path} was not made from the given source")
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            if start < Program.snapshotHeader.size or start > len(buffer):
+                raise Exception(f"{path} is not a program snapshot")
+            return SnapshotUnpickler(f, buffer[start:]).load()
+
+    def loadFacts(self, path, functor, columns=None, types=None, format=None, header=True):
+        """Adds a fact for each row of a CSV, TSV or JSON Lines file,
+        reading the file a batch of rows at a time and adding each 
+        batch to the predicate's indexes at once. A columnar predicate
+        for the facts, added beforehand, takes the rows as they are.
+
+        Args:
+            path (str): the path of the file
+            functor (Object): the functor of the facts
+            columns (list, optional): the names or positions of the
+                columns to read. Defaults to None, for all columns.
+            types (list, optional): a function per column, like int,
+                float or str, that makes its values. Defaults to None,
+                for numbers where the text reads as one.
+            format (str, optional): "csv", "tsv" or "jsonl". Defaults
+                to None, for the format the file's extension names.
+            header (boolean, optional): whether the first line of a 
+                CSV or TSV file names the columns. Defaults to True.
+
+        Returns:
+            int: the number of facts added
+        """
+        rows = FactFile(path, columns, types, format, header).rows()
+        count = 0
+        p = None
+        while True:
+            batch = list(itertools.islice(rows, Program.loadBatch))
+            if len(batch) == 0:
+                break
+            if p == None:
+                arity = len(batch[0])
+                p = self._predicates.get((functor, arity))
+                if p == None:
+                    p = self._predicates[(functor, arity)] = Predicate(functor, arity)
+            if any(len(values) != p.arity for values in batch):
+                raise Exception(f"{path}: rows must have {p.arity} values")
+            if p.columnar:
+                p.addRows(batch)
+            else:
+                facts = [Fact(functor, values) for values in batch]
+                self._elements.extend(facts)
+                p.addClauses(facts)
+            count += len(batch)
+        if len(self._tables) > 0:
+            self.clearTables()
+        return count
+
+    def addPredicate(self, p):
+        """Adds a predicate that stores its own clauses, like a fact 
+        table, in place of any predicate with the same functor and 
+        arity. The clauses the program already holds for it move 
+        into the new predicate.
+
+        Args:
+            p (Predicate): the predicate to add
+        """
+        key = (p.functor, p.arity)
+        old = self._predicates.get(key)
+        self._predicates[key] = p
+        if old != None:
+            p.tabled = old.tabled
+            for a in old.clauses:
+                p.addClause(a)
+            if not old.columnar:
+                self._elements = [a for a in self._elements 
+                    if (a.head().functor, a.head().arity()) != key]
+        self.clearTables()
+
+    def __getstate__(self):
+        """Returns the attributes to pickle, leaving out the table 
+        lock and the tables that are not complete.
+
+        Returns:
+            dict: the attributes to pickle
+        """
+        state = dict(self.__dict__)
+        del state["_tableLock"]
+        state["_tables"] = {k: t for k, t in self._tables.items() if t.complete}
+        state["_tableStack"] = []
+        state["_tableScc"] = []
+        return state
+
+    def __setstate__(self, state):
+        """Restores an unpickled program with a new table lock.
+
+        Args:
+            state (dict): the pickled attributes of the program
+        """
+        self.__dict__.update(state)
+        self._tableLock = threading.RLock()
+
+    def append(self, _as):
+        """Appends all the axioms of another source to this one.
+
+        Args:
+            _as (AxiomSource): the source of the new axioms
+        """        
+        e = _as.axioms()
+        for a in e:
+            self.addAxiom(a)
+            
+    def axioms(self, *args):
+        """Returns an enumeration of the axioms in this program.
+
+        Args:
+            args = (): all the axioms
+            args = structure: only the axioms whose head may unify
+                with the given structure, found through the
+                predicate table
+
+        Returns:
+            Axiom[]: an enumeration of the axioms in this program.
+        """        
+        if len(args) == 0 or args[0] == None:
+            return itertools.chain(self._elements, *(p.clauses 
+                for p in self._predicates.values() if p.columnar))
+        s = args[0]
+        p = self._predicates.get((s.functor, s.arity()))
+        if p == None:
+            return iter(())
+        if p.tabled:
+            return self.tableAnswers(p, s)
+        return p.axioms(s)
+
+    def table(self, functor, arity):
+        """Tables the predicate with the given functor and arity. The
+        predicate need not have any clauses yet.
+
+        Args:
+            functor (Object): the functor of the predicate
+            arity (int): the number of terms of the predicate
+        """
+        p = self._predicates.get((functor, arity))
+        if p == None:
+            p = self._predicates[(functor, arity)] = Predicate(functor, arity)
+        p.tabled = True
+        self.clearTables()
+
+    def tableAnswers(self, p, s, solver=None):
+        """Returns the answers of a tabled predicate for the given 
+        call, evaluating the call's table unless it is complete.
+
+        A solver that proves a pass of a table's evaluation passes 
+        itself. Instead of evaluating a table that is not under 
+        evaluation, this then sets the solver waiting for the table 
+        and returns None, and the evaluation resumes the solver once 
+        the table has had its passes.
+
+        Args:
+            p (Predicate): the tabled predicate
+            s (Structure): the call
+            solver (Solver, optional): the solver of a pass that makes
+                the call. Defaults to None.
+
+        Returns:
+            Axiom[]: an enumeration of the answers, or None if the 
+                solver must wait
+        """
+        key, call = AnswerTable.variant(s)
+        table = self._tables.get(key)
+        if table == None or not table.complete:
+            with self._tableLock:
+                table = self._tables.get(key)
+                if table == None:
+                    table = self._tables[key] = AnswerTable(call)
+                if not table.complete:
+                    if solver == None or table.depth != None:
+                        self.evaluateTable(p, table)
+                    elif table is not solver.waiting:
+                        solver.waiting = table
+                        return None
+        if solver != None:
+            solver.waiting = None
+        return iter(table.answers)
+
+    def evaluateTable(self, p, table):
+        """Evaluates the clauses of a tabled predicate for a table's 
+        call. If the call is already under evaluation, this only marks
+        the calls in between as depending on it. Otherwise this 
+        repeats passes over the clauses until the table stops growing,
+        or, if the call depends on an older call under evaluation, 
+        makes a single pass and leaves completion to that call.
+
+        The passes of the tables that a pass calls do not nest on 
+        Python's stack. The solver of the calling pass waits while the
+        called table goes on the table stack, and resumes when the 
+        called table leaves it.
+
+        Args:
+            p (Predicate): the tabled predicate
+            table (AnswerTable): the table of the call
+        """
+        stack = self._tableStack
+        if table.depth != None:
+            for t in stack[table.depth + 1:]:
+                t.leader = min(t.leader, table.depth)
+            return
+        bottom = len(stack)
+        self.enterTable(p, table)
+        try:
+            while len(stack) > bottom:
+                t = stack[-1]
+                if t.solver == None:
+                    if not self.tableClause(t):
+                        if t.leader == t.depth and self._tableAnswers != t.before:
+                            self.tablePass(t)
+                        else:
+                            self.leaveTable(t)
+                    continue
+                found = t.solver.canFindNextProof()
+                if found == None:
+                    w = t.solver.waiting
+                    self.enterTable(self.predicate(w.call.functor, w.call.arity()), w)
+                elif found:
+                    if t.add(t.call):
+                        self._tableAnswers += 1
+                else:
+                    t.solver.trail.undo(0)
+                    t.solver = None
+        except:
+            while len(stack) > bottom:
+                t = stack.pop()
+                t.depth = None
+                t.clauses = t.solver = t.predicate = None
+            raise
+
+    def enterTable(self, p, table):
+        """Pushes a table on the stack of tables under evaluation and
+        starts its first pass.
+
+        Args:
+            p (Predicate): the tabled predicate
+            table (AnswerTable): the table of the call
+        """
+        table.depth = table.leader = len(self._tableStack)
+        table.sccStart = len(self._tableScc)
+        table.predicate = p
+        self._tableStack.append(table)
+        self.tablePass(table)
+
+    def tablePass(self, table):
+        """Starts a pass of a table's call over the clauses of the
+        tabled predicate.
+
+        Args:
+            table (AnswerTable): the table of the call
+        """
+        table.before = self._tableAnswers
+        table.clauses = iter(table.predicate.axioms(table.call))
+
+    def tableClause(self, table):
+        """Starts a solver for the body of the next clause of a table's
+        pass whose head unifies with the table's call.
+
+        Args:
+            table (AnswerTable): the table of the call
+
+        Returns:
+            boolean: False if the pass has no clauses left
+        """
+        for a in table.clauses:
+            aCopy = a.dynamicAxiom(self)
+            body = aCopy.structures[1:] if isinstance(aCopy, Rule) else []
+            solver = Solver(self, body)
+            solver.suspendable = True
+            if solver.unify(aCopy.head(), table.call):
+                table.solver = solver
+                return True
+            solver.trail.undo(0)
+        return False
+
+    def leaveTable(self, table):
+        """Pops a table whose passes are done from the stack of tables
+        under evaluation. The table completes, with the tables that
+        depend on it, unless it depends on an older table still on
+        the stack.
+
+        Args:
+            table (AnswerTable): the table of the call
+        """
+        stack = self._tableStack
+        stack.pop()
+        table.depth = None
+        table.clauses = table.predicate = None
+        if table.leader < len(stack):
+            stack[-1].leader = min(stack[-1].leader, table.leader)
+            self._tableScc.append(table)
+        else:
+            while len(self._tableScc) > table.sccStart:
+                self._tableScc.pop().complete = True
+            table.complete = True
+
+    def clearTables(self):
+        """Discards the answer tables of this program. A program
+        clears its tables when it gets a new axiom.
+        """
+        with self._tableLock:
+            self._tables = {}
+            self._tableScc = []
+
+    def tables(self):
+        """Returns the answer tables of this program.
+
+        Returns:
+            AnswerTable[]: the answer tables of this program
+        """
+        return list(self._tables.values())
+
+    def tableStatistics(self):
+        """Returns the number of tables, of complete tables and of
+        answers, and an estimate of the memory the answers use.
+
+        Returns:
+            dict: the table statistics, keyed by "tables", "complete",
+                "answers" and "bytes"
+        """
+        tables = self._tables.values()
+        return {
+            "tables": len(tables),
+            "complete": sum(1 for t in tables if t.complete),
+            "answers": sum(len(t.answers) for t in tables),
+            "bytes": sum(t.bytes for t in tables),
+        }
+
+    def predicate(self, functor, arity):
+        """Returns the predicate with the given functor and arity.
+
+        Args:
+            functor (Object): the functor of the predicate
+            arity (int): the number of terms of the predicate
+
+        Returns:
+            Predicate: the predicate, or None if this program has no
+                clauses for it
+        """
+        return self._predicates.get((functor, arity))
+
+    def predicates(self):
+        """Returns the predicates of this program, which show the 
+        indexes each predicate has built and how often each index
+        has been used.
+
+        Returns:
+            Predicate[]: the predicates of this program
+        """
+        return list(self._predicates.values())
+    
+    def __str__(self):
+        """Returns a string representation of this program. 
+
+        Returns:
+            str: a string representation of this program.
+        """        
+        buf = str()
+        haveShownALine = False
+        for e in self.axioms():
+            if haveShownALine:
+                buf += "\n"
+            buf += e.__str__()
+            buf += ";"
+            haveShownALine = True
+        return buf
+
+class Query(DynamicRule):
+    """A Query is a dynamic rule that stands outside of a program 
+    and proves itself by referring to a program.
+    """    
+    def __init__(self, _as, *args):
+        """Create a query from the given structures, to prove itself
+        against the given axiom source.
+
+        Args:
+            _as (AxiomSource): _description_
+            args = structures: the structures to prove
+            args = Rule: he rule that contains structures to prove            
+        """        
+        self._tail = None
+        if len(args) == 1:
+            if isinstance(args[0], Rule):
+                rule = args[0]
+                scope = Scope(rule.structures)
+                structures = rule.structures
+            else:
+                if isinstance(args[0], Structure):
+                    structures = [args[0]]
+                else:
+                    structures = args[0]
+                scope = Scope(structures)
+        elif len(args) == 2:
+            scope = args[0]
+            structures = args[1]
+        super().__init__(_as, scope, super().provableStructures(_as, scope, structures))
+    
+    def __str__(self):
+        """Returns a string representation of this query. 
+
+        Returns:
+            str: a string representation of this query.
+        """        
+        buf = str("")
+        for i in range(len(self.structures)):
+            if i > 0:
+                buf += ", "
+            buf += self.structures[i].__str__()
+        return buf
+    
+class Solver:
+    """A Solver proves a query against an axiom source, like a Query
+    does, but it keeps the goals left to prove and the choicepoints to
+    backtrack to on explicit stacks instead of on Python's stack.
+
+    The goals form a linked list of frames (goal, depth, next). To 
+    prove a goal, the solver replaces the goal's frame with the goals
+    in the body of the clause that the goal unifies with. The last 
+    goal of a body thus runs in the place of its parent, and a tail
+    recursive predicate does not grow the list. The solver only pushes
+    a choicepoint when a goal has clauses left to try, and it only 
+    trails bindings of variables older than its newest choicepoint,
+    so a deterministic recursion runs in constant memory.
+
+    A cut removes the choicepoints pushed since the goal whose clause
+    holds the cut was called, and tidies the trail of the bindings 
+    that only those choicepoints needed.
+
+    Gateways other than evaluations, negations, cuts and onces prove
+    themselves with canProveOnce(). A gateway that binds variables 
+    must bind them on the solver's trail.
+
+    A program proves the clauses of a tabled predicate with solvers
+    that are suspendable. When such a solver calls a table that the
+    program must evaluate first, it stops with the call as its next
+    goal and waits for the table, and its program resumes it later.
+    """
+    def __init__(self, _as, *args):
+        """Create a solver for the given structures, to prove them
+        against the given axiom source.
+
+        Args:
+            _as (AxiomSource): where to find axioms to prove against
+            args = structures: the structures to prove
+            args = Rule: the rule that contains structures to prove
+        """
+        if isinstance(args[0], Rule):
+            structures = args[0].structures
+        elif isinstance(args[0], Structure):
+            structures = [args[0]]
+        else:
+            structures = list(args[0])
+        self._as = _as
+        self.structures = structures
+        self.trail = Trail()
+        self.inferences = 0
+        self._choicepoints = []
+        self._goals = None
+        self._started = False
+        self.suspendable = False
+        self.waiting = None
+        self._done = not self.shareVariables()
+        self._base = self.trail.mark()
+        self.trail.boundary = next(Variable._ids)
+
+    def shareVariables(self):
+        """Collects the variables of the structures, in the order they
+        first appear, and unifies each later variable of the same name
+        with the first one. A parser creates a new variable for each 
+        appearance of a name in a query, and these must act as one.
+
+        Returns:
+            boolean: False if two variables of the same name are bound
+                to terms that do not unify
+        """
+        self._variables = {}
+        terms = list(reversed(self.structures))
+        while len(terms) > 0:
+            t = terms.pop()
+            if isinstance(t, Anonymous):
+                continue
+            if isinstance(t, Variable):
+                first = self._variables.setdefault(t.name, t)
+                if first is not t and not self.unify(t, first):
+                    return False
+            elif isinstance(t, Structure):
+                terms.extend(reversed(t.terms))
+        return True
+
+    def canFindNextProof(self):
+        """Returns true if the solver can find a next proof of its 
+        structures. The first call starts the proof; each later call
+        backtracks into the last proof, or resumes the proof if the 
+        solver was waiting for a table.
+
+        Returns:
+            boolean: True if the solver can find a next proof, or None
+                if it waits for a table
+        """
+        if self._done:
+            return False
+        if self.waiting != None:
+            found = self.run()
+        elif not self._started:
+            self._started = True
+            for i in range(len(self.structures) - 1, -1, -1):
+                self._goals = (self.structures[i], 0, self._goals)
+            found = self.run()
+        else:
+            found = self.backtrack() and self.run()
+        if found == None:
+            return None
+        if not found:
+            self._done = True
+            self.trail.undo(self._base)
+        return found
+
+    def run(self):
+        """Proves the current goals, backtracking as necessary.
+
+        Returns:
+            boolean: True if the goals are proven, False if there are 
+                no choicepoints left to backtrack to, or None if the
+                solver waits for a table
+        """
+        while self._goals != None:
+            goal, depth, rest = self._goals
+            if isinstance(goal, Cut):
+                self.cut(depth)
+                proven = True
+            elif isinstance(goal, ConsultingOnce) or isinstance(goal, Once):
+                s = goal.consultingStructure if isinstance(goal, ConsultingOnce) else Structure(goal.functor, goal.terms)
+                d = len(self._choicepoints)
+                self._goals = (s, d, (Cut(), d, rest))
+                continue
+            elif isinstance(goal, ConsultingNot) or isinstance(goal, Not):
+                s = goal.consultingStructure if isinstance(goal, ConsultingNot) else Structure(goal.functor, goal.terms)
+                proven = self.succeeds(s)
+                if proven == None:
+                    return None
+                proven = not proven
+            elif isinstance(goal, Evaluation):
+                try:
+                    proven = self.unify(goal.term0, Atom(goal.term1.eval()))
+                except:
+                    proven = False
+            elif isinstance(goal, Gateway):
+                proven = goal.canProveOnce()
+            else:
+                join = HashJoin.gather(self._as, goal, rest)
+                if join != None:
+                    proven = self.joinRows(join, None, join.rows(), 
+                        join.rest, len(self._choicepoints))
+                else:
+                    alternatives, rest = self.candidates(goal, rest)
+                    if alternatives == None:
+                        return None
+                    proven = self.resolve(goal, None, alternatives, 
+                        rest, len(self._choicepoints))
+                if proven:
+                    continue
+            if proven:
+                self._goals = rest
+            elif not self.backtrack():
+                return False
+        return True
+
+    def candidates(self, goal, rest):
+        """Returns the axioms to try for a goal and the goals to prove
+        after it. A goal on a columnar predicate takes along the 
+        comparisons that directly follow it and compare one of its
+        variables with a value, so that the predicate filters its 
+        rows by them and the solver need not prove them.
+
+        Args:
+            goal (Structure): the goal to prove
+            rest (tuple): the goals that follow the goal
+
+        Returns:
+            tuple: an iterator of axioms, or None if the solver must 
+                wait for a table, and the goals that follow
+        """
+        if isinstance(self._as, Program):
+            p = self._as.predicate(goal.functor, goal.arity())
+            if p != None and p.tabled and self.suspendable:
+                return self._as.tableAnswers(p, goal, self), rest
+            if p != None and p.columnar and not p.tabled:
+                comparisons = []
+                while rest != None and isinstance(rest[0], Comparison):
+                    c = Solver.pushdown(goal, rest[0])
+                    if c == None:
+                        break
+                    comparisons.append(c)
+                    rest = rest[2]
+                if len(comparisons) > 0:
+                    return iter(p.axioms(goal, comparisons)), rest
+        return iter(self._as.axioms(goal)), rest
+
+    @classmethod
+    def pushdown(cls, goal, comparison):
+        """Returns a comparison as a test of one of a goal's arguments,
+        if it compares a variable of the goal with a ground term.
+
+        Args:
+            goal (Structure): the goal
+            comparison (Comparison): the comparison
+
+        Returns:
+            tuple: the position of the argument, the operator with the
+                argument on its left, and the value to compare with, 
+                or None
+        """
+        flipped = {">": "<", "<": ">", ">=": "<=", "<=": ">=", "=": "=", "!=": "!="}
+        operator = comparison.operator
+        if operator not in flipped:
+            return None
+        t0 = comparison.term0
+        t1 = comparison.term1
+        while isinstance(t0, Variable) and t0.instantiation != None:
+            t0 = t0.instantiation
+        while isinstance(t1, Variable) and t1.instantiation != None:
+            t1 = t1.instantiation
+        if not isinstance(t0, Variable) or isinstance(t0, Anonymous):
+            t0, t1 = t1, t0
+            operator = flipped[operator]
+        if not isinstance(t0, Variable) or isinstance(t0, Anonymous) or not HashJoin.isGround(t1):
+            return None
+        for i, t in enumerate(goal.terms):
+            while isinstance(t, Variable) and t.instantiation != None:
+                t = t.instantiation
+            if t is t0:
+                try:
+                    return (i, operator, t1.eval())
+                except:
+                    return None
+        return None
+
+    def resolve(self, goal, a, alternatives, rest, depth):
+        """Unifies a goal with the first axiom, from the given one and
+        then the alternatives, whose head unifies with it. Pushes a 
+        choicepoint if there are more alternatives to try, and 
+        replaces the goal with the body of the axiom.
+
+        Args:
+            goal (Structure): the goal to prove
+            a (Axiom): the axiom to try first, or None
+            alternatives (iterator): the axioms to try after it
+            rest (tuple): the goals that follow the goal
+            depth (int): the number of choicepoints below the goal's
+
+        Returns:
+            boolean: True if an axiom unifies with the goal
+        """
+        trail = self.trail
+        if a == None:
+            a = next(alternatives, None)
+        while a != None:
+            following = next(alternatives, None)
+            mark = trail.mark()
+            if following != None:
+                self._choicepoints.append(
+                    (goal, following, alternatives, rest, mark, depth, trail.boundary))
+                trail.boundary = next(Variable._ids)
+            self.inferences += 1
+            aCopy = a.dynamicAxiom(self._as, trail)
+            if self.unify(aCopy.head(), goal):
+                goals = rest
+                if isinstance(aCopy, Rule):
+                    structures = aCopy.structures
+                    for i in range(len(structures) - 1, 0, -1):
+                        goals = (structures[i], depth, goals)
+                self._goals = goals
+                return True
+            trail.undo(mark)
+            if following != None:
+                trail.boundary = self._choicepoints.pop()[6]
+            a = following
+        return False
+
+    def backtrack(self):
+        """Resumes the newest choicepoint that still has an axiom that
+        unifies with its goal.
+
+        Returns:
+            boolean: False if no choicepoint is left
+        """
+        while len(self._choicepoints) > 0:
+            goal, a, alternatives, rest, mark, depth, boundary = self._choicepoints.pop()
+            self.trail.undo(mark)
+            self.trail.boundary = boundary
+            if isinstance(goal, HashJoin):
+                if self.joinRows(goal, a, alternatives, rest, depth):
+                    return True
+            elif self.resolve(goal, a, alternatives, rest, depth):
+                return True
+        return False
+
+    def joinRows(self, join, row, rows, rest, depth):
+        """Binds the variables of a hash join to the values of the
+        given row, or else of the next of its rows, pushing a 
+        choicepoint if more rows follow.
+
+        Args:
+            join (HashJoin): the join
+            row (tuple): the row to bind first, or None
+            rows (iterator): the rows to bind after it
+            rest (tuple): the goals that follow the join
+            depth (int): the number of choicepoints below the join's
+
+        Returns:
+            boolean: True if the join has a row
+        """
+        trail = self.trail
+        if row == None:
+            row = next(rows, None)
+            if row == None:
+                return False
+        following = next(rows, None)
+        if following != None:
+            self._choicepoints.append(
+                (join, following, rows, rest, trail.mark(), depth, trail.boundary))
+            trail.boundary = next(Variable._ids)
+        self.inferences += 1
+        for v, value in zip(join.variables, row[0]):
+            trail.bind(v, value)
+        self._goals = rest
+        return True
+
+    def cut(self, depth):
+        """Removes the choicepoints above the given depth.
+
+        Args:
+            depth (int): the number of choicepoints to keep
+        """
+        choicepoints = self._choicepoints
+        if depth < len(choicepoints):
+            boundary = choicepoints[depth][6]
+            mark = choicepoints[depth][4]
+            del choicepoints[depth:]
+            self.trail.boundary = boundary
+            self.trail.tidy(mark)
+
+    def succeeds(self, s):
+        """Returns true if there is any way to prove the given 
+        structure, leaving no bindings behind.
+
+        Args:
+            s (Structure): the structure to prove
+
+        Returns:
+            boolean: True if the structure can be proven, or None if
+                the solver waits for a table
+        """
+        saved = (self._goals, self._choicepoints, self.trail.boundary)
+        mark = self.trail.mark()
+        self.trail.boundary = next(Variable._ids)
+        self._goals = (s, 0, None)
+        self._choicepoints = []
+        proven = self.run()
+        self.trail.undo(mark)
+        self._goals, self._choicepoints, self.trail.boundary = saved
+        return proven
+
+    def unify(self, a, b):
+        """Unifies two terms without recursion, binding variables the
+        way a.unify(b) would.
+
+        Args:
+            a (Term): a term to unify
+            b (Term): a term to unify
+
+        Returns:
+            boolean: True if the terms unify
+        """
+        trail = self.trail
+        pairs = [(a, b)]
+        while len(pairs) > 0:
+            a, b = pairs.pop()
+            if isinstance(a, Variable):
+                if isinstance(a, Anonymous) or a is b:
+                    continue
+                if a.instantiation != None:
+                    pairs.append((a.instantiation, b))
+                elif isinstance(b, Variable) and b.instantiation != None:
+                    pairs.append((b.instantiation, a))
+                else:
+                    trail.bind(a, b)
+            elif isinstance(b, Variable):
+                pairs.append((b, a))
+            elif not a.functorAndArityEquals(b):
+                return False
+            else:
+                for i in range(len(a.terms) - 1, -1, -1):
+                    pairs.append((a.terms[i], b.terms[i]))
+        return True
+
+    def variables(self):
+        """Returns the variables of the structures, by name.
+
+        Returns:
+            Unification: the variables of the structures
+        """
+        u = Unification()
+        for v in self._variables.values():
+            u.addVariable(v)
+        return u
+
+    def bindings(self):
+        """Returns the values of the variables of the structures in
+        the current proof, converted to Python values.
+
+        Returns:
+            dict: the value of each variable, by name
+        """
+        return {name: Solver.pythonValue(v) for name, v in self._variables.items()}
+
+    @classmethod
+    def pythonValue(cls, t):
+        """Converts a term to a Python value. An atom becomes its 
+        functor, a list becomes a list, another structure becomes a
+        tuple of its functor and the values of its terms, and an 
+        unbound variable becomes None.
+
+        Args:
+            t (Term): the term to convert
+
+        Returns:
+            Object: the Python value of the term
+        """
+        while isinstance(t, Variable) and t.instantiation != None:
+            t = t.instantiation
+        if isinstance(t, Variable):
+            return None
+        if isinstance(t, EmptyList):
+            return []
+        if len(t.terms) == 0:
+            return t.functor
+        elements = []
+        u = t
+        while isinstance(u, Structure) and u.functor == "." and len(u.terms) == 2:
+            elements.append(u.terms[0])
+            u = u.terms[1]
+            while isinstance(u, Variable) and u.instantiation != None:
+                u = u.instantiation
+        if isinstance(u, EmptyList) and len(elements) > 0:
+            return [cls.pythonValue(e) for e in elements]
+        return (t.functor,) + tuple(cls.pythonValue(u) for u in t.terms)
+
+    def __str__(self):
+        """Returns a string representation of this solver's query.
+
+        Returns:
+            str: a string representation of the query
+        """
+        return ", ".join(s.__str__() for s in self.structures)
+
+class HashJoin:
+    """A HashJoin proves a run of consecutive goals on predicates that
+    hold only ground facts, set at a time. It reads the facts of each
+    goal once, hashes the facts of every goal after the first on the 
+    variables that the earlier goals bind, and streams the rows of 
+    the first goal through those tables. A solver then binds the 
+    variables of the run to each joined row in turn, which takes 
+    time proportional to the facts and the rows instead of to the
+    product of the relations.
+
+    A run becomes a join only if the indexes of its predicates 
+    estimate that nested, indexed resolution would try more than
+    costFactor times as many facts as the join reads. The join 
+    builds the table of a goal when the first row reaches it, and
+    a predicate keeps the tables of goals with no constants until 
+    its clauses change, for the next entry into the same rule body.
+    Columnar predicates do not take part in joins.
+
+    The rows come in the order that nested resolution would find 
+    them.
+    """
+    costFactor = 2
+    def __init__(self, program, goals, rest):
+        """Create a join of the given goals.
+
+        Args:
+            program (Program): the program that holds the facts
+            goals (Structure[]): the goals to join
+            rest (tuple): the goals that follow the run
+        """
+        self.program = program
+        self.goals = goals
+        self.rest = rest
+        self.variables = []
+        self.patterns = None
+        slots = {}
+        patterns = []
+        for g in goals:
+            pattern = []
+            for t in g.terms:
+                while isinstance(t, Variable) and t.instantiation != None:
+                    t = t.instantiation
+                if isinstance(t, Anonymous):
+                    pattern.append(None)
+                elif isinstance(t, Variable):
+                    slot = slots.get(id(t))
+                    if slot == None:
+                        slot = slots[id(t)] = len(self.variables)
+                        self.variables.append(t)
+                    pattern.append(slot)
+                elif HashJoin.isGround(t):
+                    pattern.append(t)
+                else:
+                    return
+            patterns.append(pattern)
+        self.patterns = patterns
+
+    @classmethod
+    def gather(cls, _as, goal, rest):
+        """Returns a join of the goal and the goals that follow it, if
+        they form a run of at least two goals on fact predicates 
+        whose terms are variables or ground.
+
+        Args:
+            _as (AxiomSource): the source the solver consults
+            goal (Structure): the goal to prove
+            rest (tuple): the goals that follow it
+
+        Returns:
+            HashJoin: the join, or None
+        """
+        if not isinstance(_as, Program) or not cls.joinable(_as, goal):
+            return None
+        goals = [goal]
+        while rest != None and cls.joinable(_as, rest[0]):
+            goals.append(rest[0])
+            rest = rest[2]
+        if len(goals) < 2:
+            return None
+        join = cls(_as, goals, rest)
+        if join.patterns == None or not join.worthwhile():
+            return None
+        return join
+
+    @classmethod
+    def joinable(cls, program, goal):
+        """Returns true if a goal is a structure on a predicate whose
+        clauses are all ground facts, and that is not columnar.
+
+        Args:
+            program (Program): the program
+            goal (Structure): the goal
+
+        Returns:
+            boolean: True if the goal can take part in a join
+        """
+        if not isinstance(goal, Structure) or isinstance(goal, (Gateway, Not, Once)):
+            return False
+        p = program.predicate(goal.functor, goal.arity())
+        return p != None and p.facts and not p.tabled and not p.columnar
+
+    def worthwhile(self):
+        """Returns true if the join should read fewer facts than 
+        nested resolution would try, by the estimates of the goals'
+        predicates.
+
+        Returns:
+            boolean: True if the join is worth building
+        """
+        seen = set()
+        rows = 1
+        nested = 0
+        joined = 0
+        for goal, pattern in zip(self.goals, self.patterns):
+            p = self.program.predicate(goal.functor, goal.arity())
+            bound = {j for j, slot in enumerate(pattern) if isinstance(slot, int) and slot in seen}
+            seen.update(slot for slot in pattern if isinstance(slot, int))
+            candidates = max(1, p.estimate(goal, bound))
+            nested += rows * candidates
+            rows *= candidates
+            joined += p.estimate(goal)
+        return joined * HashJoin.costFactor < nested
+
+    @classmethod
+    def isGround(cls, t):
+        """Returns true if a term has no unbound variables.
+
+        Args:
+            t (Term): the term
+
+        Returns:
+            boolean: True if the term is ground
+        """
+        terms = [t]
+        while len(terms) > 0:
+            t = terms.pop()
+            while isinstance(t, Variable) and t.instantiation != None:
+                t = t.instantiation
+            if isinstance(t, Variable):
+                return False
+            terms.extend(t.terms)
+        return True
+
+    @classmethod
+    def key(cls, t):
+        """Returns a hashable key that is equal for ground terms that
+        unify.
+
+        Args:
+            t (Term): a ground term
+
+        Returns:
+            Object: the key of the term
+        """
+        while isinstance(t, Variable):
+            t = t.instantiation
+        if len(t.terms) == 0:
+            return t.functor
+        return AnswerTable.variant(t)[0]
+
+    def matches(self, i):
+        """Returns the values and keys that the facts matching the
+        given goal give to the goal's variables.
+
+        Args:
+            i (int): the position of the goal in the join
+
+        Returns:
+            list: a list of pairs of a dict of values by variable slot,
+                and a dict of keys by slot
+        """
+        goal = self.goals[i]
+        pattern = self.patterns[i]
+        constants = [(j, HashJoin.key(p)) for j, p in enumerate(pattern) 
+            if p != None and not isinstance(p, int)]
+        matches = []
+        for a in self.program.predicate(goal.functor, goal.arity()).axioms(goal):
+            terms = a.head().terms
+            if any(HashJoin.key(terms[j]) != k for j, k in constants):
+                continue
+            values = {}
+            keys = {}
+            for j, slot in enumerate(pattern):
+                if not isinstance(slot, int):
+                    continue
+                k = HashJoin.key(terms[j])
+                if slot in keys:
+                    if keys[slot] != k:
+                        break
+                else:
+                    values[slot] = terms[j]
+                    keys[slot] = k
+            else:
+                matches.append((values, keys))
+        return matches
+
+    def rows(self):
+        """Returns the joined rows, lazily. A row is a pair of a tuple
+        of values and a tuple of their keys, by variable slot.
+
+        Returns:
+            iterator: the rows of the join
+        """
+        seen = set()
+        n = len(self.variables)
+        stream = None
+        for i in range(len(self.goals)):
+            slots = sorted(set(s for s in self.patterns[i] if isinstance(s, int)))
+            shared = [s for s in slots if s in seen]
+            fresh = [s for s in slots if s not in seen]
+            seen.update(slots)
+            if stream == None:
+                stream = self.scan(i, fresh, n)
+            else:
+                stream = self.probe(stream, i, shared, fresh)
+        return stream
+
+    def table(self, i, shared, fresh):
+        """Returns the matches of a goal, hashed by the keys of the 
+        slots that earlier goals bind. A goal with no constants takes
+        the table its predicate keeps for the same pattern, or builds
+        it and leaves it with the predicate.
+
+        Args:
+            i (int): the position of the goal in the join
+            shared (int[]): the slots earlier goals bind
+            fresh (int[]): the slots this goal binds first
+
+        Returns:
+            dict: lists of the values and keys of the fresh slots, by
+                the keys of the shared slots
+        """
+        pattern = self.patterns[i]
+        shape = None
+        if all(p == None or isinstance(p, int) for p in pattern):
+            position = {}
+            for j, p in enumerate(pattern):
+                if p != None:
+                    position.setdefault(p, j)
+            shape = (tuple(None if p == None else position[p] for p in pattern), 
+                tuple(position[s] for s in shared), tuple(position[s] for s in fresh))
+            goal = self.goals[i]
+            predicate = self.program.predicate(goal.functor, goal.arity())
+            tables = predicate.joinTables
+            table = tables.get(shape)
+            if table != None:
+                return table
+        table = {}
+        for values, keys in self.matches(i):
+            table.setdefault(tuple(keys[s] for s in shared), []).append(
+                ([values[s] for s in fresh], [keys[s] for s in fresh]))
+        if shape != None:
+            tables[shape] = table
+        return table
+
+    def scan(self, i, fresh, n):
+        """Yields a row for each match of the first goal.
+
+        Args:
+            i (int): the position of the goal in the join
+            fresh (int[]): the slots the first goal binds
+            n (int): the number of variables in the join
+
+        Yields:
+            tuple: a row of the join, so far
+        """
+        for values, keys in self.matches(i):
+            rowValues = [None] * n
+            rowKeys = [None] * n
+            for s in fresh:
+                rowValues[s] = values[s]
+                rowKeys[s] = keys[s]
+            yield (rowValues, rowKeys)
+
+    def probe(self, stream, i, shared, fresh):
+        """Yields the rows of a stream extended by each match whose
+        shared variables agree with the row, building the table of
+        matches when the first row arrives.
+
+        Args:
+            stream (iterator): the rows so far
+            i (int): the position of the goal in the join
+            shared (int[]): the slots earlier goals bind
+            fresh (int[]): the slots this goal binds first
+
+        Yields:
+            tuple: a row of the join, so far
+        """
+        table = None
+        for rowValues, rowKeys in stream:
+            if table == None:
+                table = self.table(i, shared, fresh)
+            for values, keys in table.get(tuple(rowKeys[s] for s in shared), ()):
+                newValues = list(rowValues)
+                newKeys = list(rowKeys)
+                for s, value, k in zip(fresh, values, keys):
+                    newValues[s] = value
+                    newKeys[s] = k
+                yield (newValues, newKeys)
+
+class Gateway(Structure):
+    """A Gateway is a structure that can prove its truth at most 
+    once before failing. 
+    """    
+    def __init__(self, functor, terms=[]):
+        """Allows subclasses to use this form of constructor. This typically
+        happens when the subclass object is creating an executable copy
+        of itself.
+
+        Args:
+            functor (Object): the functor for this gateway
+            terms (list, optional): the program the gateway will prove itself 
+                against. Defaults to [].
+        """        
+        super().__init__(functor, terms)
+        self.open = False
+    
+    def canFindNextProof(self):
+        """Returns true if the gate is closed and this gateway can find a new 
+        proof.
+
+        A gateway is a structure that can prove itself in at most one 
         way. After a successful proof, a gateway leaves its gate open.
 
         If the gate is open when this method executes, this method will 
@@ -1347,6 +3593,31 @@ class Comparison(Gateway):
             self.operator,
             self.term0.copyForProof(None, scope),
             self.term1.copyForProof(None, scope))
+
+    def compileForProof(self, template, goal=False):
+        """Compiles this comparison into a clause template.
+
+        Args:
+            template (ClauseTemplate): the template to compile into
+            goal (boolean, optional): True if this comparison is a goal
+                in the body of the rule. Defaults to False.
+        """
+        template.compileStructure(self, Comparison, goal)
+
+    @classmethod
+    def fromTemplate(cls, functor, terms, _as, trail):
+        """Creates a comparison for a renamed clause.
+
+        Args:
+            functor (Object): the functor of the structure
+            terms (Term[]): the renamed terms
+            _as (AxiomSource): where to find axioms to prove against
+            trail (Trail): the trail of the proof
+
+        Returns:
+            Term: the new comparison
+        """
+        return cls(functor, terms[0], terms[1])
     
     def eval(self):
         """Returns True if the comparison
@@ -1417,6 +3688,31 @@ class ArithmeticOperator(Structure):
             self.operator,
             self.term0.copyForProof(None, scope),
             self.term1.copyForProof(None, scope))
+
+    def compileForProof(self, template, goal=False):
+        """Compiles this operator into a clause template.
+
+        Args:
+            template (ClauseTemplate): the template to compile into
+            goal (boolean, optional): True if this operator is a goal
+                in the body of the rule. Defaults to False.
+        """
+        template.compileStructure(self, ArithmeticOperator, goal)
+
+    @classmethod
+    def fromTemplate(cls, functor, terms, _as, trail):
+        """Creates an arithmetic operator for a renamed clause.
+
+        Args:
+            functor (Object): the functor of the structure
+            terms (Term[]): the renamed terms
+            _as (AxiomSource): where to find axioms to prove against
+            trail (Trail): the trail of the proof
+
+        Returns:
+            Term: the new arithmetic operator
+        """
+        return cls(functor, terms[0], terms[1])
     
     def eval(self, *args):
         """Returns the result of applying this object's operator 
@@ -1481,6 +3777,31 @@ class Write(Gateway):
         for t in self.terms:
             newTerm.append(t.copyForProof(None, scope))
         return Write(*newTerm)
+
+    def compileForProof(self, template, goal=False):
+        """Compiles this write into a clause template.
+
+        Args:
+            template (ClauseTemplate): the template to compile into
+            goal (boolean, optional): True if this write is a goal
+                in the body of the rule. Defaults to False.
+        """
+        template.compileStructure(self, Write, goal)
+
+    @classmethod
+    def fromTemplate(cls, functor, terms, _as, trail):
+        """Creates a write for a renamed clause.
+
+        Args:
+            functor (Object): the functor of the structure
+            terms (Term[]): the renamed terms
+            _as (AxiomSource): where to find axioms to prove against
+            trail (Trail): the trail of the proof
+
+        Returns:
+            Term: the new write
+        """
+        return cls(*terms)
     
     def eval(self):
         """Return result of write.
@@ -1494,7 +3815,7 @@ class Evaluation(Gateway):
     """An Evaluation unifies a term with the value of 
     another term.
     """    
-    def __init__(self, term0, term1):
+    def __init__(self, term0, term1, trail=None):
         """Constructs an Evaluation that will unify the first term 
         with the second term during proofs.
 
@@ -1502,11 +3823,14 @@ class Evaluation(Gateway):
             term0 (Term): the first term to unify
             term1 (Term): the term whose value should unify 
                 with the first term
+            trail (Trail, optional): the trail of the proof. Defaults
+                to a new trail when the evaluation first proves itself.
         """        
         super().__init__("#", [term0, term1])
         self.term0 = term0
         self.term1 = term1
-        self.currentUnification = None
+        self.trail = trail
+        self.mark = None
     
     def canProveOnce(self):
         """Returns true if this Evaluation can unify its first term 
@@ -1521,8 +3845,10 @@ class Evaluation(Gateway):
             o = self.term1.eval()
         except:
             return False
-        self.currentUnification = self.term0.unify(Atom(o))
-        return self.currentUnification != None
+        if self.trail == None:
+            self.trail = Trail()
+        self.mark = self.trail.mark()
+        return self.term0.unify(Atom(o), self.trail) != None
     
     def cleanup(self):
         """The superclass calls this after the evaluation has
@@ -1545,15 +3871,41 @@ class Evaluation(Gateway):
         """        
         return Evaluation(
             self.term0.copyForProof(None, scope),
-            self.term1.copyForProof(None, scope)
+            self.term1.copyForProof(None, scope),
+            scope.trail
         )
+
+    def compileForProof(self, template, goal=False):
+        """Compiles this evaluation into a clause template.
+
+        Args:
+            template (ClauseTemplate): the template to compile into
+            goal (boolean, optional): True if this evaluation is a goal
+                in the body of the rule. Defaults to False.
+        """
+        template.compileStructure(self, Evaluation, goal)
+
+    @classmethod
+    def fromTemplate(cls, functor, terms, _as, trail):
+        """Creates an evaluation for a renamed clause.
+
+        Args:
+            functor (Object): the functor of the structure
+            terms (Term[]): the renamed terms
+            _as (AxiomSource): where to find axioms to prove against
+            trail (Trail): the trail of the proof
+
+        Returns:
+            Term: the new evaluation
+        """
+        return cls(terms[0], terms[1], trail)
     
     def unbind(self):
         """Releases the variable bindings that the last unification produced.
         """        
-        if self.currentUnification != None:
-            self.currentUnification.unbind()
-        self.currentUnification = None
+        if self.mark != None:
+            self.trail.undo(self.mark)
+        self.mark = None
 
 class ConsultingNot(Gateway):
     """A ConsultingNot is a Not that has an axiom source to
@@ -1569,6 +3921,21 @@ class ConsultingNot(Gateway):
         super().__init__(consultingStructure.functor, consultingStructure.terms)
         self.consultingStructure = consultingStructure
 
+    @classmethod
+    def fromTemplate(cls, functor, terms, _as, trail):
+        """Creates a consulting not for a renamed clause.
+
+        Args:
+            functor (Object): the functor of the structure
+            terms (Term[]): the renamed terms
+            _as (AxiomSource): where to find axioms to prove against
+            trail (Trail): the trail of the proof
+
+        Returns:
+            Term: the new consulting not
+        """
+        return cls(ConsultingStructure(_as, functor, terms, trail))
+
     def canProveOnce(self):
         """Returns False if there is any way to prove this
         structure.
@@ -1640,7 +4007,17 @@ class Not(Structure):
         newTerms = []
         for t in self.terms:
             newTerms.append(t.copyForProof(_as, scope))
-        return ConsultingNot(ConsultingStructure(_as, self.functor, newTerms))
+        return ConsultingNot(ConsultingStructure(_as, self.functor, newTerms, scope.trail))
+
+    def compileForProof(self, template, goal=False):
+        """Compiles this not into a clause template.
+
+        Args:
+            template (ClauseTemplate): the template to compile into
+            goal (boolean, optional): True if this not is a goal
+                in the body of the rule. Defaults to False.
+        """
+        template.compileStructure(self, ConsultingNot, goal)
     
     def __eq__(self, o):
         """Returns true if the supplied object is an equivalent 
@@ -1671,6 +4048,180 @@ class Not(Structure):
         """        
         return f"not {super().__str__()}"
     
+class Cut(Gateway):
+    """A Cut succeeds once, and commits the rule it appears in to
+    the choices made since the rule's head unified: the structure 
+    that the rule proves stops trying other axioms, and the 
+    structures before the cut are not retried.
+    """
+    def __init__(self):
+        """Constructs a cut.
+        """
+        super().__init__("!", [])
+        self.parent = None
+
+    @classmethod
+    def fromTemplate(cls, functor, terms, _as, trail):
+        """Creates a cut for a renamed clause.
+
+        Args:
+            functor (Object): the functor of the structure
+            terms (Term[]): the renamed terms
+            _as (AxiomSource): where to find axioms to prove against
+            trail (Trail): the trail of the proof
+
+        Returns:
+            Term: the new cut
+        """
+        return cls()
+
+    def canProveOnce(self):
+        """Commits the structure whose resolvent holds this cut.
+
+        Returns:
+            boolean: True
+        """
+        if self.parent != None:
+            self.parent.commit(self)
+        return True
+
+    def copyForProof(self, ignored, ignored2):
+        """Returns a new cut, since each proof of a rule needs its
+        own.
+
+        Args:
+            ignored (AxiomSource): ignored
+            ignored2 (Scope): ignored
+
+        Returns:
+            Term: a new cut
+        """
+        return Cut()
+
+    def compileForProof(self, template, goal=False):
+        """Compiles this cut into a clause template.
+
+        Args:
+            template (ClauseTemplate): the template to compile into
+            goal (boolean, optional): True if this cut is a goal
+                in the body of the rule. Defaults to False.
+        """
+        template.compileStructure(self, Cut, True)
+
+    def __str__(self):
+        """Returns a string description of this cut.
+
+        Returns:
+            str: "!"
+        """
+        return "!"
+
+class ConsultingOnce(Gateway):
+    """A ConsultingOnce is a Once that has an axiom source to
+    consult.
+    """
+    def __init__(self, consultingStructure):
+        """Contructs a ConsultingOnce from the specified consulting
+        structure. This constructor is for use by Once.
+
+        Args:
+            consultingStructure (Structure): the structure to prove
+        """
+        super().__init__(consultingStructure.functor, consultingStructure.terms)
+        self.consultingStructure = consultingStructure
+
+    @classmethod
+    def fromTemplate(cls, functor, terms, _as, trail):
+        """Creates a consulting once for a renamed clause.
+
+        Args:
+            functor (Object): the functor of the structure
+            terms (Term[]): the renamed terms
+            _as (AxiomSource): where to find axioms to prove against
+            trail (Trail): the trail of the proof
+
+        Returns:
+            Term: the new consulting once
+        """
+        return cls(ConsultingStructure(_as, functor, terms, trail))
+
+    def canProveOnce(self):
+        """Returns true if there is a way to prove the structure, 
+        keeping the bindings of the first proof and discarding the
+        search for others.
+
+        Returns:
+            boolean: True if the structure can be proven
+        """
+        cs = self.consultingStructure
+        if not cs.canFindNextProof():
+            return False
+        cs._axioms = iter(())
+        cs.resolvent = None
+        return True
+
+    def cleanup(self):
+        """Unbinds the variables that the proof bound, and sets the
+        axioms to begin again at the beginning.
+        """
+        self.consultingStructure.unbind()
+        self.consultingStructure._axioms = None
+
+    def __str__(self):
+        """Returns a string description of this Once.
+
+        Returns:
+            str: a string description of this Once
+        """
+        return f"once({self.consultingStructure})"
+
+class Once(Structure):
+    """A Once is a structure that proves itself against a program
+    in only its first way.
+    """
+    def __init__(self, s):
+        """Contructs a Once of the given structure.
+
+        Args:
+            s (Structure): the structure to prove once
+        """
+        super().__init__(s.functor, s.terms)
+
+    def copyForProof(self, _as, scope):
+        """Create a ConsultingOnce counterpart that can prove itself.
+
+        Args:
+            _as (AxiomSource): where to find axioms to prove
+                against
+            scope (Scope): the scope to use for variables in the
+                ConsultingStructure
+
+        Returns:
+            Term: ConsultingOnce counterpart that can prove itself
+        """
+        newTerms = []
+        for t in self.terms:
+            newTerms.append(t.copyForProof(_as, scope))
+        return ConsultingOnce(ConsultingStructure(_as, self.functor, newTerms, scope.trail))
+
+    def compileForProof(self, template, goal=False):
+        """Compiles this once into a clause template.
+
+        Args:
+            template (ClauseTemplate): the template to compile into
+            goal (boolean, optional): True if this once is a goal
+                in the body of the rule. Defaults to False.
+        """
+        template.compileStructure(self, ConsultingOnce, goal)
+
+    def __str__(self):
+        """Returns a string description of this Once.
+
+        Returns:
+            str: a string description of this Once
+        """
+        return f"once({super().__str__()})"
+
 class Anonymous(Variable):
     """An anonymous variable unifies successfully with any other 
     term, without binding to the term. 
@@ -1692,6 +4243,16 @@ class Anonymous(Variable):
             Term: this anonymous variable
         """        
         return self
+
+    def compileForProof(self, template, goal=False):
+        """Compiles this anonymous variable into a clause template, as
+        a shared constant.
+
+        Args:
+            template (ClauseTemplate): the template to compile into
+            goal (boolean, optional): ignored
+        """
+        template.emitConstant(self)
     
     def eval(self):
         """Return the value of this anonymous variable to use in
@@ -1703,16 +4264,17 @@ class Anonymous(Variable):
         """        
         return self.name
     
-    def unify(self, ignored):
-        """Returns an empty unification.
+    def unify(self, ignored, trail=None):
+        """Succeeds without binding anything.
 
         Args:
             ignored (Structure): ignored
+            trail (Trail, optional): the trail of the proof
 
         Returns:
-            Unification: A successful, but empty, unification 
+            Trail: the trail, unchanged
         """        
-        return Unification.empty
+        return trail if trail != None else Trail()
     
     def variables(self):
         """Returns an empty unification.
@@ -1720,5 +4282,5 @@ class Anonymous(Variable):
         Returns:
             Unification: an empty unification
         """        
-        return Unification.empty
+        return Unification()
 
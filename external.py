@@ -0,0 +1,354 @@
+# External predicates, whose facts stay in a database and are read
+# as a proof calls for them.
+import operator
+import pathlib
+import sqlite3
+import threading
+from engine import *
+
+class SqliteRows:
+    """SqliteRows presents the rows of an external table as a sequence
+    of facts, reading them from the database when they are asked for.
+    """
+    def __init__(self, predicate):
+        """Create a view of the given predicate's rows.
+
+        Args:
+            predicate (SqlitePredicate): the predicate
+        """
+        self.predicate = predicate
+
+    def __len__(self):
+        """Returns the number of rows.
+
+        Returns:
+            int: the number of rows
+        """
+        p = self.predicate
+        return p.connection().execute(f"SELECT COUNT(*) FROM {p.table}{p.complete}").fetchone()[0]
+
+    def __getitem__(self, i):
+        """Returns the fact of a row.
+
+        Args:
+            i (int): the row number
+
+        Returns:
+            Fact: the fact of the row
+        """
+        if i < 0:
+            i += len(self)
+        p = self.predicate
+        row = p.connection().execute(
+            f"SELECT {p.selection} FROM {p.table}{p.complete} ORDER BY rowid LIMIT 1 OFFSET ?",
+            (i,)).fetchone()
+        if i < 0 or row == None:
+            raise IndexError("external table row out of range")
+        return p.fact(row)
+
+    def __iter__(self):
+        """Returns the facts of the rows.
+
+        Returns:
+            Fact[]: an iteration of facts
+        """
+        return self.predicate.rows(self.predicate.complete, ())
+
+class SqlitePredicate(Predicate):
+    """A SqlitePredicate is a predicate whose facts are the rows of a
+    table in a SQLite database, one argument per column.
+
+    A call becomes a query on the table, with a parameterized WHERE
+    clause that tests the columns of the call's bound arguments, and
+    of the comparisons that a Solver pushes down with the call. The
+    facts stream from the query's cursor as the proof backtracks into
+    them, so only the rows in use are in memory. Each thread opens its
+    own read-only connection to the database, once, and reuses it for
+    all its calls. The facts come in rowid order, so the table must
+    have rowids, as tables do unless made WITHOUT ROWID.
+
+    A row with a NULL in any of the predicate's columns is not a fact:
+    an atom of None would read as an unbound argument, so the
+    predicate skips such rows. SQLite integers are 64 bits, so a call
+    whose bound argument is an integer out of that range fails, and a
+    comparison with such an integer stays out of the query and tests
+    the rows as they come.
+
+    Add an external predicate to a program with Program.addPredicate.
+    The predicate is read only.
+    """
+    columnar = True
+    operators = {">": ">", "<": "<", "=": "=", ">=": ">=", "<=": "<=", "!=": "<>"}
+    functions = {">": operator.gt, "<": operator.lt, "=": operator.eq,
+        ">=": operator.ge, "<=": operator.le, "!=": operator.ne}
+
+    def __init__(self, functor, database, table, columns=None):
+        """Create a predicate over the given table.
+
+        Args:
+            functor (Object): the functor of the predicate
+            database (str): the path of the database file
+            table (str): the name of the table
+            columns (str[], optional): the columns that make the
+                arguments, in order. Defaults to None, for all the
+                table's columns.
+        """
+        self.database = database
+        self._local = threading.local()
+        self.table = SqlitePredicate.quote(table)
+        if columns == None:
+            columns = [row[1] for row in self.connection().execute(
+                f"PRAGMA table_info({self.table})")]
+            if len(columns) == 0:
+                raise Exception(f"{database} has no table {table}")
+        super().__init__(functor, len(columns))
+        self.indexes = {}
+        self.columns = [SqlitePredicate.quote(c) for c in columns]
+        self.selection = ", ".join(self.columns)
+        self.complete = " WHERE " + " AND ".join(f"{c} IS NOT NULL" for c in self.columns) \
+            if len(self.columns) > 0 else ""
+        self.clauses = SqliteRows(self)
+
+    @classmethod
+    def quote(cls, name):
+        """Returns an SQL identifier quoted.
+
+        Args:
+            name (str): the identifier
+
+        Returns:
+            str: the quoted identifier
+        """
+        return '"' + name.replace('"', '""') + '"'
+
+    @classmethod
+    def storageClasses(cls, value):
+        """Returns the SQLite storage classes of the column values
+        that can equal, or compare with, a value, so that a query
+        does not match across types the way SQLite's type affinity
+        would.
+
+        Args:
+            value (Object): the value
+
+        Returns:
+            str: the storage classes, as an SQL list, or None if no
+                column value can match the value
+        """
+        if isinstance(value, str):
+            return "'text'"
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return "'integer', 'real'"
+        return None
+
+    @classmethod
+    def storable(cls, value):
+        """Returns true if SQLite can take a value as a parameter,
+        which an integer cannot if it needs more than 64 bits.
+
+        Args:
+            value (Object): the value
+
+        Returns:
+            boolean: True if the value fits a parameter
+        """
+        return not isinstance(value, int) or -2 ** 63 <= value < 2 ** 63
+
+    def connection(self):
+        """Returns this thread's connection to the database, opening
+        it on the thread's first call.
+
+        Returns:
+            sqlite3.Connection: the connection
+        """
+        c = getattr(self._local, "connection", None)
+        if c == None:
+            c = self._local.connection = sqlite3.connect(
+                pathlib.Path(self.database).resolve().as_uri() + "?mode=ro", uri=True)
+        return c
+
+    def __getstate__(self):
+        """Returns the attributes to pickle, leaving out the
+        connections.
+
+        Returns:
+            dict: the attributes to pickle
+        """
+        state = dict(self.__dict__)
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        """Restores an unpickled predicate, which opens new connections.
+
+        Args:
+            state (dict): the pickled attributes of the predicate
+        """
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def addClause(self, a):
+        """Refuses to add a clause, as an external predicate is read
+        only.
+
+        Args:
+            a (Axiom): the clause
+        """
+        raise Exception(f"{self.functor}/{self.arity} is a read-only external predicate")
+
+    def fact(self, row, atoms=None):
+        """Returns the fact of a row.
+
+        Args:
+            row (tuple): the values of the row
+            atoms (Atom[], optional): atoms to use for the arguments,
+                or None for the arguments to make atoms for. Defaults
+                to None.
+
+        Returns:
+            Fact: the fact of the row
+        """
+        if self.arity == 0:
+            return Fact(self.functor)
+        if atoms == None:
+            return Fact(self.functor, [Atom(v) for v in row])
+        return Fact(self.functor, [Atom(v) if a == None else a for v, a in zip(row, atoms)])
+
+    def rows(self, where, parameters, atoms=None, filters=()):
+        """Yields the facts of the rows that a WHERE clause selects
+        and that pass the given filters.
+
+        Args:
+            where (str): the WHERE clause, or ""
+            parameters (tuple): the parameters of the clause
+            atoms (Atom[], optional): atoms to use for the arguments.
+                Defaults to None.
+            filters (tuple[], optional): comparisons to test each row
+                with, as tuples (position, function, value). Defaults
+                to ().
+
+        Yields:
+            Fact: the fact of a row
+        """
+        cursor = self.connection().execute(
+            f"SELECT {self.selection} FROM {self.table}{where} ORDER BY rowid", parameters)
+        for row in cursor:
+            if all(isinstance(row[i], (int, float)) and f(row[i], value) for i, f, value in filters):
+                yield self.fact(row, atoms)
+
+    def axioms(self, s, comparisons=()):
+        """Returns the facts of the rows that match the bound
+        arguments of the given structure and pass the given
+        comparisons.
+
+        Args:
+            s (Structure): the structure to prove
+            comparisons (tuple[], optional): tests of arguments, as
+                tuples (position, operator, value). Defaults to ().
+
+        Returns:
+            Fact[]: an enumeration of facts
+        """
+        selection = self.where(s, comparisons)
+        if selection == None:
+            return iter(())
+        where, parameters, atoms, filters = selection
+        return self.rows(where, parameters, atoms, filters)
+
+    def ordinals(self, s):
+        """Returns the rowids of the rows whose facts axioms() would
+        return for the given structure, in the same order.
+
+        Args:
+            s (Structure): the structure to prove
+
+        Returns:
+            int[]: an enumeration of rowids
+        """
+        selection = self.where(s)
+        if selection == None:
+            return iter(())
+        where, parameters, atoms, filters = selection
+        cursor = self.connection().execute(
+            f"SELECT rowid FROM {self.table}{where} ORDER BY rowid", parameters)
+        return (row[0] for row in cursor)
+
+    def clause(self, ordinal):
+        """Returns the fact of a row that ordinals() gave.
+
+        Args:
+            ordinal (int): the rowid of the row
+
+        Returns:
+            Fact: the fact of the row
+        """
+        row = self.connection().execute(
+            f"SELECT {self.selection} FROM {self.table} WHERE rowid = ?", (ordinal,)).fetchone()
+        if row == None:
+            raise IndexError(f"{self.table} has no row {ordinal}")
+        return self.fact(row)
+
+    def where(self, s, comparisons=()):
+        """Returns the WHERE clause that selects the rows that match
+        the bound arguments of the given structure and pass the given
+        comparisons.
+
+        Args:
+            s (Structure): the structure to prove
+            comparisons (tuple[], optional): tests of arguments, as
+                tuples (position, operator, value). Defaults to ().
+
+        Returns:
+            tuple: the WHERE clause or "", its parameters, the atoms
+                of the structure's bound arguments, and the comparisons
+                that the clause leaves to test the rows with, or None
+                if no row can match
+        """
+        self.calls += 1
+        tests = [f"{c} IS NOT NULL" for c in self.columns]
+        parameters = []
+        filters = []
+        atoms = [None] * self.arity
+        for i, t in enumerate(s.terms):
+            while isinstance(t, Variable) and t.instantiation != None:
+                t = t.instantiation
+            if isinstance(t, Variable):
+                continue
+            if len(t.terms) > 0:
+                return None
+            self.boundCalls[i] += 1
+            kinds = SqlitePredicate.storageClasses(t.functor)
+            if kinds == None or not SqlitePredicate.storable(t.functor):
+                return None
+            tests.append(f"typeof({self.columns[i]}) IN ({kinds}) AND {self.columns[i]} = ?")
+            parameters.append(t.functor)
+            atoms[i] = t
+        for i, op, value in comparisons:
+            kinds = SqlitePredicate.storageClasses(value)
+            if kinds == None:
+                return None
+            if not SqlitePredicate.storable(value):
+                filters.append((i, SqlitePredicate.functions[op], value))
+                continue
+            tests.append(f"typeof({self.columns[i]}) IN ({kinds}) AND "
+                f"{self.columns[i]} {SqlitePredicate.operators[op]} ?")
+            parameters.append(value)
+        where = " WHERE " + " AND ".join(tests) if len(tests) > 0 else ""
+        return where, tuple(parameters), atoms, tuple(filters)
+
+    def dropIndexes(self):
+        """Discards the call counts. The database keeps the indexes.
+        """
+        self.calls = 0
+        self.boundCalls = [0] * self.arity
+
+    def __str__(self):
+        """Returns a string representation of this predicate.
+
+        Returns:
+            str: a string representation of this predicate
+        """
+        buf = f"{self.functor}/{self.arity}: external {self.table} in {self.database}, {self.calls} calls"
+        if self.tabled:
+            buf += ", tabled"
+        return buf
@@ -0,0 +1,843 @@
+# Columnar storage for predicates that hold many ground facts.
+from array import array
+import bisect
+import math
+import mmap
+import os
+import operator
+import struct
+from engine import *
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class StringPool:
+    """A StringPool interns strings as integer ids, so that a column
+    of strings can hold the ids in a typed array. It also keeps one
+    Atom per id that a proof has asked for.
+    """
+    def __init__(self):
+        """Create an empty pool.
+        """
+        self.ids = {}
+        self.strings = []
+        self.atoms = {}
+
+    def intern(self, s):
+        """Returns the id of a string, adding the string if it is new.
+
+        Args:
+            s (str): the string
+
+        Returns:
+            int: the id of the string
+        """
+        i = self.ids.get(s)
+        if i == None:
+            i = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def id(self, s):
+        """Returns the id of a string.
+
+        Args:
+            s (str): the string
+
+        Returns:
+            int: the id of the string, or None if the pool does not
+                hold it
+        """
+        return self.ids.get(s)
+
+    def atom(self, i):
+        """Returns the atom of the string with the given id.
+
+        Args:
+            i (int): the id of the string
+
+        Returns:
+            Atom: the atom of the string
+        """
+        a = self.atoms.get(i)
+        if a == None:
+            a = self.atoms[i] = Atom(self.strings[i])
+        return a
+
+    def __len__(self):
+        """Returns the number of strings in this pool.
+
+        Returns:
+            int: the number of strings
+        """
+        return len(self.strings)
+
+class Column:
+    """A Column holds one argument of a fact table's rows as a typed
+    array of ints, floats or string ids. On demand, it keeps an index
+    of the row numbers sorted by value, to find the rows with a value
+    by binary search.
+    """
+    typecodes = {int: "q", float: "d", str: "q"}
+
+    def __init__(self, kind):
+        """Create an empty column.
+
+        Args:
+            kind (type): the type of the values, int, float or str
+        """
+        if kind not in Column.typecodes:
+            raise Exception(f"A fact table column cannot hold {kind.__name__} values")
+        self.kind = kind
+        self.typecode = Column.typecodes[kind]
+        self.values = array(self.typecode)
+        self.index = None
+
+    def encode(self, value, pool, add=False):
+        """Returns the code that this column holds for a value.
+
+        Args:
+            value (Object): the value
+            pool (StringPool): the pool of string ids
+            add (boolean, optional): whether to intern a new string.
+                Defaults to False.
+
+        Returns:
+            Object: the code of the value, or None if no row of this
+                column can hold the value
+        """
+        if self.kind == str:
+            if not isinstance(value, str):
+                return None
+            return pool.intern(value) if add else pool.id(value)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        if self.kind == int and (not math.isfinite(value) or value != int(value)):
+            return None
+        return self.kind(value)
+
+    def append(self, code):
+        """Adds a code to the end of this column, and drops the index.
+        Values mapped from a program snapshot become an array first.
+
+        Args:
+            code (Object): the code
+        """
+        if not isinstance(self.values, array):
+            self.values = array(self.typecode, self.values)
+        self.values.append(code)
+        self.index = None
+
+    def __getstate__(self):
+        """Returns the attributes to pickle, with mapped values and
+        index copied into arrays.
+
+        Returns:
+            dict: the attributes to pickle
+        """
+        state = dict(self.__dict__)
+        for name in ("values", "index"):
+            if isinstance(state[name], memoryview):
+                state[name] = array(self.typecode if name == "values" else "q", state[name])
+        return state
+
+    def atom(self, row, pool):
+        """Returns an atom of the value in a row.
+
+        Args:
+            row (int): the row number
+            pool (StringPool): the pool of string ids
+
+        Returns:
+            Atom: the atom of the value
+        """
+        if self.kind == str:
+            return pool.atom(self.values[row])
+        return Atom(self.values[row])
+
+    def rows(self, code):
+        """Returns the numbers of the rows that hold a code, in order,
+        from the index.
+
+        Args:
+            code (Object): the code
+
+        Returns:
+            array: the row numbers
+        """
+        values = self.values
+        lo = bisect.bisect_left(self.index, code, key=values.__getitem__)
+        hi = bisect.bisect_right(self.index, code, lo, key=values.__getitem__)
+        return self.index[lo:hi]
+
+    def scan(self, code):
+        """Returns the numbers of the rows that hold a code, in order,
+        by reading the whole column.
+
+        Args:
+            code (Object): the code
+
+        Returns:
+            Object: an iteration of row numbers
+        """
+        if numpy != None and len(self.values) > 0:
+            view = numpy.frombuffer(self.values, dtype=self.typecode)
+            return numpy.flatnonzero(view == code).tolist()
+        values = self.values
+        return [r for r in range(len(values)) if values[r] == code]
+
+    def comparable(self, value):
+        """Returns true if a comparison can hold between the values of
+        this column and a value, which must both be numbers or both 
+        be strings.
+
+        Args:
+            value (Object): the value to compare with
+
+        Returns:
+            boolean: True if the values are comparable
+        """
+        if self.kind == str:
+            return isinstance(value, str)
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def test(self, op, value, pool):
+        """Returns a function that tells whether the value with a given
+        code passes a comparison.
+
+        Args:
+            op (function): the comparison, from the operator module
+            value (Object): the value to compare with
+            pool (StringPool): the pool of string ids
+
+        Returns:
+            function: a test of a code
+        """
+        if self.kind == str:
+            strings = pool.strings
+            return lambda code: op(strings[code], value)
+        return lambda code: op(code, value)
+
+    def mask(self, op, value, pool):
+        """Returns a NumPy array that tells for each row whether its
+        value passes a comparison. A string column compares each
+        string of the pool once and looks the rows' results up by id.
+
+        Args:
+            op (function): the comparison, from the operator module
+            value (Object): the value to compare with
+            pool (StringPool): the pool of string ids
+
+        Returns:
+            numpy.ndarray: a boolean per row
+        """
+        view = numpy.frombuffer(self.values, dtype=self.typecode)
+        if self.kind == str:
+            passes = numpy.fromiter((op(s, value) for s in pool.strings), 
+                dtype=bool, count=len(pool))
+            return passes[view]
+        return op(view, value)
+
+    def buildIndex(self):
+        """Sorts the row numbers of this column by value, keeping rows
+        with equal values in order.
+        """
+        if numpy != None and len(self.values) > 0:
+            view = numpy.frombuffer(self.values, dtype=self.typecode)
+            order = numpy.argsort(view, kind="stable").astype("q")
+            self.index = array("q", order.tobytes())
+        else:
+            self.index = array("q", sorted(range(len(self.values)), key=self.values.__getitem__))
+
+    def bytes(self):
+        """Returns the memory that the values and the index use.
+
+        Returns:
+            int: a number of bytes
+        """
+        n = len(self.values) * self.values.itemsize
+        if self.index != None:
+            n += len(self.index) * self.index.itemsize
+        return n
+
+class FactTableRows:
+    """FactTableRows presents the rows of a fact table as a sequence
+    of facts, making each fact when it is asked for.
+    """
+    def __init__(self, table):
+        """Create a view of the given table's rows.
+
+        Args:
+            table (FactTable): the table
+        """
+        self.table = table
+
+    def __len__(self):
+        """Returns the number of rows.
+
+        Returns:
+            int: the number of rows
+        """
+        return self.table.size
+
+    def __getitem__(self, i):
+        """Returns the fact of a row.
+
+        Args:
+            i (int): the row number
+
+        Returns:
+            Fact: the fact of the row
+        """
+        if i < 0:
+            i += self.table.size
+        if i < 0 or i >= self.table.size:
+            raise IndexError("fact table row out of range")
+        return self.table.fact(i)
+
+    def __iter__(self):
+        """Returns the facts of the rows, in order.
+
+        Returns:
+            Fact[]: an iteration of facts
+        """
+        return (self.table.fact(i) for i in range(self.table.size))
+
+class FactTable(Predicate):
+    """A FactTable is a predicate that holds ground facts of atoms in
+    columns, one typed array per argument, instead of as Fact objects.
+    Strings go into the columns as ids from a string pool.
+
+    A call compares its bound arguments with the columns directly,
+    and makes a fact only for a row that matches them. A call may
+    also bring comparisons of its arguments with values, which the
+    table applies to the columns as well, with one NumPy mask per
+    comparison when NumPy is installed. Such a fact
+    shares the call's own atoms for the bound arguments and has new
+    atoms only for the values that bind the call's variables. Once
+    calls bind an argument often enough, the table sorts the rows by
+    that argument's column and finds matching rows by binary search.
+    It scans a column with NumPy when NumPy is installed.
+
+    Add a fact table to a program with Program.addPredicate. The
+    program then sends the facts it gets for the predicate to the
+    table.
+    """
+    columnar = True
+    operators = {
+        ">": operator.gt, "<": operator.lt, "=": operator.eq,
+        ">=": operator.ge, "<=": operator.le, "!=": operator.ne,
+    }
+
+    def __init__(self, functor, arity, kinds=None, pool=None):
+        """Create an empty fact table.
+
+        Args:
+            functor (Object): the functor of the predicate
+            arity (int): the number of terms of the predicate
+            kinds (type[], optional): the type of each column, int,
+                float or str. Defaults to None, to take the types of
+                the first row's values.
+            pool (StringPool, optional): the pool of string ids.
+                Defaults to None, for a pool of this table's own.
+        """
+        super().__init__(functor, arity)
+        self.indexes = {}
+        self.pool = pool if pool != None else StringPool()
+        self.columns = None if kinds == None else [Column(k) for k in kinds]
+        self.size = 0
+        self.clauses = FactTableRows(self)
+
+    def addRow(self, values):
+        """Adds a row to the end of this table.
+
+        Args:
+            values (Object[]): the values of the row, as ints, floats,
+                strings or atoms of them
+        """
+        values = [v.functor if isinstance(v, Atom) else v for v in values]
+        if len(values) != self.arity:
+            raise Exception(f"{self.functor}/{self.arity} cannot hold a row of {len(values)} values")
+        if self.columns == None:
+            self.columns = [Column(type(v)) for v in values]
+        codes = []
+        for c, v in zip(self.columns, values):
+            code = c.encode(v, self.pool, True)
+            if code == None:
+                raise Exception(f"A {c.kind.__name__} column of {self.functor}/{self.arity} cannot hold {v!r}")
+            codes.append(code)
+        for c, code in zip(self.columns, codes):
+            c.append(code)
+        self.size += 1
+
+    def addRows(self, rows):
+        """Adds rows to the end of this table.
+
+        Args:
+            rows (Object[][]): an iteration of rows of values
+        """
+        for values in rows:
+            self.addRow(values)
+
+    def addClause(self, a):
+        """Adds a clause to the end of this table. The clause must be
+        a ground fact whose terms are atoms.
+
+        Args:
+            a (Axiom): the clause to add
+        """
+        if not Predicate.isGroundFact(a) or any(len(t.terms) > 0 for t in a.head().terms):
+            raise Exception(f"A fact table holds only facts of atoms, not {a}")
+        self.addRow(a.head().terms)
+
+    def fact(self, row, atoms=None):
+        """Returns the fact of a row.
+
+        Args:
+            row (int): the row number
+            atoms (Atom[], optional): atoms to use for the arguments,
+                or None for the arguments to make atoms for. Defaults
+                to None.
+
+        Returns:
+            Fact: the fact of the row
+        """
+        if self.arity == 0:
+            return Fact(self.functor)
+        terms = []
+        for i, c in enumerate(self.columns):
+            if atoms != None and atoms[i] != None:
+                terms.append(atoms[i])
+            else:
+                terms.append(c.atom(row, self.pool))
+        return Fact(self.functor, terms)
+
+    def axioms(self, s, comparisons=()):
+        """Returns the facts of the rows that match the bound
+        arguments of the given structure and pass the given 
+        comparisons, in row order.
+
+        Args:
+            s (Structure): the structure to prove
+            comparisons (tuple[], optional): tests of arguments, as
+                tuples (position, operator, value). Defaults to ().
+
+        Returns:
+            Fact[]: an enumeration of facts
+        """
+        rows, atoms = self.selectRows(s, comparisons)
+        return (self.fact(r, atoms) for r in rows)
+
+    def ordinals(self, s):
+        """Returns the numbers of the rows whose facts axioms() would
+        return for the given structure, in row order.
+
+        Args:
+            s (Structure): the structure to prove
+
+        Returns:
+            int[]: an enumeration of row numbers
+        """
+        return self.selectRows(s)[0]
+
+    def clause(self, ordinal):
+        """Returns the fact of a row that ordinals() gave.
+
+        Args:
+            ordinal (int): the row number
+
+        Returns:
+            Fact: the fact of the row
+        """
+        return self.fact(ordinal)
+
+    def selectRows(self, s, comparisons=()):
+        """Returns the numbers of the rows that match the bound
+        arguments of the given structure and pass the given 
+        comparisons, in row order.
+
+        Args:
+            s (Structure): the structure to prove
+            comparisons (tuple[], optional): tests of arguments, as
+                tuples (position, operator, value). Defaults to ().
+
+        Returns:
+            tuple: an enumeration of row numbers, and the atoms of
+                the structure's bound arguments, by position
+        """
+        self.calls += 1
+        atoms = [None] * self.arity
+        if self.size == 0:
+            return (), atoms
+        bound = []
+        for i, t in enumerate(s.terms):
+            while isinstance(t, Variable) and t.instantiation != None:
+                t = t.instantiation
+            if isinstance(t, Variable):
+                continue
+            if len(t.terms) > 0:
+                return (), atoms
+            code = self.columns[i].encode(t.functor, self.pool)
+            if code == None:
+                return (), atoms
+            self.boundCalls[i] += 1
+            bound.append((i, code))
+            atoms[i] = t
+        for i, op, value in comparisons:
+            if op not in FactTable.operators or not self.columns[i].comparable(value):
+                return (), atoms
+        if len(bound) == 0 and len(comparisons) == 0:
+            return range(self.size), atoms
+        rows = None
+        for i, code in bound:
+            c = self.columns[i]
+            if c.index == None and self.boundCalls[i] >= Predicate.jitThreshold:
+                c.buildIndex()
+            if c.index != None:
+                candidates = c.rows(code)
+                if rows == None or len(candidates) < len(rows):
+                    rows = candidates
+        if rows == None and numpy != None:
+            mask = None
+            for i, code in bound:
+                c = self.columns[i]
+                m = numpy.frombuffer(c.values, dtype=c.typecode) == code
+                mask = m if mask is None else mask & m
+            for i, op, value in comparisons:
+                m = self.columns[i].mask(FactTable.operators[op], value, self.pool)
+                mask = m if mask is None else mask & m
+            return numpy.flatnonzero(mask).tolist(), atoms
+        if rows == None:
+            rows = self.columns[bound[0][0]].scan(bound[0][1]) if len(bound) > 0 else range(self.size)
+        tests = [(self.columns[i].values, (lambda v, code=code: v == code)) for i, code in bound]
+        tests.extend((self.columns[i].values, self.columns[i].test(FactTable.operators[op], value, self.pool))
+            for i, op, value in comparisons)
+        return (r for r in rows if all(test(values[r]) for values, test in tests)), atoms
+
+    def dropIndexes(self):
+        """Discards the sorted column indexes and the call counts that
+        led to them.
+        """
+        for c in self.columns or []:
+            c.index = None
+        self.calls = 0
+        self.boundCalls = [0] * self.arity
+
+    def bytes(self):
+        """Returns the memory that the columns and their indexes use,
+        not counting the string pool.
+
+        Returns:
+            int: a number of bytes
+        """
+        return sum(c.bytes() for c in self.columns or [])
+
+    def __str__(self):
+        """Returns a string representation of this table and its
+        indexes.
+
+        Returns:
+            str: a string representation of this table
+        """
+        kinds = ", ".join(c.kind.__name__ for c in self.columns or [])
+        buf = f"{self.functor}/{self.arity}: {self.size} rows ({kinds}), {self.calls} calls"
+        if self.tabled:
+            buf += ", tabled"
+        for i, c in enumerate(self.columns or []):
+            if c.index != None:
+                buf += f"\n\targ {i + 1}: sorted"
+        return buf
+
+class MappedStrings:
+    """MappedStrings presents the strings of a fact store as a
+    sequence, decoding each string from the mapped file when it is
+    asked for.
+    """
+    def __init__(self, data, offsets):
+        """Create a view of the given encoded strings.
+
+        Args:
+            data (memoryview): the UTF-8 bytes of the strings
+            offsets (memoryview): where each string starts, and where
+                the last one ends
+        """
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        """Returns the number of strings.
+
+        Returns:
+            int: the number of strings
+        """
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        """Returns a string.
+
+        Args:
+            i (int): the id of the string
+
+        Returns:
+            str: the string
+        """
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def __iter__(self):
+        """Returns the strings, in order.
+
+        Returns:
+            str[]: an iteration of the strings
+        """
+        return (self[i] for i in range(len(self)))
+
+class MappedStringPool(StringPool):
+    """A MappedStringPool is a read-only string pool in a fact store.
+    The store sorts its strings, so the pool finds the id of a string
+    by binary search instead of through a dictionary.
+    """
+    def __init__(self, data, offsets):
+        """Create a pool of the given encoded strings.
+
+        Args:
+            data (memoryview): the UTF-8 bytes of the strings
+            offsets (memoryview): where each string starts, and where
+                the last one ends
+        """
+        self.ids = None
+        self.strings = MappedStrings(data, offsets)
+        self.atoms = {}
+
+    def id(self, s):
+        """Returns the id of a string.
+
+        Args:
+            s (str): the string
+
+        Returns:
+            int: the id of the string, or None if the pool does not
+                hold it
+        """
+        i = bisect.bisect_left(self.strings, s)
+        if i < len(self.strings) and self.strings[i] == s:
+            return i
+        return None
+
+    def intern(self, s):
+        """Returns the id of a string, which the pool must hold.
+
+        Args:
+            s (str): the string
+
+        Returns:
+            int: the id of the string
+        """
+        i = self.id(s)
+        if i == None:
+            raise Exception(f"A mapped string pool cannot add {s!r}")
+        return i
+
+class MappedFactTable(FactTable):
+    """A MappedFactTable is a read-only fact table whose columns and
+    indexes are views of a fact store's mapped file. A pickled mapped
+    table refers to its file, and unpickles by mapping the file 
+    again.
+    """
+    def __init__(self, store, functor, kinds, size, values, indexes):
+        """Create a table over the given views.
+
+        Args:
+            store (FactStore): the store that holds the table
+            functor (str): the functor of the predicate
+            kinds (type[]): the type of each column
+            size (int): the number of rows
+            values (memoryview[]): the values of each column
+            indexes (memoryview[]): the sorted row numbers of each
+                column
+        """
+        super().__init__(functor, len(kinds), kinds, store.pool)
+        self.store = store
+        self.size = size
+        for c, v, index in zip(self.columns, values, indexes):
+            c.values = v
+            c.index = index
+
+    def addRow(self, values):
+        """Refuses to add a row, as a mapped table is read only.
+
+        Args:
+            values (Object[]): the values of the row
+        """
+        raise Exception(f"{self.functor}/{self.arity} is a read-only mapped fact table")
+
+    def dropIndexes(self):
+        """Discards the call counts, keeping the mapped indexes.
+        """
+        self.calls = 0
+        self.boundCalls = [0] * self.arity
+
+    def __reduce__(self):
+        """Returns how to pickle this table, by its store's path.
+
+        Returns:
+            tuple: the function that finds the table, and its
+                arguments
+        """
+        return (FactStore.mappedTable, (self.store.path, self.functor, self.arity))
+
+class FactStore:
+    """A FactStore is a file of fact tables that processes map into
+    memory read only, so that they share one copy of the facts. The
+    file holds the tables' columns as arrays of 8-byte ints or floats,
+    a sorted index of the rows for every column, and one pool of the
+    tables' strings, sorted, whose ids the string columns hold.
+
+    A process maps a file once, however many programs and unpickled
+    tables use it.
+    """
+    magic = b"LGKF"
+    version = 1
+    header = struct.Struct("<4sIQI")
+    tableHeader = struct.Struct("<IQI")
+    kindCodes = {int: b"i", float: b"f", str: b"s"}
+    _stores = {}
+
+    @classmethod
+    def pad(cls, f):
+        """Writes zeros up to the next multiple of 8 bytes.
+
+        Args:
+            f (file): the file
+        """
+        f.write(bytes(-f.tell() % 8))
+
+    @classmethod
+    def save(cls, path, tables):
+        """Writes fact tables to a store file.
+
+        Args:
+            path (str): the path of the file
+            tables (FactTable[]): the tables
+        """
+        strings = set()
+        for t in tables:
+            for c in t.columns or []:
+                if c.kind == str:
+                    strings.update(t.pool.strings[code] for code in set(c.values))
+        strings = sorted(strings)
+        ids = {s: i for i, s in enumerate(strings)}
+        data = [s.encode("utf-8") for s in strings]
+        offsets = array("q", [0])
+        for d in data:
+            offsets.append(offsets[-1] + len(d))
+        with open(path, "wb") as f:
+            f.write(cls.header.pack(cls.magic, cls.version, len(strings), len(tables)))
+            cls.pad(f)
+            f.write(offsets.tobytes())
+            f.write(b"".join(data))
+            cls.pad(f)
+            for t in tables:
+                if not isinstance(t.functor, str):
+                    raise Exception(f"A fact store needs string functors, not {t.functor!r}")
+                functor = t.functor.encode("utf-8")
+                f.write(cls.tableHeader.pack(t.arity, t.size, len(functor)))
+                f.write(functor)
+                f.write(b"".join(cls.kindCodes[c.kind] for c in t.columns or []))
+                cls.pad(f)
+                columns = []
+                for c in t.columns or []:
+                    if c.kind == str:
+                        strings = t.pool.strings
+                        columns.append(array("q", (ids[strings[code]] for code in c.values)))
+                    else:
+                        columns.append(array(c.typecode, c.values))
+                for values in columns:
+                    f.write(values.tobytes())
+                for values in columns:
+                    f.write(array("q", sorted(range(len(values)), key=values.__getitem__)).tobytes())
+
+    @classmethod
+    def open(cls, path):
+        """Returns the store in a file, mapping the file unless this
+        process has mapped it already.
+
+        Args:
+            path (str): the path of the file
+
+        Returns:
+            FactStore: the store
+        """
+        key = os.path.abspath(path)
+        store = cls._stores.get(key)
+        if store == None:
+            store = cls._stores[key] = cls(path)
+        return store
+
+    @classmethod
+    def mappedTable(cls, path, functor, arity):
+        """Returns a table of the store in a file.
+
+        Args:
+            path (str): the path of the file
+            functor (str): the functor of the table
+            arity (int): the arity of the table
+
+        Returns:
+            MappedFactTable: the table
+        """
+        return cls.open(path).tables[(functor, arity)]
+
+    def __init__(self, path):
+        """Map a store file. Use FactStore.open, which maps each file
+        once per process.
+
+        Args:
+            path (str): the path of the file
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self.map)
+        if len(buffer) < FactStore.header.size:
+            raise Exception(f"{path} is not a fact store")
+        magic, version, stringCount, tableCount = FactStore.header.unpack_from(buffer)
+        if magic != FactStore.magic:
+            raise Exception(f"{path} is not a fact store")
+        if version != FactStore.version:
+            raise Exception(f"{path} has fact store version {version}, not {FactStore.version}")
+        at = FactStore.header.size + -FactStore.header.size % 8
+        offsets = buffer[at:at + 8 * (stringCount + 1)].cast("q")
+        at += 8 * (stringCount + 1)
+        self.pool = MappedStringPool(buffer[at:at + offsets[-1]], offsets)
+        at += offsets[-1]
+        at += -at % 8
+        kinds = {v: k for k, v in FactStore.kindCodes.items()}
+        self.tables = {}
+        for _ in range(tableCount):
+            arity, size, length = FactStore.tableHeader.unpack_from(buffer, at)
+            at += FactStore.tableHeader.size
+            functor = str(buffer[at:at + length], "utf-8")
+            at += length
+            columnKinds = [kinds[bytes([b])] for b in buffer[at:at + arity]]
+            at += arity
+            at += -at % 8
+            values = []
+            for k in columnKinds:
+                values.append(buffer[at:at + 8 * size].cast(Column.typecodes[k]))
+                at += 8 * size
+            indexes = []
+            for k in columnKinds:
+                indexes.append(buffer[at:at + 8 * size].cast("q"))
+                at += 8 * size
+            self.tables[(functor, arity)] = MappedFactTable(
+                self, functor, columnKinds, size, values, indexes)
+
+    def install(self, program):
+        """Adds the tables of this store to a program.
+
+        Args:
+            program (Program): the program
+        """
+        for t in self.tables.values():
+            program.addPredicate(t)
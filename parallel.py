@@ -0,0 +1,422 @@
+# Parallel execution of Logikus queries in a pool of worker 
+# processes, each of which holds its own copy of a program.
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import multiprocessing
+import queue
+
+from engine import *
+
+class BranchSource:
+    """A BranchSource is an axiom source that offers a single clause
+    to one goal, and consults a program for every other goal. A 
+    worker proves a query against a branch source to follow one 
+    branch of the query's first choicepoint.
+    """
+    def __init__(self, program, goal, clause):
+        """Create a branch source.
+
+        Args:
+            program (Program): the program to consult
+            goal (Structure): the goal that gets only the clause
+            clause (Axiom): the clause of the branch
+        """
+        self.program = program
+        self.goal = goal
+        self.clause = clause
+
+    def axioms(self, *args):
+        """Returns the clause of the branch for its goal, and the 
+        program's axioms for anything else.
+
+        Args:
+            args = (): all the axioms of the program
+            args = structure: the axioms that may unify with the
+                structure
+
+        Returns:
+            Axiom[]: an enumeration of axioms
+        """
+        if len(args) > 0 and args[0] is self.goal:
+            return iter([self.clause])
+        return self.program.axioms(*args)
+
+class ParallelEngine:
+    """A ParallelEngine proves queries against a program in a pool 
+    of worker processes. The program goes to each worker once, when 
+    the worker starts, and the queries that follow only send their
+    structures.
+
+    solve() splits a query at its first choicepoint: each clause that
+    may prove the first goal is a branch, and the workers prove the 
+    branches independently with a Solver. A worker streams the 
+    solutions of its branch back as dicts of Python values while it
+    proves them, in chunks that grow from one solution to chunkSize,
+    through a bounded queue, so the first solution need not wait for
+    the rest of its branch and a worker stays at most queueSize 
+    chunks ahead of the caller. The solutions come either in the 
+    order of a sequential proof or in the order the workers find 
+    them. A caller that stops early stops the workers, even on 
+    branches that never end.
+
+    solveIndependent() splits a query into groups of goals that share
+    no variables. The workers prove each group once, and the 
+    solutions of the query are the cross product of the solutions of
+    the groups, instead of the sequential proof's re-proving of each
+    later group for every solution of the earlier ones.
+    """
+    _program = None
+    chunkSize = 64
+    queueSize = 16
+    pollInterval = 0.1
+
+    @classmethod
+    def initWorker(cls, program):
+        """Keeps the program of a worker process.
+
+        Args:
+            program (Program): the program to prove queries against
+        """
+        cls._program = program
+
+    @classmethod
+    def solveBranch(cls, structures, ordinal, limit, channel, stop, tag):
+        """Proves a query in a worker, giving its first goal only 
+        one clause of its predicate, and sends the solutions to a
+        queue as it finds them. The last message of the branch has
+        no chunk.
+
+        Args:
+            structures (Structure[]): the structures of the query
+            ordinal (int): the ordinal of the clause in the 
+                predicate of the first goal, from its ordinals()
+            limit (int): the most solutions to find, or None
+            channel (Queue): the queue of (tag, chunk) messages
+            stop (Event): set when the caller wants no more solutions
+            tag (int): the number of the branch
+        """
+        try:
+            program = cls._program
+            first = structures[0]
+            clause = program.predicate(first.functor, first.arity()).clause(ordinal)
+            solver = Solver(BranchSource(program, first, clause), structures)
+            chunk = []
+            size = 1
+            n = 0
+            while (limit == None or n < limit) and solver.canFindNextProof():
+                chunk.append(solver.bindings())
+                n += 1
+                if len(chunk) >= size:
+                    if not cls.send(channel, stop, (tag, chunk)):
+                        return
+                    chunk = []
+                    size = min(2 * size, cls.chunkSize)
+            if len(chunk) > 0:
+                cls.send(channel, stop, (tag, chunk))
+        finally:
+            cls.send(channel, stop, (tag, None))
+
+    @classmethod
+    def send(cls, channel, stop, message):
+        """Puts a message on a bounded queue, waiting while the queue
+        is full, unless the caller stops.
+
+        Args:
+            channel (Queue): the queue
+            stop (Event): set when the caller wants no more solutions
+            message (tuple): the message
+
+        Returns:
+            boolean: True if the message went on the queue
+        """
+        while not stop.is_set():
+            try:
+                channel.put(message, timeout=cls.pollInterval)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    @classmethod
+    def solveGoals(cls, structures, limit):
+        """Proves a query in a worker.
+
+        Args:
+            structures (Structure[]): the structures of the query
+            limit (int): the most solutions to find, or None
+
+        Returns:
+            dict[]: the bindings of each solution
+        """
+        return cls.solutions(Solver(cls._program, structures), limit)
+
+    @classmethod
+    def solutions(cls, solver, limit):
+        """Returns the bindings of the solutions a solver finds.
+
+        Args:
+            solver (Solver): the solver
+            limit (int): the most solutions to find, or None
+
+        Returns:
+            dict[]: the bindings of each solution
+        """
+        solutions = []
+        while (limit == None or len(solutions) < limit) and solver.canFindNextProof():
+            solutions.append(solver.bindings())
+        return solutions
+
+    @classmethod
+    def variableNames(cls, s):
+        """Returns the names of the unbound variables in a structure.
+
+        Args:
+            s (Structure): the structure
+
+        Returns:
+            set: the names of the variables
+        """
+        names = set()
+        terms = [s]
+        while len(terms) > 0:
+            t = terms.pop()
+            while isinstance(t, Variable) and t.instantiation != None:
+                t = t.instantiation
+            if isinstance(t, Anonymous):
+                continue
+            if isinstance(t, Variable):
+                names.add(t.name)
+            else:
+                terms.extend(t.terms)
+        return names
+
+    @classmethod
+    def independentGroups(cls, structures):
+        """Partitions the structures of a query into groups that 
+        share no variables, keeping the structures of each group in 
+        query order.
+
+        Args:
+            structures (Structure[]): the structures of the query
+
+        Returns:
+            Structure[][]: the groups, in the order of their first 
+                structures, or None if the query has a cut or a 
+                write, whose effect depends on the order of the goals
+        """
+        groups = []
+        for i, s in enumerate(structures):
+            if isinstance(s, (Cut, Write)):
+                return None
+            names = cls.variableNames(s)
+            positions = [i]
+            for g in [g for g in groups if g[0] & names]:
+                groups.remove(g)
+                names |= g[0]
+                positions += g[1]
+            groups.append((names, sorted(positions)))
+        groups.sort(key=lambda g: g[1][0])
+        return [[structures[i] for i in g[1]] for g in groups]
+
+    def __init__(self, program, workers=None):
+        """Create an engine whose workers each load the given program.
+
+        Args:
+            program (Program): the program to prove queries against
+            workers (int, optional): the number of worker processes.
+                Defaults to the number of processors.
+        """
+        self.program = program
+        self.executor = ProcessPoolExecutor(
+            workers, initializer=ParallelEngine.initWorker, initargs=(program,))
+        self._manager = None
+
+    def manager(self):
+        """Returns the manager of the queues that carry solutions
+        from the workers, starting it the first time.
+
+        Returns:
+            SyncManager: the manager
+        """
+        if self._manager == None:
+            self._manager = multiprocessing.Manager()
+        return self._manager
+
+    def receive(self, channel, futures, count):
+        """Yields the chunks of solutions that arrive on a queue, 
+        until the given number of branches have finished. Raises the
+        exception of a worker that failed.
+
+        Args:
+            channel (Queue): the queue of (tag, chunk) messages
+            futures (Future[]): the futures of the branches, by tag
+            count (int): the number of branches that send to the queue
+
+        Yields:
+            dict[]: a chunk of solutions
+        """
+        while count > 0:
+            try:
+                tag, chunk = channel.get(timeout=ParallelEngine.pollInterval)
+            except queue.Empty:
+                for f in futures:
+                    if f.done() and f.exception() != None:
+                        raise f.exception()
+                continue
+            if chunk == None:
+                count -= 1
+                futures[tag].result()
+            else:
+                yield chunk
+
+    def structures(self, query):
+        """Returns the structures of a query.
+
+        Args:
+            query: the text of a query, a rule, a structure or a
+                list of structures
+
+        Returns:
+            Structure[]: the structures of the query
+        """
+        if isinstance(query, str):
+            from parser import LogikusFacade, LogikusParser
+            query = LogikusFacade.parse(query, LogikusParser.shared().queryParser, "query")
+        if isinstance(query, Rule):
+            return query.structures
+        if isinstance(query, Structure):
+            return [query]
+        return list(query)
+
+    def branches(self, structures):
+        """Returns the ordinals of the clauses that may prove the 
+        first goal of a query, in their predicate. 
+
+        Args:
+            structures (Structure[]): the structures of the query
+
+        Returns:
+            int[]: the ordinals of the clauses, or None if the first
+                goal does not choose among clauses, or a cut in the 
+                query would cut across branches
+        """
+        first = structures[0]
+        if isinstance(first, (Gateway, Not, Once)):
+            return None
+        if any(isinstance(s, Cut) for s in structures):
+            return None
+        predicate = self.program.predicate(first.functor, first.arity())
+        if predicate == None or predicate.tabled:
+            return None
+        return list(predicate.ordinals(first))
+
+    def solve(self, query, ordered=True, limit=None):
+        """Yields the solutions of a query, proving the branches of 
+        its first choicepoint in the workers. A query that does not
+        branch is proven here.
+
+        Args:
+            query: the text of a query, a rule, a structure or a
+                list of structures
+            ordered (bool, optional): True to yield solutions in the 
+                order of a sequential proof, False to yield solutions
+                as soon as any worker finds them. Defaults to True.
+            limit (int, optional): the most solutions to yield. 
+                Defaults to None, for all of them.
+
+        Yields:
+            dict: the value of each variable of the query, by name
+        """
+        structures = self.structures(query)
+        branches = self.branches(structures)
+        if branches == None or len(branches) < 2:
+            solver = Solver(self.program, structures)
+            n = 0
+            while (limit == None or n < limit) and solver.canFindNextProof():
+                yield solver.bindings()
+                n += 1
+            return
+        manager = self.manager()
+        stop = manager.Event()
+        if ordered:
+            channels = [manager.Queue(ParallelEngine.queueSize) for b in branches]
+        else:
+            channels = [manager.Queue(ParallelEngine.queueSize)] * len(branches)
+        futures = [self.executor.submit(ParallelEngine.solveBranch, structures, b, limit, 
+            channels[i], stop, i) for i, b in enumerate(branches)]
+        if ordered:
+            chunks = itertools.chain.from_iterable(
+                self.receive(c, futures, 1) for c in channels)
+        else:
+            chunks = self.receive(channels[0], futures, len(branches))
+        n = 0
+        try:
+            for chunk in chunks:
+                for solution in chunk:
+                    if n == limit:
+                        return
+                    yield solution
+                    n += 1
+        finally:
+            stop.set()
+            for f in futures:
+                f.cancel()
+
+    def solveIndependent(self, query, limit=None):
+        """Yields the solutions of a query, proving each group of its
+        goals that shares no variables with the others once, in the
+        workers, and combining their solutions. A query whose goals 
+        all depend on each other is solved with solve().
+
+        Args:
+            query: the text of a query, a rule, a structure or a
+                list of structures
+            limit (int, optional): the most solutions to yield. 
+                Defaults to None, for all of them.
+
+        Yields:
+            dict: the value of each variable of the query, by name
+        """
+        structures = self.structures(query)
+        groups = ParallelEngine.independentGroups(structures)
+        if groups == None or len(groups) < 2:
+            yield from self.solve(structures, limit=limit)
+            return
+        futures = [self.executor.submit(ParallelEngine.solveGoals, g, limit) 
+            for g in groups]
+        try:
+            answers = [f.result() for f in futures]
+        finally:
+            for f in futures:
+                f.cancel()
+        n = 0
+        for combination in itertools.product(*answers):
+            if n == limit:
+                return
+            solution = {}
+            for bindings in combination:
+                solution.update(bindings)
+            yield solution
+            n += 1
+
+    def close(self):
+        """Shuts down the worker processes.
+        """
+        if self._manager != None:
+            self._manager.shutdown()
+            self._manager = None
+        self.executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        """Returns this engine, for use in a with statement.
+
+        Returns:
+            ParallelEngine: this engine
+        """
+        return self
+
+    def __exit__(self, *args):
+        """Shuts down the worker processes at the end of a with 
+        statement.
+        """
+        self.close()
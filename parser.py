@@ -95,8 +95,10 @@ class Token:
         if self.sval != None:
             return self.sval
 
+import collections
 import io
 import copy
+import threading
 
 class PushbackReader:
     def __init__(self, s):
@@ -462,9 +464,8 @@ class Tokenizer:
 
 class TokenString:
     def __init__(self, o):
-        if isinstance(o, list):
-            tokens = o
-            self.tokens = tokens
+        if isinstance(o, (list, tuple)):
+            self.tokens = tuple(o)
         else:
             if isinstance(o, str):
                 s = o
@@ -477,7 +478,7 @@ class TokenString:
                 if tok.ttype == Token.TT_EOF:
                     break
                 v.append(tok)
-            self.tokens = copy.copy(v)
+            self.tokens = tuple(v)
 
     def length(self):
         return len(self.tokens)
@@ -515,8 +516,7 @@ class TokenStringSource:
         if len(tokenVector) == 0:
             self.cachedTokenString = None
         else:
-            tokens = copy.deepcopy(tokenVector)
-            self.cachedTokenString = TokenString(tokens)
+            self.cachedTokenString = TokenString(tokenVector)
     
     def nextTokenString(self):
         self.ensureCacheIsLoaded()
@@ -533,24 +533,81 @@ class TokenStringSource:
             v.append(tok)
         return v
 
+class PackratMemo:
+    def __init__(self, limit=100000):
+        self.limit = limit
+        self.table = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def matchAndAssemble(self, p, a):
+        if a.target != None:
+            # a target is copied on every clone and changed in place
+            # by assemblers, so no key can stand for its state
+            out = p.match([a])
+            if p.assembler != None:
+                for b in out:
+                    p.assembler.workOn(b)
+            return out
+        key = (id(p), a.index, id(a._stack))
+        entry = self.table.get(key)
+        if entry != None:
+            self.hits += 1
+            self.table.move_to_end(key)
+            return [b.clone() for b in entry[2]]
+        self.misses += 1
+        out = p.match([a])
+        if p.assembler != None:
+            for b in out:
+                p.assembler.workOn(b)
+        self.table[key] = (p, a._stack, [b.clone() for b in out])
+        if len(self.table) > self.limit:
+            self.table.popitem(last=False)
+            self.evictions += 1
+        return out
+
+    def statistics(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.table),
+        }
+
 class Assembly:
     def __init__(self):
-        self.stack = []
+        self._stack = None
+        self._height = 0
         self.target = None
         self.index = 0
+        self.memo = None
     
     def clone(self):
-        aCopy = copy.deepcopy(self)
+        aCopy = self.__class__.__new__(self.__class__)
+        aCopy.__dict__.update(self.__dict__)
+        if self.target != None:
+            aCopy.target = copy.deepcopy(self.target)
         return aCopy
     
     def elementsConsumed(self):
         return self.index
     
     def elementsRemaining(self):
-        return len(self.stack) - self.elementsConsumed()
+        return self._height - self.elementsConsumed()
     
     def getStack(self):
-        return self.stack
+        v = []
+        node = self._stack
+        while node != None:
+            v.append(node[0])
+            node = node[1]
+        v.reverse()
+        return v
+
+    @property
+    def stack(self):
+        return self.getStack()
     
     def getTarget(self):
         return self.target
@@ -559,16 +616,21 @@ class Assembly:
         return self.elementsConsumed() < self.length()
 
     def pop(self):
-        return self.stack.pop()
+        if self._stack == None:
+            raise IndexError("pop from empty stack")
+        o, self._stack = self._stack
+        self._height -= 1
+        return o
     
     def push(self, o):
-        self.stack.append(o)
+        self._stack = (o, self._stack)
+        self._height += 1
 
     def setTarget(self, target):
         self.target = target
     
     def stackIsEmpty(self):
-        return len(self.stack) == 0
+        return self._stack == None
     
     def __str__(self):
         delimiter = self.defaultDelimiter()
@@ -581,8 +643,10 @@ class Assembly:
             self.index = 0
 
 class TokenAssembly(Assembly):
-    def __init__(self, o):
+    def __init__(self, o, packrat=None):
         super().__init__()
+        if packrat != None:
+            self.memo = PackratMemo(packrat)
         self.tokenString = None
         if isinstance(o, TokenString):
             self.tokenString = o
@@ -629,9 +693,13 @@ class Parser:
         for e in v2:
             v1.append(e)
                 
+    FIRST = "first"
+    LONGEST = "longest"
+
     def __init__(self, *args):
         self.name = None
         self.assembler = None
+        self.commit = None
         if len(args) == 1:
             self.name = args[0]
 
@@ -666,11 +734,7 @@ class Parser:
         return None
     
     def elementClone(self, v):
-        #copy = []
-        #for a in v:
-        #    copy.append(a.clone())
-        #return copy
-        return copy.deepcopy(v)
+        return [a.clone() for a in v]
         
     
     def getName(self):
@@ -680,11 +744,20 @@ class Parser:
     #    pass
 
     def matchAndAssemble(self, _in):
+        memo = _in[0].memo if len(_in) > 0 else None
+        if memo != None and self.memoizable():
+            out = []
+            for a in _in:
+                Parser.add(out, memo.matchAndAssemble(self, a))
+            return out
         out = self.match(_in)
         if self.assembler != None:
             for a in out:
                 self.assembler.workOn(a)
         return out
+
+    def memoizable(self):
+        return True
     
     def randomInput(self, maxDepth, separator):
         buf = ""
@@ -699,6 +772,19 @@ class Parser:
     def setAssembler(self, assembler):
         self.assembler = assembler
         return self
+
+    def setCommit(self, commit):
+        if commit not in (None, Parser.FIRST, Parser.LONGEST):
+            raise Exception(f"Unknown commit mode: {commit}")
+        self.commit = commit
+        return self
+
+    def committed(self, chosen, b):
+        if chosen == None:
+            return b
+        if self.commit == Parser.LONGEST and b.elementsConsumed() > chosen.elementsConsumed():
+            return b
+        return chosen
     
     #def unvisitedString(self, visited):
     #    pass
@@ -828,10 +914,25 @@ class Alternation(CollectionParser):
             pv.visitAlternation(self, visited)
     
     def match(self, _in):
+        if self.commit != None:
+            return self.commitMatch(_in)
         out = []
         for p in self.subparsers:
             Parser.add(out, p.matchAndAssemble(_in))
         return out
+
+    def commitMatch(self, _in):
+        out = []
+        for a in _in:
+            chosen = None
+            for p in self.subparsers:
+                for b in p.matchAndAssemble([a]):
+                    chosen = self.committed(chosen, b)
+                if chosen != None and self.commit == Parser.FIRST:
+                    break
+            if chosen != None:
+                out.append(chosen)
+        return out
     
     def randomExpansion(self, maxDepth, depth):
         if depth >= maxDepth:
@@ -899,11 +1000,16 @@ class Repetition(Parser):
     
     def getSubparser(self):
         return self.subparser
+
+    def memoizable(self):
+        return self.preAssembler == None
     
     def match(self, _in):
         if self.preAssembler != None:
             for a in _in:
                 self.preAssembler.workOn(a)
+        if self.commit != None:
+            return self.commitMatch(_in)
         out = self.elementClone(_in)
         s = _in
         while len(s) > 0:
@@ -911,6 +1017,22 @@ class Repetition(Parser):
             self.add(out, s)
         return out
 
+    def commitMatch(self, _in):
+        out = []
+        for a in _in:
+            last = a.clone()
+            s = [a]
+            while True:
+                chosen = None
+                for b in self.subparser.matchAndAssemble(s):
+                    chosen = self.committed(chosen, b)
+                if chosen == None:
+                    break
+                last = chosen
+                s = [chosen]
+            out.append(last)
+        return out
+
     def randomExpansion(self, maxDepth, depth):
         v = []
         if depth >= maxDepth:
@@ -1041,13 +1163,16 @@ class Assembler:
 
 # Logikusの文法
 """
-    axiom        = structure (ruleDef | Empty);
+    axiom        = declaration | structure (ruleDef | Empty);
+    declaration  = "table" functor '/' Num;
     structure    = functor('(' commaList(term) ')' | Empty);
     functore     =  '.' | LowercaseWord | QuotedString;
     term         = structure | Num | list | variable;
     variable     = UppercaseWord | '_';
     ruleDef      = ":-" commaList(condition);
-    condition    = structure | not | evaluation | comaprison | list;
+    condition    = cut | once | structure | not | evaluation | comaprison | list;
+    cut          = '!';
+    once         = "once" '(' structure ')';
     not          = "not" structure;
     evaluation   = '#' '(' arg ',' arg ')';
     comparison   = operator '(' arg ',' arg ')';
@@ -1114,11 +1239,38 @@ class ListWithTailAssembler(Assembler):
         termArray = list(reversed(termVector))
         a.push(Structure.list(termArray, tail))
 
+class CutAssembler(Assembler):
+    def workOn(self, a):
+        a.pop()
+        a.push(Cut())
+
+class OnceAssembler(Assembler):
+    def workOn(self, a):
+        s = a.pop()
+        a.push(Once(s))
+
 class NotAssembler(Assembler):
     def workOn(self, a):
         s = a.pop()
         a.push(Not(s))
 
+class TableDeclaration:
+    def __init__(self, functor, arity):
+        self.functor = functor
+        self.arity = arity
+
+    def declare(self, program):
+        program.table(self.functor, self.arity)
+
+    def __str__(self):
+        return f"table {self.functor}/{self.arity}"
+
+class TableAssembler(Assembler):
+    def workOn(self, a):
+        arity = a.pop()
+        functor = a.pop()
+        a.push(TableDeclaration(functor.value(), int(arity.nval)))
+
 class StructureWithTermsAssembler(Assembler):
     @classmethod
     def vectorReversedIntoTerms(cls, v):
@@ -1224,28 +1376,63 @@ class UppercaseWord(Word):
         return "Word"
 
 class LogikusParser:
-    def __init__(self):
+    _shared = None
+    _sharedLock = threading.Lock()
+
+    def __init__(self, commit=False):
+        self.commit = commit
         self._structure = None
         self._expression = None
         self._list = None
+        self._arg = None
+        self._condition = None
+        self._factor = None
+        self._num = None
+        self._phrase = None
+        self._term = None
+        self._variable = None
+        self.axiomParser = None
+        self.queryParser = None
+
+    @classmethod
+    def shared(cls):
+        if cls._shared == None:
+            with cls._sharedLock:
+                if cls._shared == None:
+                    g = cls(True)
+                    g.axiomParser = g.axiom()
+                    g.queryParser = g.commaList(g.condition())
+                    g.queryParser.setAssembler(AxiomAssembler())
+                    cls._shared = g
+        return cls._shared
+
+    def committing(self, p, commit):
+        if self.commit:
+            p.setCommit(commit)
+        return p
     
     def arg(self):
-        a = Alternation()
-        a.add(self.expression())
-        a.add(self.functor().setAssembler(AtomAssembler()))
-        return a
+        if self._arg == None:
+            self._arg = self.committing(Alternation(), Parser.FIRST)
+            self._arg.add(self.expression())
+            self._arg.add(self.functor().setAssembler(AtomAssembler()))
+        return self._arg
     
     def axiom(self):
         s = Sequence("axiom")
         s.add(self.structure())
 
-        a = Alternation()
+        a = self.committing(Alternation(), Parser.LONGEST)
         a.add(self.ruleDef())
         a.add(Empty())
         s.add(a)
 
         s.setAssembler(AxiomAssembler())
-        return s
+
+        d = self.committing(Alternation(), Parser.LONGEST)
+        d.add(self.declaration())
+        d.add(s)
+        return d
     
     def commaList(self, p):
         commaP = Track()
@@ -1254,7 +1441,7 @@ class LogikusParser:
 
         s = Sequence()
         s.add(p)
-        s.add(Repetition(commaP))
+        s.add(self.committing(Repetition(commaP), Parser.LONGEST))
         return s
     
     def comparison(self):
@@ -1269,14 +1456,31 @@ class LogikusParser:
         return t
 
     def condition(self):
-        a = Alternation("condition")
-        a.add(self.structure())
-        a.add(self._not())
-        a.add(self.evaluation())
-        a.add(self.comparison())
-        a.add(self.list())
-        return a
-    
+        if self._condition == None:
+            self._condition = self.committing(Alternation("condition"), Parser.LONGEST)
+            self._condition.add(self.cut())
+            self._condition.add(self.once())
+            self._condition.add(self.structure())
+            self._condition.add(self._not())
+            self._condition.add(self.evaluation())
+            self._condition.add(self.comparison())
+            self._condition.add(self.list())
+        return self._condition
+    
+    def declaration(self):
+        s = Sequence("declaration")
+        s.add(Literal("table").discard())
+        s.add(self.functor())
+        s.add(Symbol('/').discard())
+        s.add(Num())
+        s.setAssembler(TableAssembler())
+        return s
+
+    def cut(self):
+        s = Symbol('!')
+        s.setAssembler(CutAssembler())
+        return s
+
     def divideFactor(self):
         s = Sequence("divideFactor")
         s.add(Symbol('/').discard())
@@ -1299,25 +1503,26 @@ class LogikusParser:
         if self._expression == None:
             self._expression = Sequence("expression")
             self._expression.add(self.phrase())
-            a = Alternation()
+            a = self.committing(Alternation(), Parser.FIRST)
             a.add(self.plusPhrase())
             a.add(self.minusPhrase())
-            self._expression.add(Repetition(a))
+            self._expression.add(self.committing(Repetition(a), Parser.LONGEST))
         return self._expression
     
     def factor(self):
-        a = Alternation("factor")
-        s = Sequence()
-        s.add(Symbol('(').discard())
-        s.add(self.expression())
-        s.add(Symbol(')').discard())
-        a.add(s)
-        a.add(self.num())
-        a.add(self.variable())
-        return a
+        if self._factor == None:
+            self._factor = self.committing(Alternation("factor"), Parser.FIRST)
+            s = Sequence()
+            s.add(Symbol('(').discard())
+            s.add(self.expression())
+            s.add(Symbol(')').discard())
+            self._factor.add(s)
+            self._factor.add(self.num())
+            self._factor.add(self.variable())
+        return self._factor
     
     def functor(self):
-        a = Alternation("functor")
+        a = self.committing(Alternation("functor"), Parser.FIRST)
         a.add(Symbol('.'))
         a.add(LowercaseWord())
         a.add(QuotedString())
@@ -1327,7 +1532,7 @@ class LogikusParser:
         if self._list == None:
             self._list = Track("list")
             self._list.add(Symbol('[')) # push this, as a fence
-            a = Alternation()
+            a = self.committing(Alternation(), Parser.LONGEST)
             a.add(self.listContents()) 
             a.add(Empty().setAssembler(ListAssembler()))
             self._list.add(a)
@@ -1340,7 +1545,7 @@ class LogikusParser:
         return s
     
     def listTail(self):
-        tail = Alternation()
+        tail = self.committing(Alternation(), Parser.FIRST)
         tail.add(self.variable())
         tail.add(self.list())
 
@@ -1349,7 +1554,7 @@ class LogikusParser:
         barTail.add(tail)
         barTail.setAssembler(ListWithTailAssembler())
         
-        a = Alternation()
+        a = self.committing(Alternation(), Parser.LONGEST)
         a.add(barTail)
         a.add(Empty().setAssembler(ListAssembler()))
         return a
@@ -1369,12 +1574,22 @@ class LogikusParser:
         return t
     
     def num(self):
-        n = Num()
-        n.setAssembler(AtomAssembler())
-        return n
-    
+        if self._num == None:
+            self._num = Num()
+            self._num.setAssembler(AtomAssembler())
+        return self._num
+    
+    def once(self):
+        s = Sequence("once")
+        s.add(Literal("once").discard())
+        s.add(Symbol('(').discard())
+        s.add(self.structure())
+        s.add(Symbol(')').discard())
+        s.setAssembler(OnceAssembler())
+        return s
+
     def operator(self):
-        a = Alternation("operator")
+        a = self.committing(Alternation("operator"), Parser.FIRST)
         a.add(Symbol('<'))
         a.add(Symbol('>'))
         a.add(Symbol('='))
@@ -1384,13 +1599,14 @@ class LogikusParser:
         return a
     
     def phrase(self):
-        _phrase = Sequence("phrase")
-        _phrase.add(self.factor())
-        a = Alternation()
-        a.add(self.timesFactor())
-        a.add(self.divideFactor())
-        _phrase.add(Repetition(a))
-        return _phrase
+        if self._phrase == None:
+            self._phrase = Sequence("phrase")
+            self._phrase.add(self.factor())
+            a = self.committing(Alternation(), Parser.FIRST)
+            a.add(self.timesFactor())
+            a.add(self.divideFactor())
+            self._phrase.add(self.committing(Repetition(a), Parser.LONGEST))
+        return self._phrase
     
     def plusPhrase(self):
         s = Sequence("plusPhrase")
@@ -1401,7 +1617,8 @@ class LogikusParser:
     
     @classmethod
     def query(cls):
-        p = cls.commaList(cls, cls().condition())
+        g = cls()
+        p = g.commaList(g.condition())
         p.setAssembler(AxiomAssembler())
         return p
     
@@ -1425,19 +1642,20 @@ class LogikusParser:
             t.add(self.commaList(self.term()))
             t.add(Symbol(')').discard())
 
-            a = Alternation()
+            a = self.committing(Alternation(), Parser.LONGEST)
             a.add(t.setAssembler(StructureWithTermsAssembler()))
             a.add(Empty().setAssembler(AtomAssembler()))
             self._structure.add(a)
         return self._structure
     
     def term(self):
-        a = Alternation("term")
-        a.add(self.structure())
-        a.add(self.num())
-        a.add(self.list())
-        a.add(self.variable())
-        return a
+        if self._term == None:
+            self._term = self.committing(Alternation("term"), Parser.FIRST)
+            self._term.add(self.structure())
+            self._term.add(self.num())
+            self._term.add(self.list())
+            self._term.add(self.variable())
+        return self._term
     
     def timesFactor(self):
         s = Sequence("timesFactor")
@@ -1447,16 +1665,17 @@ class LogikusParser:
         return s
     
     def variable(self):
-        v = UppercaseWord()
-        v.setAssembler(VariableAssembler())
+        if self._variable == None:
+            v = UppercaseWord()
+            v.setAssembler(VariableAssembler())
 
-        anon = Symbol('_').discard()
-        anon.setAssembler(AnonymousAssembler())
-        
-        a = Alternation()
-        a.add(v)
-        a.add(anon)
-        return a
+            anon = Symbol('_').discard()
+            anon.setAssembler(AnonymousAssembler())
+            
+            self._variable = self.committing(Alternation(), Parser.FIRST)
+            self._variable.add(v)
+            self._variable.add(anon)
+        return self._variable
 
 class LogikusFacade:
     @classmethod
@@ -1466,13 +1685,13 @@ class LogikusFacade:
         else:
             s = arg
             ts = TokenString(s)
-        p = LogikusParser().axiom()
+        p = LogikusParser.shared().axiomParser
         o = cls.parse(ts, p, "axiom")
         return o
     
     @classmethod
-    def parse(cls, ts, p, _type):
-        ta = TokenAssembly(ts)
+    def parse(cls, ts, p, _type, packrat=None):
+        ta = TokenAssembly(ts, packrat)
         out = p.bestMatch(ta)
         if out == None:
             print("reportError")
@@ -1489,12 +1708,16 @@ class LogikusFacade:
             ts = tss.nextTokenString()
             if ts == None:
                 break
-            p.addAxiom(cls.axiom(ts))
+            o = cls.axiom(ts)
+            if isinstance(o, TableDeclaration):
+                o.declare(p)
+            else:
+                p.addAxiom(o)
         return p
     
     @classmethod
     def query(cls, s, _as):
-        o = cls.parse(s, LogikusParser.query(), "query")
+        o = cls.parse(s, LogikusParser.shared().queryParser, "query")
         if isinstance(o, Fact):
             f = o
             q = Query(_as, f)
@@ -1507,3 +1730,12 @@ class LogikusFacade:
             print(q.variables())
             found = "Yes"
         print(found)
+
+    @classmethod
+    def solve(cls, s, _as, limit=None):
+        o = cls.parse(s, LogikusParser.shared().queryParser, "query")
+        solver = Solver(_as, o)
+        n = 0
+        while (limit == None or n < limit) and solver.canFindNextProof():
+            yield solver.bindings()
+            n += 1
@@ -0,0 +1,586 @@
+# Predictive parsing of a combinator grammar, which chooses each
+# alternative from the next token instead of trying them all.
+from parser import *
+
+class GrammarAnalysis:
+    """A GrammarAnalysis visits the graph of parsers under a start
+    parser and computes, for every parser in it, whether it can match
+    no tokens, the terminals that can begin its matches (its FIRST
+    set) and the terminals that can come after them (its FOLLOW set).
+
+    A set of terminals is a dict from the kind of each terminal, such
+    as ("symbol", "(") or ("lowercase",), to a terminal of that kind.
+    The end of the input has the kind ("eof",).
+
+    An alternation conflicts if two of its alternatives can begin with
+    the same token, or if it has an alternative that matches nothing
+    and another that can begin with a token that may follow the
+    alternation. A repetition conflicts if its subparser can match
+    nothing, or can begin with a token that may follow the repetition.
+    A predictive parser falls back to the combinators for conflicts.
+    """
+    EOF = ("eof",)
+
+    def __init__(self, start):
+        """Analyze the grammar under the given parser.
+
+        Args:
+            start (Parser): the start parser of the grammar
+        """
+        self.start = start
+        self.nodes = []
+        start.accept(self, set())
+        self.nullable = set()
+        self.first = {id(p): {} for p in self.nodes}
+        self.follow = {id(p): {} for p in self.nodes}
+        self.follow[id(start)][GrammarAnalysis.EOF] = None
+        self.computeFirst()
+        self.computeFollow()
+        self.conflicts = self.findConflicts()
+
+    def visit(self, p, visited):
+        """Records a parser the first time the walk reaches it.
+
+        Args:
+            p (Parser): the parser
+            visited (set): the parsers already recorded
+
+        Returns:
+            boolean: True if the parser is new
+        """
+        if p in visited:
+            return False
+        visited.add(p)
+        self.nodes.append(p)
+        return True
+
+    def visitAlternation(self, p, visited):
+        """Records an alternation and visits its alternatives.
+
+        Args:
+            p (Alternation): the alternation
+            visited (set): the parsers already recorded
+        """
+        if self.visit(p, visited):
+            for q in p.subparsers:
+                q.accept(self, visited)
+
+    def visitEmpty(self, p, visited):
+        """Records an empty parser.
+
+        Args:
+            p (Empty): the empty parser
+            visited (set): the parsers already recorded
+        """
+        self.visit(p, visited)
+
+    def visitRepetition(self, p, visited):
+        """Records a repetition and visits its subparser.
+
+        Args:
+            p (Repetition): the repetition
+            visited (set): the parsers already recorded
+        """
+        if self.visit(p, visited):
+            p.subparser.accept(self, visited)
+
+    def visitSequence(self, p, visited):
+        """Records a sequence, or a track, and visits its subparsers.
+
+        Args:
+            p (Sequence): the sequence
+            visited (set): the parsers already recorded
+        """
+        if self.visit(p, visited):
+            for q in p.subparsers:
+                q.accept(self, visited)
+
+    def visitTerminal(self, p, visited):
+        """Records a terminal.
+
+        Args:
+            p (Terminal): the terminal
+            visited (set): the parsers already recorded
+        """
+        self.visit(p, visited)
+
+    @classmethod
+    def kind(cls, t):
+        """Returns the kind of tokens a terminal accepts.
+
+        Args:
+            t (Terminal): the terminal
+
+        Returns:
+            tuple: the kind of the terminal
+        """
+        if isinstance(t, Symbol):
+            return ("symbol", t.symbol.sval)
+        if isinstance(t, CaselessLiteral):
+            return ("caseless", t.literal.ttype.name, t.literal.sval.lower())
+        if isinstance(t, Literal):
+            if t.literal.isNumber():
+                return ("number", t.literal.nval)
+            return (t.literal.ttype.name, t.literal.sval)
+        if isinstance(t, LowercaseWord):
+            return ("lowercase",)
+        if isinstance(t, UppercaseWord):
+            return ("uppercase",)
+        if isinstance(t, Word):
+            return ("word",)
+        if isinstance(t, QuotedString):
+            return ("quoted",)
+        if isinstance(t, Num):
+            return ("number",)
+        return ("any",)
+
+    @classmethod
+    def overlap(cls, j, k):
+        """Returns True if some token can be of both the given kinds.
+
+        Args:
+            j (tuple): a kind of token
+            k (tuple): another kind of token
+
+        Returns:
+            boolean: True if the kinds overlap
+        """
+        if j == k:
+            return True
+        if j == GrammarAnalysis.EOF or k == GrammarAnalysis.EOF:
+            return False
+        if j[0] == "any" or k[0] == "any":
+            return True
+        if len(j) > len(k):
+            j, k = k, j
+        if len(j) == 1 and len(k) == 1:
+            return {j[0], k[0]} in ({"word", "lowercase"}, {"word", "uppercase"})
+        if len(j) == 1:
+            if k[0] == "caseless":
+                ttype, s = k[1], k[2]
+            else:
+                ttype, s = k
+            if j[0] == "lowercase":
+                return ttype == "word" and len(s) > 0 and (s[0].islower() or k[0] == "caseless" and s[0].isalpha())
+            if j[0] == "uppercase":
+                return ttype == "word" and len(s) > 0 and (s[0].isupper() or k[0] == "caseless" and s[0].isalpha())
+            return ttype == j[0]
+        if j[0] == "caseless" or k[0] == "caseless":
+            js = j[1:] if j[0] == "caseless" else j
+            ks = k[1:] if k[0] == "caseless" else k
+            return js[0] == ks[0] and isinstance(js[1], str) and isinstance(ks[1], str) \
+                and js[1].lower() == ks[1].lower()
+        return False
+
+    @classmethod
+    def overlaps(cls, first, second):
+        """Returns the kinds of the first set that overlap a kind of
+        the second.
+
+        Args:
+            first (dict): a set of terminals
+            second (dict): another set of terminals
+
+        Returns:
+            tuple[]: the overlapping kinds
+        """
+        return [j for j in first if any(GrammarAnalysis.overlap(j, k) for k in second)]
+
+    def sequenceFirst(self, parsers, first):
+        """Adds the FIRST set of a sequence of parsers to a set.
+
+        Args:
+            parsers (Parser[]): the parsers, in order
+            first (dict): the set to add to
+
+        Returns:
+            boolean: True if all the parsers can match nothing
+        """
+        for q in parsers:
+            first.update(self.first[id(q)])
+            if q not in self.nullable:
+                return False
+        return True
+
+    def computeFirst(self):
+        """Computes which parsers can match nothing, and the FIRST
+        sets, repeating until neither changes.
+        """
+        changed = True
+        while changed:
+            changed = False
+            for p in self.nodes:
+                first = self.first[id(p)]
+                size = len(first)
+                nullable = False
+                if isinstance(p, Terminal):
+                    first[GrammarAnalysis.kind(p)] = p
+                elif isinstance(p, Empty):
+                    nullable = True
+                elif isinstance(p, Repetition):
+                    first.update(self.first[id(p.subparser)])
+                    nullable = True
+                elif isinstance(p, Alternation):
+                    for q in p.subparsers:
+                        first.update(self.first[id(q)])
+                        nullable = nullable or q in self.nullable
+                elif isinstance(p, Sequence):
+                    nullable = self.sequenceFirst(p.subparsers, first)
+                if nullable and p not in self.nullable:
+                    self.nullable.add(p)
+                    changed = True
+                if len(first) != size:
+                    changed = True
+
+    def computeFollow(self):
+        """Computes the FOLLOW sets, repeating until none changes.
+        """
+        changed = True
+        while changed:
+            changed = False
+            for p in self.nodes:
+                follow = self.follow[id(p)]
+                tails = []
+                if isinstance(p, Repetition):
+                    after = dict(self.first[id(p.subparser)])
+                    after.update(follow)
+                    tails.append((p.subparser, after))
+                elif isinstance(p, Alternation):
+                    tails = [(q, follow) for q in p.subparsers]
+                elif isinstance(p, Sequence):
+                    for i, q in enumerate(p.subparsers):
+                        after = {}
+                        if self.sequenceFirst(p.subparsers[i + 1:], after):
+                            after.update(follow)
+                        tails.append((q, after))
+                for q, after in tails:
+                    qFollow = self.follow[id(q)]
+                    size = len(qFollow)
+                    qFollow.update(after)
+                    if len(qFollow) != size:
+                        changed = True
+
+    def findConflicts(self):
+        """Returns the alternations and repetitions that a single
+        token of lookahead cannot decide.
+
+        Returns:
+            tuple[]: the conflicts, as tuples (parser, description)
+        """
+        conflicts = []
+        for p in self.nodes:
+            if isinstance(p, Alternation):
+                nullable = [q for q in p.subparsers if q in self.nullable]
+                if len(nullable) > 1:
+                    conflicts.append((p, f"{len(nullable)} alternatives match nothing"))
+                for i, q in enumerate(p.subparsers):
+                    for r in p.subparsers[i + 1:]:
+                        kinds = GrammarAnalysis.overlaps(self.first[id(q)], self.first[id(r)])
+                        if len(kinds) > 0:
+                            conflicts.append((p, f"alternatives {q} and {r} can both begin with {kinds}"))
+                    if len(nullable) > 0 and q not in nullable:
+                        kinds = GrammarAnalysis.overlaps(self.first[id(q)], self.follow[id(p)])
+                        if len(kinds) > 0:
+                            conflicts.append((p, f"alternative {q} can begin with {kinds}, which may follow an empty match"))
+            elif isinstance(p, Repetition):
+                if p.subparser in self.nullable:
+                    conflicts.append((p, "the repeated parser can match nothing"))
+                kinds = GrammarAnalysis.overlaps(self.first[id(p.subparser)], self.follow[id(p)])
+                if len(kinds) > 0:
+                    conflicts.append((p, f"the repetition can end or go on at {kinds}"))
+        return conflicts
+
+    def report(self):
+        """Returns a description of the conflicts, one per line.
+
+        Returns:
+            str: the description
+        """
+        return "\n".join(f"{p}: {description}" for p, description in self.conflicts)
+
+class PredictiveParser:
+    """A PredictiveParser matches a grammar of combinator parsers with
+    one token of lookahead and no backtracking. It follows a single
+    assembly through the grammar, choosing an alternative by which
+    FIRST set holds the next token, and going on with a repetition
+    while its subparser's FIRST set does. It runs the same assemblers
+    and pre-assemblers as the combinators, in the same order, and
+    raises a Track's exception when the Track fails part way.
+
+    Where the analysis finds a conflict, the predictive parser hands
+    the parser to its own matchAndAssemble, and goes on with the
+    assembly that the parser's commit mode would choose, or the one
+    that consumes the most tokens. An alternation only falls back
+    when the next token is one of its conflicts. If the predictive
+    match fails, bestMatch tries the combinators on the whole input.
+    """
+    def __init__(self, start):
+        """Create a predictive parser for the grammar under the given
+        parser.
+
+        Args:
+            start (Parser): the start parser of the grammar
+        """
+        self.start = start
+        self.analysis = GrammarAnalysis(start)
+        self.fallbacks = {id(p) for p, description in self.analysis.conflicts
+            if isinstance(p, Repetition)}
+        self.branches = {}
+        for p in self.analysis.nodes:
+            if isinstance(p, Alternation):
+                self.branches[id(p)] = [
+                    (q, list(self.analysis.first[id(q)].values()), q in self.analysis.nullable)
+                    for q in p.subparsers]
+        self.words = set()
+        self.numbers = set()
+        self.cacheable = True
+        for p in self.analysis.nodes:
+            if isinstance(p, Terminal):
+                kind = GrammarAnalysis.kind(p)
+                if kind[0] == "any":
+                    self.cacheable = False
+                elif kind[0] == "caseless" or len(kind) == 2 and kind[0] != "symbol":
+                    if isinstance(kind[-1], str):
+                        self.words.add(kind[-1].lower())
+                    else:
+                        self.numbers.add(kind[-1])
+        self.table = {}
+        self.predictions = 0
+        self.fallbackCount = 0
+
+    def conflicts(self):
+        """Returns the conflicts that the grammar analysis found.
+
+        Returns:
+            tuple[]: the conflicts, as tuples (parser, description)
+        """
+        return self.analysis.conflicts
+
+    @classmethod
+    def qualifies(cls, terminals, token):
+        """Returns True if one of the given terminals accepts a token.
+
+        Args:
+            terminals (Terminal[]): the terminals
+            token (Token): the token, or None at the end of the input
+
+        Returns:
+            boolean: True if a terminal accepts the token
+        """
+        if token == None:
+            return False
+        for t in terminals:
+            if t.qualifies(token):
+                return True
+        return False
+
+    def signature(self, token):
+        """Returns a key that stands for every token the grammar's
+        terminals cannot tell apart from the given one. A word is
+        its own key if a terminal names it, and otherwise stands with
+        the words of its case.
+
+        Args:
+            token (Token): the token, or None at the end of the input
+
+        Returns:
+            tuple: the key, or None at the end of the input
+        """
+        if token == None:
+            return None
+        ttype = token.ttype.name
+        if ttype == "symbol":
+            return (ttype, token.sval)
+        if ttype == "word":
+            s = token.sval
+            if s.lower() in self.words:
+                return (ttype, s)
+            return ("case", s[:1].islower(), s[:1].isupper())
+        if ttype == "number" and token.nval in self.numbers:
+            return (ttype, token.nval)
+        return (ttype,)
+
+    def decide(self, p, a):
+        """Returns the decision at an alternation or repetition for
+        the next token of an assembly, from the table of decisions
+        if a token with the same signature has already met the
+        parser.
+
+        Args:
+            p (Parser): the alternation or repetition
+            a (Assembly): the assembly
+
+        Returns:
+            tuple|boolean: the alternation's prediction, or True if
+                the repetition goes on
+        """
+        if self.cacheable:
+            key = (id(p), self.signature(a.peek()))
+            decision = self.table.get(key)
+            if decision != None:
+                return decision
+        if isinstance(p, Repetition):
+            first = self.analysis.first[id(p.subparser)].values()
+            decision = PredictiveParser.qualifies(first, a.peek())
+        else:
+            decision = self.predict(p, a)
+        if self.cacheable:
+            self.table[key] = decision
+        return decision
+
+    def fallback(self, p, a):
+        """Matches a parser with its combinators and chooses one of
+        the results.
+
+        Args:
+            p (Parser): the parser
+            a (Assembly): the assembly to match
+
+        Returns:
+            Assembly: the chosen result, or None
+        """
+        self.fallbackCount += 1
+        chosen = None
+        for b in p.matchAndAssemble([a]):
+            if chosen == None or p.commit != Parser.FIRST and b.elementsConsumed() > chosen.elementsConsumed():
+                chosen = b
+        return chosen
+
+    def predict(self, p, a):
+        """Chooses the alternative of an alternation for the next
+        token of an assembly.
+
+        Args:
+            p (Alternation): the alternation
+            a (Assembly): the assembly
+
+        Returns:
+            tuple: (True, the alternative or None if none can match),
+                or (False, None) if the alternation must fall back
+        """
+        token = a.peek()
+        chosen = None
+        empty = None
+        for q, first, nullable in self.branches[id(p)]:
+            if PredictiveParser.qualifies(first, token):
+                if chosen != None:
+                    return False, None
+                chosen = q
+            elif nullable:
+                if empty != None:
+                    return False, None
+                empty = q
+        if chosen == None:
+            return True, empty
+        if empty != None:
+            follow = self.analysis.follow[id(p)]
+            if token == None and GrammarAnalysis.EOF in follow or \
+                    PredictiveParser.qualifies([t for t in follow.values() if t != None], token):
+                return False, None
+        return True, chosen
+
+    def parse(self, p, a):
+        """Matches a parser against an assembly, changing the
+        assembly in place.
+
+        Args:
+            p (Parser): the parser
+            a (Assembly): the assembly
+
+        Returns:
+            Assembly: the assembly after the match, which may be a
+                different object, or None if the match fails
+        """
+        if isinstance(p, Terminal):
+            token = a.peek()
+            if token == None or not p.qualifies(token):
+                return None
+            a.nextElement()
+            if not p._discard:
+                a.push(token)
+        elif isinstance(p, Empty):
+            pass
+        elif isinstance(p, Alternation):
+            decided, q = self.decide(p, a)
+            if not decided:
+                return self.fallback(p, a)
+            if q == None:
+                return None
+            a = self.parse(q, a)
+            if a == None:
+                return None
+        elif isinstance(p, Repetition):
+            if id(p) in self.fallbacks:
+                return self.fallback(p, a)
+            if p.preAssembler != None:
+                p.preAssembler.workOn(a)
+            while self.decide(p, a):
+                a = self.parse(p.subparser, a)
+                if a == None:
+                    return None
+        elif isinstance(p, Sequence):
+            for i, q in enumerate(p.subparsers):
+                b = self.parse(q, a)
+                if b == None:
+                    if i > 0 and isinstance(p, Track):
+                        p.throwTrackException([a], q)
+                    return None
+                a = b
+        else:
+            return self.fallback(p, a)
+        self.predictions += 1
+        if p.assembler != None:
+            p.assembler.workOn(a)
+        return a
+
+    def match(self, a):
+        """Matches the grammar against a copy of an assembly, without
+        falling back to the combinators for the whole input.
+
+        Args:
+            a (Assembly): the assembly
+
+        Returns:
+            Assembly: the result, or None if the match fails
+        """
+        return self.parse(self.start, a.clone())
+
+    def bestMatch(self, a):
+        """Matches the grammar against an assembly, and falls back to
+        the combinators if the predictive match fails.
+
+        Args:
+            a (Assembly): the assembly
+
+        Returns:
+            Assembly: the best result, or None
+        """
+        b = self.match(a)
+        if b == None:
+            self.fallbackCount += 1
+            return self.start.bestMatch(a)
+        return b
+
+    def completeMatch(self, a):
+        """Matches the grammar against an assembly, and returns the
+        result if it consumes the whole assembly.
+
+        Args:
+            a (Assembly): the assembly
+
+        Returns:
+            Assembly: the complete result, or None
+        """
+        b = self.bestMatch(a)
+        if b != None and not b.hasMoreElements():
+            return b
+        return None
+
+    def statistics(self):
+        """Returns counts of the predictive parser's work.
+
+        Returns:
+            dict: the parsers matched by prediction, and the fallbacks
+                to combinators
+        """
+        return {"predictions": self.predictions, "fallbacks": self.fallbackCount}
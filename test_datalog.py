@@ -0,0 +1,93 @@
+# Tests of bottom-up Datalog evaluation and magic sets against plain
+# resolution.
+import unittest
+
+from engine import *
+from datalog import Datalog
+from parser import LogikusFacade, LogikusParser
+
+class EvaluationTest(unittest.TestCase):
+    def goals(self, query):
+        return LogikusFacade.parse(query, LogikusParser.shared().queryParser, "query")
+
+    def queried(self, program, query):
+        q = Query(program, self.goals(query))
+        solutions = []
+        while q.canFindNextProof():
+            solutions.append({v.name: Solver.pythonValue(v) for v in q.variables().elements()})
+        return solutions
+
+    def distinct(self, solutions):
+        return [dict(s) for s in dict.fromkeys(tuple(sorted(s.items())) for s in solutions)]
+
+    def solved(self, _as, query):
+        solver = Solver(_as, self.goals(query))
+        solutions = []
+        while solver.canFindNextProof():
+            solutions.append(solver.bindings())
+        return solutions
+
+class DatalogTest(EvaluationTest):
+    source = """
+        edge(a, b); edge(a, c); edge(b, d); edge(c, d); edge(d, e); edge(e, f);
+        path(X, Y) :- edge(X, Y);
+        path(X, Y) :- edge(X, Z), path(Z, Y);
+        node(X) :- edge(X, _);
+        node(Y) :- edge(_, Y);
+        unreachable(X, Y) :- node(X), node(Y), not path(X, Y);
+        twice(X, N) :- path(X, Y), edge(Y, Z), #(N, 2);
+    """
+    queries = ["path(a, Y)", "path(X, e)", "path(X, Y)", "node(X)", "twice(X, N)"]
+
+    def testMatchesQuery(self):
+        program = LogikusFacade.program(DatalogTest.source)
+        datalog = Datalog(program)
+        for query in DatalogTest.queries:
+            self.assertCountEqual(self.solved(datalog, query),
+                self.distinct(self.queried(program, query)))
+
+    def testNegation(self):
+        program = LogikusFacade.program(DatalogTest.source)
+        expected = [{"Y": y} for y in "abcd"]
+        self.assertCountEqual(self.solved(Datalog(program), "unreachable(d, Y)"), expected)
+        self.assertCountEqual(self.distinct(self.solved(program, "unreachable(d, Y)")), expected)
+
+    def testLeftRecursionOnCycle(self):
+        program = LogikusFacade.program("""
+            edge(a, b); edge(b, c); edge(c, a); edge(c, d);
+            path(X, Y) :- path(X, Z), edge(Z, Y);
+            path(X, Y) :- edge(X, Y);
+        """)
+        self.assertCountEqual(self.solved(Datalog(program), "path(a, Y)"),
+            [{"Y": y} for y in "abcd"])
+
+class MagicSetsTest(EvaluationTest):
+    source = """
+        parent(adam, cain); parent(adam, abel); parent(cain, enoch); parent(enoch, irad);
+        parent(eve, seth); parent(seth, enos); parent(x1, x2); parent(x2, x3); parent(x3, x4);
+        ancestor(X, Y) :- parent(X, Y);
+        ancestor(X, Y) :- parent(X, Z), ancestor(Z, Y);
+        kin(X, Y) :- ancestor(P, X), ancestor(P, Y), !=(X, Y);
+    """
+    queries = ["ancestor(adam, Y)", "ancestor(X, irad)", "ancestor(eve, enos)",
+        "kin(abel, Y)", "ancestor(adam, X), ancestor(X, irad)"]
+
+    def testMatchesQuery(self):
+        program = LogikusFacade.program(MagicSetsTest.source)
+        full = Datalog(program)
+        for query in MagicSetsTest.queries:
+            magic = Datalog(program, self.goals(query))
+            expected = self.distinct(self.queried(program, query))
+            self.assertCountEqual(self.solved(magic, query), expected)
+            self.assertCountEqual(self.solved(full, query), expected)
+
+    def testDerivesLess(self):
+        source = "".join(f"e({i}, {i + 1});" for i in range(100))
+        program = LogikusFacade.program(source + "t(X, Y) :- e(X, Y); t(X, Y) :- t(X, Z), e(Z, Y);")
+        full = Datalog(program)
+        magic = Datalog(program, self.goals("t(90, Y)"))
+        self.assertCountEqual(self.solved(magic, "t(90, Y)"), [{"Y": i} for i in range(91, 101)])
+        self.assertLess(magic.derivations * 10, full.derivations)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# Tests of SQLite-backed predicates against plain resolution over the
+# same facts.
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from engine import *
+from external import SqlitePredicate
+from parser import LogikusFacade, LogikusParser
+
+class SqlitePredicateTest(unittest.TestCase):
+    rows = [(f"c{i}", i % 13, i * 1.5) for i in range(200)]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database = os.path.join(directory.name, "a#b?c.db")
+        c = sqlite3.connect(self.database)
+        c.execute("CREATE TABLE city (name TEXT, alt INTEGER, pop REAL)")
+        c.executemany("INSERT INTO city VALUES (?, ?, ?)", SqlitePredicateTest.rows)
+        c.commit()
+        c.close()
+        self.plain = LogikusFacade.program("".join(f"city({n}, {a}, {p});" for n, a, p in SqlitePredicateTest.rows))
+        self.program = Program()
+        self.program.addPredicate(SqlitePredicate("city", self.database, "city"))
+
+    def queried(self, program, query):
+        q = Query(program, LogikusFacade.parse(query, LogikusParser.shared().queryParser, "query"))
+        solutions = []
+        while q.canFindNextProof():
+            solutions.append({v.name: Solver.pythonValue(v) for v in q.variables().elements()})
+        return solutions
+
+    def assertMatchesQuery(self, query):
+        expected = self.queried(self.plain, query)
+        self.assertEqual(list(LogikusFacade.solve(query, self.program)), expected)
+        self.assertEqual(self.queried(self.program, query), expected)
+        return expected
+
+    def testCalls(self):
+        for query in ["city(N, 5, P)", "city(c42, A, P)", "city(N, A, P), >(P, 270), <(A, 4)",
+                "city(N, A, P), >(N, c97)", "city(N, c5, P)", "city(N, A, 3)"]:
+            self.assertMatchesQuery(query)
+
+    def testWideIntegers(self):
+        self.assertEqual(self.assertMatchesQuery("city(N, 100000000000000000000000, P)"), [])
+        self.assertEqual(len(self.assertMatchesQuery("city(N, A, P), <(A, 100000000000000000000000)")), 200)
+        self.assertEqual(self.assertMatchesQuery("city(N, A, P), >(A, 100000000000000000000000)"), [])
+
+    def testNulls(self):
+        c = sqlite3.connect(self.database)
+        c.executemany("INSERT INTO city VALUES (?, ?, ?)", [("x", None, 1.0), (None, 1, 2.0)])
+        c.commit()
+        c.close()
+        self.assertMatchesQuery("city(N, A, P)")
+        self.assertEqual(len(self.program.predicate("city", 3).clauses), 200)
+
+if __name__ == "__main__":
+    unittest.main()
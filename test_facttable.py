@@ -0,0 +1,52 @@
+# Tests of fact tables against plain resolution over the same facts.
+import unittest
+
+from engine import *
+from facttable import FactTable
+from parser import LogikusFacade, LogikusParser
+
+class FactTableTest(unittest.TestCase):
+    rows = [(f"n{i}", i * 7 % 50, i % 7 / 2) for i in range(100)]
+
+    def setUp(self):
+        self.plain = LogikusFacade.program("".join(f"p({n}, {a}, {s});" for n, a, s in FactTableTest.rows))
+        self.table = FactTable("p", 3)
+        self.table.addRows(FactTableTest.rows)
+        self.program = Program()
+        self.program.addPredicate(self.table)
+
+    def queried(self, program, query):
+        q = Query(program, LogikusFacade.parse(query, LogikusParser.shared().queryParser, "query"))
+        solutions = []
+        while q.canFindNextProof():
+            solutions.append({v.name: Solver.pythonValue(v) for v in q.variables().elements()})
+        return solutions
+
+    def assertMatchesQuery(self, query):
+        expected = self.queried(self.plain, query)
+        self.assertEqual(list(LogikusFacade.solve(query, self.program)), expected)
+        self.assertEqual(self.queried(self.program, query), expected)
+        return expected
+
+    def testBoundArguments(self):
+        self.assertEqual(len(self.assertMatchesQuery("p(n3, A, S)")), 1)
+        self.assertEqual(len(self.assertMatchesQuery("p(N, 42, S)")), 2)
+        self.assertEqual(len(self.assertMatchesQuery("p(N, A, 1.5)")), 14)
+        self.assertEqual(self.assertMatchesQuery("p(n3, 22, S)"), [])
+
+    def testPushdown(self):
+        for query in ["p(N, A, S), >(A, 30)", "p(N, A, S), >(30, A), <=(S, 1.5)",
+                "p(N, A, S), =(A, 7)", "p(N, A, S), !=(S, 0.0)", "p(N, A, S), >(N, n50)",
+                "p(N, 14, S), >=(S, 1.0)", "p(N, A, S), >(A, abc)", "p(N, A, S), <(N, 3)"]:
+            self.assertMatchesQuery(query)
+        self.assertEqual(len(self.assertMatchesQuery("p(N, A, S), >(A, 30), <(S, 1.0)")),
+            sum(1 for n, a, s in FactTableTest.rows if a > 30 and s < 1.0))
+
+    def testIndexedColumn(self):
+        for i in range(Predicate.jitThreshold + 1):
+            self.assertMatchesQuery(f"p(N, {i % 50}, S)")
+        self.assertNotEqual(self.table.columns[1].index, None)
+        self.assertMatchesQuery("p(N, 21, S), >(S, 0.5)")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# Tests of loading facts from files against plain resolution over the
+# same facts written as Logikus.
+import json
+import os
+import tempfile
+import unittest
+
+from engine import *
+from facttable import FactTable
+from parser import LogikusFacade, LogikusParser
+
+class LoadFactsTest(unittest.TestCase):
+    rows = [(f"c{i}", i % 13, i * 1.5) for i in range(500)]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.plain = LogikusFacade.program("".join(f"city({n}, {a}, {p});" for n, a, p in LoadFactsTest.rows))
+
+    def path(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def queried(self, program, query):
+        q = Query(program, LogikusFacade.parse(query, LogikusParser.shared().queryParser, "query"))
+        solutions = []
+        while q.canFindNextProof():
+            solutions.append({v.name: Solver.pythonValue(v) for v in q.variables().elements()})
+        return solutions
+
+    def assertMatchesQuery(self, program, queries):
+        for query in queries:
+            expected = self.queried(self.plain, query)
+            self.assertEqual(list(LogikusFacade.solve(query, program)), expected)
+            self.assertEqual(self.queried(program, query), expected)
+
+    def testFormats(self):
+        queries = ["city(N, 5, P)", "city(c42, A, P)", "city(N, A, P), >(P, 700)"]
+        csv = self.path("c.csv", "name,alt,pop\n" + "".join(f"{n},{a},{p}\n" for n, a, p in LoadFactsTest.rows))
+        tsv = self.path("c.tsv", "".join(f"{n}\t{a}\t{p}\n" for n, a, p in LoadFactsTest.rows))
+        jsonl = self.path("c.jsonl", "".join(json.dumps({"name": n, "alt": a, "pop": p}) + "\n"
+            for n, a, p in LoadFactsTest.rows))
+        for path, header in [(csv, True), (tsv, False), (jsonl, True)]:
+            program = Program()
+            self.assertEqual(program.loadFacts(path, "city", header=header), len(LoadFactsTest.rows))
+            self.assertMatchesQuery(program, queries)
+        program = Program()
+        program.addPredicate(FactTable("city", 3))
+        program.loadFacts(csv, "city")
+        self.assertMatchesQuery(program, queries)
+
+    def testColumns(self):
+        path = self.path("c.csv", "pop,name,alt\n" + "".join(f"{p},{n},{a}\n" for n, a, p in LoadFactsTest.rows))
+        program = Program()
+        program.loadFacts(path, "city", ["name", "alt", "pop"])
+        self.assertMatchesQuery(program, ["city(N, 7, P)", "city(c9, A, P)"])
+        with self.assertRaises(Exception):
+            Program().loadFacts(path, "city", ["name", "height"])
+
+    def testValues(self):
+        path = self.path("v.csv", "v\n7\n-3\n2.5\n.5\nnan\ninf\n1_000\n 7 \n1e3\n")
+        program = Program()
+        program.loadFacts(path, "v")
+        self.assertEqual([s["V"] for s in LogikusFacade.solve("v(V)", program)],
+            [7, -3, 2.5, 0.5, "nan", "inf", "1_000", " 7 ", "1e3"])
+
+if __name__ == "__main__":
+    unittest.main()
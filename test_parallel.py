@@ -0,0 +1,56 @@
+# Tests of parallel solving over predicates that store their own facts.
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from engine import *
+from facttable import FactTable
+from external import SqlitePredicate
+from parallel import ParallelEngine
+
+class ParallelColumnarTest(unittest.TestCase):
+    def sequential(self, program, query):
+        from parser import LogikusFacade
+        return list(LogikusFacade.solve(query, program))
+
+    def assertParallelMatches(self, program, query, expected):
+        self.assertEqual(self.sequential(program, query), expected)
+        with ParallelEngine(program, workers=2) as engine:
+            self.assertEqual(list(engine.solve(query)), expected)
+            unordered = list(engine.solve(query, ordered=False))
+        self.assertCountEqual(unordered, expected)
+
+    def testFactTable(self):
+        table = FactTable("n", 1)
+        table.addRows([(i * 7 % 50,) for i in range(50)])
+        program = Program()
+        program.addPredicate(table)
+        expected = [{"X": i * 7 % 50} for i in range(50)]
+        self.assertParallelMatches(program, "n(X)", expected)
+
+    def testFactTableOrder(self):
+        table = FactTable("p", 2)
+        table.addRows([("d", 1), ("a", 2), ("c", 3), ("b", 4)])
+        program = Program()
+        program.addPredicate(table)
+        expected = [{"N": n, "V": v} for n, v in [("d", 1), ("a", 2), ("c", 3), ("b", 4)]]
+        self.assertParallelMatches(program, "p(N, V)", expected)
+
+    def testSqlitePredicate(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        database = os.path.join(directory, "n.db")
+        c = sqlite3.connect(database)
+        c.execute("CREATE TABLE n (x INTEGER)")
+        c.executemany("INSERT INTO n VALUES (?)", [(i * 3 % 20,) for i in range(20)])
+        c.commit()
+        c.close()
+        program = Program()
+        program.addPredicate(SqlitePredicate("n", database, "n"))
+        expected = [{"X": i * 3 % 20} for i in range(20)]
+        self.assertParallelMatches(program, "n(X)", expected)
+
+if __name__ == "__main__":
+    unittest.main()
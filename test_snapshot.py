@@ -0,0 +1,81 @@
+# Tests of program snapshots against plain resolution over the program
+# they were saved from.
+import os
+import pickle
+import tempfile
+import unittest
+
+from engine import *
+from facttable import FactTable
+from parser import LogikusFacade, LogikusParser
+
+class Evil:
+    def __reduce__(self):
+        return (os.system, ("true",))
+
+class SnapshotTest(unittest.TestCase):
+    source = "".join(f"e({i}, {i + 1});" for i in range(200)) + """
+        t(X, Y) :- e(X, Y);
+        t(X, Y) :- e(X, Z), t(Z, Y);
+        app([], L, L);
+        app([H|T], L, [H|R]) :- app(T, L, R);
+        max(X, Y, X) :- >=(X, Y), !;
+        max(X, Y, Y);
+        table tt/2;
+        tt(X, Y) :- tt(X, Z), e(Z, Y);
+        tt(X, Y) :- e(X, Y);
+    """
+    queries = ["t(190, Y)", "app(X, Y, [1, 2, 3])", "max(3, 8, M)", "tt(150, Y)", "c(a, N), >(N, 990)",
+        "c(b, 5)", "e(X, 7)"]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "p.snap")
+        self.program = LogikusFacade.program(SnapshotTest.source)
+        table = FactTable("c", 2)
+        table.addRows([("a" if i % 2 == 0 else "b", i) for i in range(1000)])
+        self.program.addPredicate(table)
+
+    def queried(self, program, query):
+        q = Query(program, LogikusFacade.parse(query, LogikusParser.shared().queryParser, "query"))
+        solutions = []
+        while q.canFindNextProof():
+            solutions.append({v.name: Solver.pythonValue(v) for v in q.variables().elements()})
+        return solutions
+
+    def testRoundTrip(self):
+        list(LogikusFacade.solve("tt(150, Y)", self.program))
+        self.program.saveSnapshot(self.path, SnapshotTest.source)
+        loaded = Program.loadSnapshot(self.path, SnapshotTest.source)
+        self.assertEqual(loaded.tableStatistics()["complete"], self.program.tableStatistics()["complete"])
+        for query in SnapshotTest.queries:
+            expected = self.queried(self.program, query)
+            self.assertEqual(list(LogikusFacade.solve(query, loaded)),
+                list(LogikusFacade.solve(query, self.program)))
+            self.assertEqual(self.queried(loaded, query), expected)
+
+    def testAddAfterLoad(self):
+        self.program.saveSnapshot(self.path)
+        loaded = Program.loadSnapshot(self.path)
+        loaded.predicate("c", 2).addRow(("a", 1000))
+        loaded.addAxiom(LogikusFacade.axiom("e(200, 201);"))
+        self.assertEqual(list(LogikusFacade.solve("c(a, N), >(N, 998)", loaded)), [{"N": 1000}])
+        self.assertEqual(len(list(LogikusFacade.solve("t(195, Y)", loaded))), 6)
+        self.assertEqual(len(list(LogikusFacade.solve("t(195, Y)", self.program))), 5)
+
+    def testRejects(self):
+        self.program.saveSnapshot(self.path, SnapshotTest.source)
+        with self.assertRaises(Exception):
+            Program.loadSnapshot(self.path, SnapshotTest.source + " ")
+        data = pickle.dumps(Evil())
+        data += bytes(-(Program.snapshotHeader.size + len(data)) % 8)
+        with open(self.path, "wb") as f:
+            f.write(Program.snapshotHeader.pack(Program.snapshotMagic, Program.snapshotVersion,
+                Program.sourceHash(None), Program.snapshotHeader.size + len(data)))
+            f.write(data)
+        with self.assertRaises(pickle.UnpicklingError):
+            Program.loadSnapshot(self.path)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+# Tests of the explicit-stack solver against plain resolution.
+import unittest
+
+from engine import *
+from parser import LogikusFacade, LogikusParser
+
+class SolverTest(unittest.TestCase):
+    def queried(self, program, query):
+        q = Query(program, LogikusFacade.parse(query, LogikusParser.shared().queryParser, "query"))
+        solutions = []
+        while q.canFindNextProof():
+            solutions.append({v.name: Solver.pythonValue(v) for v in q.variables().elements()})
+        return solutions
+
+    def solved(self, program, query):
+        return list(LogikusFacade.solve(query, program))
+
+    def assertMatchesQuery(self, program, query, expected):
+        self.assertEqual(self.queried(program, query), expected)
+        self.assertEqual(self.solved(program, query), expected)
+
+class CutTest(SolverTest):
+    source = """
+        max(X, Y, X) :- >=(X, Y), !;
+        max(X, Y, Y);
+        member(X, [X|T]);
+        member(X, [H|T]) :- member(X, T);
+        first(X, L) :- member(X, L), !;
+        t(a); t(b); t(c);
+        u(X, Y) :- t(X), !, t(Y);
+        u(z, z);
+        v(X) :- once(member(X, [p, q, r]));
+        v(s);
+        neg(X) :- t(X), !, =(X, b);
+        neg(zz);
+        count(0) :- !;
+        count(N) :- #(M, N - 1), count(M);
+    """
+
+    def setUp(self):
+        self.program = LogikusFacade.program(CutTest.source)
+
+    def testCut(self):
+        self.assertMatchesQuery(self.program, "max(7, 5, M)", [{"M": 7}])
+        self.assertMatchesQuery(self.program, "max(3, 5, M)", [{"M": 5}])
+        self.assertMatchesQuery(self.program, "first(X, [c, a, b])", [{"X": "c"}])
+        self.assertMatchesQuery(self.program, "u(X, Y)", [{"X": "a", "Y": y} for y in "abc"])
+        self.assertMatchesQuery(self.program, "neg(X)", [])
+        self.assertMatchesQuery(self.program, "t(X), !", [{"X": "a"}])
+
+    def testOnce(self):
+        self.assertMatchesQuery(self.program, "v(X)", [{"X": "p"}, {"X": "s"}])
+        self.assertMatchesQuery(self.program, "once(t(X)), t(Y)", [{"X": "a", "Y": y} for y in "abc"])
+        self.assertMatchesQuery(self.program, "member(X, [1, 2]), once(t(Y))",
+            [{"X": 1, "Y": "a"}, {"X": 2, "Y": "a"}])
+
+    def testCutFreesChoicepoints(self):
+        solver = Solver(self.program, Structure("count", [Atom(100000)]))
+        self.assertTrue(solver.canFindNextProof())
+        self.assertEqual(len(solver._choicepoints), 0)
+        self.assertFalse(solver.canFindNextProof())
+
+class HashJoinTest(SolverTest):
+    def setUp(self):
+        source = "".join(f"r({i}, {i % 10});" for i in range(200))
+        source += "".join(f"s({i % 10}, {i});" for i in range(200))
+        self.program = LogikusFacade.program(source)
+
+    def join(self, query):
+        solver = Solver(self.program, LogikusFacade.parse(query, LogikusParser.shared().queryParser, "query"))
+        rest = None
+        for s in reversed(solver.structures[1:]):
+            rest = (s, 0, rest)
+        return HashJoin.gather(self.program, solver.structures[0], rest)
+
+    def testJoin(self):
+        query = "r(X, Y), s(Y, Z)"
+        self.assertNotEqual(self.join(query), None)
+        expected = self.queried(self.program, query)
+        self.assertEqual(len(expected), 4000)
+        self.assertEqual(self.solved(self.program, query), expected)
+
+    def testJoinWithComparison(self):
+        query = "r(X, Y), s(Y, Z), >(Z, 190)"
+        expected = self.queried(self.program, query)
+        self.assertEqual(len(expected), 180)
+        self.assertEqual(self.solved(self.program, query), expected)
+
+    def testNotWorthwhile(self):
+        query = "r(7, Y), s(Y, Z)"
+        self.assertEqual(self.join(query), None)
+        self.assertEqual(self.solved(self.program, query), self.queried(self.program, query))
+
+if __name__ == "__main__":
+    unittest.main()
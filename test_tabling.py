@@ -0,0 +1,69 @@
+# Tests of tabled evaluation against plain resolution.
+import unittest
+
+from engine import *
+from parser import LogikusFacade, LogikusParser
+
+class TablingTest(unittest.TestCase):
+    def queried(self, program, query):
+        q = Query(program, LogikusFacade.parse(query, LogikusParser.shared().queryParser, "query"))
+        solutions = []
+        while q.canFindNextProof():
+            solutions.append({v.name: Solver.pythonValue(v) for v in q.variables().elements()})
+        return solutions
+
+    def distinct(self, solutions):
+        return [dict(s) for s in dict.fromkeys(tuple(sorted(s.items())) for s in solutions)]
+
+    def solved(self, program, query):
+        return list(LogikusFacade.solve(query, program))
+
+    def testMatchesQuery(self):
+        source = """
+            edge(a, b); edge(a, c); edge(b, d); edge(c, d); edge(d, e);
+            path(X, Y) :- edge(X, Y);
+            path(X, Y) :- edge(X, Z), path(Z, Y);
+        """
+        plain = LogikusFacade.program(source)
+        tabled = LogikusFacade.program("table path/2;" + source)
+        for query in ["path(a, Y)", "path(X, e)", "path(X, Y)"]:
+            expected = self.distinct(self.queried(plain, query))
+            self.assertCountEqual(self.solved(tabled, query), expected)
+            self.assertCountEqual(self.queried(tabled, query), expected)
+
+    def testLeftRecursionOnCycle(self):
+        program = LogikusFacade.program("""
+            table path/2;
+            edge(a, b); edge(b, c); edge(c, a); edge(c, d);
+            path(X, Y) :- path(X, Z), edge(Z, Y);
+            path(X, Y) :- edge(X, Y);
+        """)
+        self.assertCountEqual(self.solved(program, "path(a, Y)"),
+            [{"Y": y} for y in "abcd"])
+        self.assertTrue(all(t.complete for t in program.tables()))
+
+    def testDeepRightRecursion(self):
+        n = 300
+        source = "table path/2;" + "".join(f"edge({i}, {i + 1});" for i in range(n))
+        program = LogikusFacade.program(source + """
+            path(X, Y) :- edge(X, Y);
+            path(X, Y) :- edge(X, Z), path(Z, Y);
+        """)
+        expected = [{"Y": i} for i in range(1, n + 1)]
+        self.assertCountEqual(self.solved(program, "path(0, Y)"), expected)
+        self.assertCountEqual(self.queried(program, "path(0, Y)"), expected)
+        self.assertEqual(len(program.tables()), n + 1)
+
+    def testDeepFibonacci(self):
+        program = LogikusFacade.program("""
+            table fib/2;
+            fib(0, 0); fib(1, 1);
+            fib(N, F) :- >(N, 1), #(N1, N - 1), #(N2, N - 2), fib(N1, F1), fib(N2, F2), #(F, F1 + F2);
+        """)
+        a, b = 0, 1
+        for i in range(150):
+            a, b = b, a + b
+        self.assertEqual(self.solved(program, "fib(150, F)"), [{"F": a}])
+
+if __name__ == "__main__":
+    unittest.main()